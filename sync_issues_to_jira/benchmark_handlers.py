@@ -0,0 +1,528 @@
+#!/usr/bin/env python3
+#
+# Copyright 2024 Espressif Systems (Shanghai) PTE LTD
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""
+Benchmark the event handlers against local stand-ins for the JIRA and GitHub REST APIs.
+
+Replays recorded events (a JSONL file, one {"event_name": ..., "event": {...}} object per line, as for the
+events_file input) through sync_to_jira.main(), one action run per event. The stand-in servers answer the
+JIRA and GitHub REST requests the sync makes, after a configurable latency, and keep the issues, comments and
+remote links they are sent, so later events find what earlier ones created.
+
+Reports the JIRA and GitHub requests made, and the median and 95th percentile wall time of each handler.
+Fails (exit status 1) if a handler makes more requests than recorded in the baseline file.
+
+Usage: python benchmark_handlers.py [--jira-latency MS] [--github-latency MS] [--update-baseline]
+"""
+import argparse
+import collections
+import contextlib
+import http.server
+import io
+import json
+import os
+import re
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+import warnings
+
+DEFAULT_EVENTS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmark_events.jsonl')
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmark_baseline.json')
+REPOSITORY = 'espressif/fake'
+JIRA_PROJECT = 'BENCH'
+COLLABORATORS = {'espressif-bot'}
+
+
+class StandInServer(http.server.ThreadingHTTPServer):
+    """
+    HTTP server answering REST requests with route handlers, after a fixed latency. Counts the requests it answers.
+    """
+    daemon_threads = True
+
+    def __init__(self, latency):
+        super().__init__(('127.0.0.1', 0), _StandInRequestHandler)
+        self.latency = latency
+        self.url = 'http://127.0.0.1:%d' % self.server_address[1]
+        self.requests = collections.Counter()  # 'METHOD route' -> count
+        self.lock = threading.Lock()
+        self.routes = []  # (method, compiled path regex, route name, handler(match, query, body))
+
+    def route(self, method, pattern, handler):
+        self.routes.append((method, re.compile(pattern + '$'), '%s %s' % (method, pattern), handler))
+
+    def handle_rest(self, method, path, query, body):
+        """
+        Return (status, JSON response) for a request.
+        """
+        for route_method, regex, name, handler in self.routes:
+            match = regex.match(path)
+            if route_method == method and match:
+                with self.lock:
+                    self.requests[name] += 1
+                    return handler(match, query, body)
+        with self.lock:
+            self.requests['%s (unknown) %s' % (method, path)] += 1
+        return 404, {'message': 'Not Found', 'errorMessages': ['No stand-in for %s %s' % (method, path)]}
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+class _StandInRequestHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # keep-alive, like the real servers
+    disable_nagle_algorithm = True  # headers and body are written separately
+
+    def _handle(self):
+        url = urllib.parse.urlsplit(self.path)
+        length = int(self.headers.get('Content-Length') or 0)
+        body = json.loads(self.rfile.read(length) or b'null') if length else None
+        time.sleep(self.server.latency)
+        status, response = self.server.handle_rest(self.command, url.path, urllib.parse.parse_qs(url.query), body)
+        data = b'' if response is None else json.dumps(response).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.send_header('X-RateLimit-Limit', '5000')
+        self.send_header('X-RateLimit-Remaining', '4999')
+        self.send_header('X-RateLimit-Reset', str(int(time.time()) + 3600))
+        self.end_headers()
+        self.wfile.write(data)
+
+    do_GET = do_POST = do_PUT = do_PATCH = do_DELETE = _handle
+
+    def log_message(self, format, *args):
+        pass
+
+
+class JiraStandIn(StandInServer):
+    """
+    The parts of the JIRA REST API (v2) used by the sync, with issues kept in memory.
+    """
+
+    def __init__(self, latency):
+        super().__init__(latency)
+        self.issues = collections.OrderedDict()  # key -> issue
+        self.project_properties = {}
+        self.next_id = 10000
+        api = '/rest/api/2'
+        self.route('GET', api + '/serverInfo', lambda m, q, b: (200, {
+            'baseUrl': self.url, 'version': '9.4.0', 'versionNumbers': [9, 4, 0], 'deploymentType': 'Server'}))
+        self.route('GET', api + '/field', lambda m, q, b: (200, [
+            {'id': field_id, 'name': name, 'custom': field_id.startswith('customfield_')} for field_id, name in [
+                ('summary', 'Summary'), ('description', 'Description'), ('labels', 'Labels'),
+                ('components', 'Component/s'), ('customfield_12100', 'GitHub Issue')]]))
+        self.route('GET', api + '/issuetype', lambda m, q, b: (200, [
+            {'id': str(i), 'name': name, 'self': '%s%s/issuetype/%d' % (self.url, api, i)}
+            for i, name in enumerate(['Bug', 'Task', 'New Feature'], start=1)]))
+        self.route('GET', api + '/project/(?P<project>[^/]+)', lambda m, q, b: (200, self._project()))
+        self.route('GET', api + '/project/(?P<project>[^/]+)/components', lambda m, q, b: (200, []))
+        self.route('GET', api + '/project/(?P<project>[^/]+)/properties/(?P<name>[^/]+)', self._get_project_property)
+        self.route('PUT', api + '/project/(?P<project>[^/]+)/properties/(?P<name>[^/]+)', self._set_project_property)
+        self.route('DELETE', api + '/project/(?P<project>[^/]+)/properties/(?P<name>[^/]+)',
+                   lambda m, q, b: (204 if self.project_properties.pop(m.group('name'), None) is not None else 404, None))
+        self.route('GET', api + '/search', self._search)
+        self.route('POST', api + '/search', lambda m, q, b: self._search(m, {k: [v] for k, v in b.items()}, None))
+        self.route('POST', api + '/issue', self._create_issue)
+        self.route('GET', api + '/issue/(?P<issue>[^/]+)', self._get_issue)
+        self.route('PUT', api + '/issue/(?P<issue>[^/]+)', self._update_issue)
+        self.route('GET', api + '/issue/(?P<issue>[^/]+)/remotelink', self._get_remote_links)
+        self.route('POST', api + '/issue/(?P<issue>[^/]+)/remotelink', self._add_remote_link)
+        self.route('GET', api + '/issue/(?P<issue>[^/]+)/remotelink/(?P<id>\\d+)', self._get_remote_link)
+        self.route('PUT', api + '/issue/(?P<issue>[^/]+)/remotelink/(?P<id>\\d+)', self._update_remote_link)
+        self.route('GET', api + '/issue/(?P<issue>[^/]+)/comment', self._get_comments)
+        self.route('POST', api + '/issue/(?P<issue>[^/]+)/comment', self._add_comment)
+        self.route('GET', api + '/issue/(?P<issue>[^/]+)/comment/(?P<id>\\d+)', self._get_comment)
+        self.route('PUT', api + '/issue/(?P<issue>[^/]+)/comment/(?P<id>\\d+)', self._update_comment)
+        self.route('GET', api + '/issue/(?P<issue>[^/]+)/properties/(?P<name>[^/]+)', self._get_property)
+        self.route('PUT', api + '/issue/(?P<issue>[^/]+)/properties/(?P<name>[^/]+)', self._set_property)
+
+    def _new_id(self):
+        self.next_id += 1
+        return str(self.next_id)
+
+    def _project(self):
+        return {'id': '10000', 'key': JIRA_PROJECT, 'name': 'Benchmark', 'self': '%s/rest/api/2/project/10000' % self.url}
+
+    def _find(self, key_or_id):
+        for issue in self.issues.values():
+            if key_or_id in (issue['key'], issue['id']):
+                return issue
+        return None
+
+    def _issue_json(self, issue, properties=None):
+        result = {'id': issue['id'], 'key': issue['key'], 'self': '%s/rest/api/2/issue/%s' % (self.url, issue['id']),
+                  'fields': issue['fields']}
+        if properties:
+            result['properties'] = {name: issue['properties'][name] for name in properties if name in issue['properties']}
+        return result
+
+    def _not_found(self):
+        return 404, {'errorMessages': ['Issue Does Not Exist'], 'errors': {}}
+
+    def _search(self, match, query, body):
+        jql = query['jql'][0]
+        urls = re.findall(r'"([^"]+)"', jql.split('issuesWithRemoteLinksByGlobalId', 1)[-1])
+        found = [issue for issue in self.issues.values() if any(link['globalId'] in urls for link in issue['remotelinks'])]
+        properties = query.get('properties', [''])[0].split(',') if 'properties' in query else None
+        start = int(query.get('startAt', ['0'])[0])
+        max_results = int(query.get('maxResults', ['50'])[0])
+        page = found[start:start + max_results]
+        return 200, {'startAt': start, 'maxResults': max_results, 'total': len(found),
+                     'issues': [self._issue_json(issue, properties) for issue in page]}
+
+    def _create_issue(self, match, query, body):
+        fields = dict(body['fields'])
+        issue_id = self._new_id()
+        key = '%s-%d' % (JIRA_PROJECT, len(self.issues) + 1)
+        fields.update({'project': self._project(), 'components': fields.get('components', []),
+                       'status': {'name': 'Open'}, 'labels': fields.get('labels', [])})
+        self.issues[key] = {'id': issue_id, 'key': key, 'fields': fields, 'remotelinks': [], 'comments': [], 'properties': {}}
+        return 201, {'id': issue_id, 'key': key, 'self': '%s/rest/api/2/issue/%s' % (self.url, issue_id)}
+
+    def _get_issue(self, match, query, body):
+        issue = self._find(match.group('issue'))
+        if issue is None:
+            return self._not_found()
+        properties = query['properties'][0].split(',') if 'properties' in query else None
+        return 200, self._issue_json(issue, properties)
+
+    def _update_issue(self, match, query, body):
+        issue = self._find(match.group('issue'))
+        if issue is None:
+            return self._not_found()
+        issue['fields'].update(body.get('fields', {}))
+        for field, operations in body.get('update', {}).items():
+            for operation in operations:
+                values = issue['fields'].setdefault(field, [])
+                if 'add' in operation and operation['add'] not in values:
+                    values.append(operation['add'])
+                if 'remove' in operation and operation['remove'] in values:
+                    values.remove(operation['remove'])
+        return 204, None
+
+    def _link_json(self, issue, link):
+        return dict(link, self='%s/rest/api/2/issue/%s/remotelink/%s' % (self.url, issue['id'], link['id']))
+
+    def _get_remote_links(self, match, query, body):
+        issue = self._find(match.group('issue'))
+        if issue is None:
+            return self._not_found()
+        return 200, [self._link_json(issue, link) for link in issue['remotelinks']]
+
+    def _add_remote_link(self, match, query, body):
+        issue = self._find(match.group('issue'))
+        if issue is None:
+            return self._not_found()
+        for link in issue['remotelinks']:
+            if link['globalId'] == body.get('globalId'):
+                link.update(body)
+                return 200, {'id': int(link['id']), 'self': self._link_json(issue, link)['self']}
+        link = dict(body, id=self._new_id())
+        issue['remotelinks'].append(link)
+        return 201, {'id': int(link['id']), 'self': self._link_json(issue, link)['self']}
+
+    def _get_remote_link(self, match, query, body):
+        issue = self._find(match.group('issue'))
+        for link in issue['remotelinks'] if issue else []:
+            if link['id'] == match.group('id'):
+                return 200, self._link_json(issue, link)
+        return self._not_found()
+
+    def _update_remote_link(self, match, query, body):
+        issue = self._find(match.group('issue'))
+        for link in issue['remotelinks'] if issue else []:
+            if link['id'] == match.group('id'):
+                link.update(body)
+                return 204, None
+        return self._not_found()
+
+    def _comment_json(self, issue, comment):
+        return dict(comment, self='%s/rest/api/2/issue/%s/comment/%s' % (self.url, issue['id'], comment['id']))
+
+    def _get_comments(self, match, query, body):
+        issue = self._find(match.group('issue'))
+        if issue is None:
+            return self._not_found()
+        comments = [self._comment_json(issue, c) for c in issue['comments']]
+        return 200, {'startAt': 0, 'maxResults': len(comments), 'total': len(comments), 'comments': comments}
+
+    def _add_comment(self, match, query, body):
+        issue = self._find(match.group('issue'))
+        if issue is None:
+            return self._not_found()
+        comment = {'id': self._new_id(), 'body': body['body']}
+        issue['comments'].append(comment)
+        return 201, self._comment_json(issue, comment)
+
+    def _get_comment(self, match, query, body):
+        issue = self._find(match.group('issue'))
+        for comment in issue['comments'] if issue else []:
+            if comment['id'] == match.group('id'):
+                return 200, self._comment_json(issue, comment)
+        return self._not_found()
+
+    def _update_comment(self, match, query, body):
+        issue = self._find(match.group('issue'))
+        for comment in issue['comments'] if issue else []:
+            if comment['id'] == match.group('id'):
+                comment.update(body)
+                return 200, self._comment_json(issue, comment)
+        return self._not_found()
+
+    def _get_property(self, match, query, body):
+        issue = self._find(match.group('issue'))
+        if issue is None or match.group('name') not in issue['properties']:
+            return 404, {'errorMessages': ['Property not found'], 'errors': {}}
+        return 200, {'key': match.group('name'), 'value': issue['properties'][match.group('name')]}
+
+    def _get_project_property(self, match, query, body):
+        if match.group('name') not in self.project_properties:
+            return 404, {'errorMessages': ['Property not found'], 'errors': {}}
+        return 200, {'key': match.group('name'), 'value': self.project_properties[match.group('name')]}
+
+    def _set_project_property(self, match, query, body):
+        created = match.group('name') not in self.project_properties
+        self.project_properties[match.group('name')] = body
+        return (201 if created else 200), None
+
+    def _set_property(self, match, query, body):
+        issue = self._find(match.group('issue'))
+        if issue is None:
+            return self._not_found()
+        created = match.group('name') not in issue['properties']
+        issue['properties'][match.group('name')] = body
+        return (201 if created else 200), None
+
+
+class GitHubStandIn(StandInServer):
+    """
+    The parts of the GitHub REST API used by the sync, for a single repository with the given issues.
+    """
+
+    def __init__(self, latency, issues):
+        super().__init__(latency)
+        self.issues = {issue['number']: dict(issue) for issue in issues}
+        self.comments = collections.defaultdict(list)  # issue number -> comments
+        repo = '/repos/%s' % REPOSITORY
+        self.route('GET', repo, lambda m, q, b: (200, {
+            'id': 1, 'name': REPOSITORY.split('/')[1], 'full_name': REPOSITORY, 'url': self.url + repo,
+            'html_url': 'https://github.com/%s' % REPOSITORY}))
+        self.route('GET', repo + '/issues', self._list_issues)
+        self.route('GET', repo + '/issues/(?P<number>\\d+)', self._get_issue)
+        self.route('PATCH', repo + '/issues/(?P<number>\\d+)', self._edit_issue)
+        self.route('GET', repo + '/issues/(?P<number>\\d+)/comments', self._list_comments)
+        self.route('GET', repo + '/collaborators/(?P<user>[^/]+)',
+                   lambda m, q, b: (204, None) if m.group('user') in COLLABORATORS else (404, {'message': 'Not Found'}))
+
+    def _issue_json(self, issue):
+        return dict(issue, url='%s/repos/%s/issues/%d' % (self.url, REPOSITORY, issue['number']))
+
+    def _list_issues(self, match, query, body):
+        page = int(query.get('page', ['1'])[0])
+        per_page = int(query.get('per_page', ['30'])[0])
+        issues = [issue for issue in self.issues.values() if issue.get('updated_at', '') >= query.get('since', [''])[0]]
+        if query.get('sort') == ['updated']:
+            issues.sort(key=lambda issue: issue['updated_at'], reverse=query.get('direction') != ['asc'])
+        else:
+            issues.sort(key=lambda issue: issue['number'], reverse=query.get('direction') != ['asc'])
+        return 200, [self._issue_json(issue) for issue in issues[(page - 1) * per_page:page * per_page]]
+
+    def _get_issue(self, match, query, body):
+        issue = self.issues.get(int(match.group('number')))
+        if issue is None:
+            return 404, {'message': 'Not Found'}
+        return 200, self._issue_json(issue)
+
+    def _list_comments(self, match, query, body):
+        page = int(query.get('page', ['1'])[0])
+        per_page = int(query.get('per_page', ['30'])[0])
+        return 200, self.comments[int(match.group('number'))][(page - 1) * per_page:page * per_page]
+
+    def _edit_issue(self, match, query, body):
+        issue = self.issues.get(int(match.group('number')))
+        if issue is None:
+            return 404, {'message': 'Not Found'}
+        issue.update(body)
+        return 200, self._issue_json(issue)
+
+
+def read_events(path):
+    with open(path, 'r') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def get_handler_name(event_name, event):
+    if event_name == 'workflow_dispatch':
+        return 'workflow_dispatch.%s' % event.get('inputs', {}).get('action')
+    return '%s.%s' % (event_name, event.get('action'))
+
+
+def get_github_issues(events):
+    """
+    Return the GitHub issues and PRs the events are about, as last seen in the events (the GitHub stand-in's data).
+    """
+    issues = {}
+    for entry in events:
+        gh_issue = entry['event'].get('pull_request') or entry['event'].get('issue')
+        if gh_issue:
+            issues[gh_issue['number']] = gh_issue
+    return list(issues.values())
+
+
+def run_benchmark(events, jira_latency, github_latency):
+    """
+    Replay the events through sync_to_jira.main(), one action run each. Returns a dict of handler name ->
+    {'runs': [wall time of each run], 'jira': requests, 'github': requests}, and the requests made to each
+    route of the stand-ins ('jira'/'github' -> Counter).
+    """
+    import sync_github
+    import sync_issue
+    import sync_jira
+    import sync_state
+    with contextlib.redirect_stderr(io.StringIO()):  # deprecation warning
+        import sync_to_jira
+
+    jira_server = JiraStandIn(jira_latency).start()
+    github_server = GitHubStandIn(github_latency, get_github_issues(events)).start()
+    results = collections.OrderedDict()
+    env = {
+        'GITHUB_API_URL': github_server.url,
+        'GITHUB_TOKEN': 'benchmark',
+        'GITHUB_REPOSITORY': REPOSITORY,
+        'JIRA_URL': jira_server.url,
+        'JIRA_USER': 'benchmark',
+        'JIRA_PASS': 'benchmark',
+        'JIRA_PROJECT': JIRA_PROJECT,
+    }
+    saved_env = {name: os.environ.get(name) for name in list(env) + ['JIRA_SYNC_STATE_DIR', 'JIRA_COMPONENT']}
+    os.environ.update(env)
+    os.environ.pop('JIRA_SYNC_STATE_DIR', None)  # each run starts without any state, like a new action container
+    os.environ.pop('JIRA_COMPONENT', None)
+    warnings.simplefilter('ignore', DeprecationWarning)
+    try:
+        for entry in events:
+            event_name, event = entry['event_name'], entry['event']
+            with tempfile.NamedTemporaryFile('w', suffix='.json', delete=False) as f:
+                json.dump(event, f)
+            os.environ['GITHUB_EVENT_NAME'] = event_name
+            os.environ['GITHUB_EVENT_PATH'] = f.name
+            # a new action run: no GitHub or JIRA client yet, empty state
+            sync_issue._github_repo = None
+            sync_github._limiter = None
+            sync_jira._limiter = None
+            sync_state.reset()
+            jira_before = sum(jira_server.requests.values())
+            github_before = sum(github_server.requests.values())
+            try:
+                with contextlib.redirect_stdout(io.StringIO()) as output:
+                    start = time.perf_counter()
+                    try:
+                        sync_to_jira.main()
+                    except Exception:
+                        sys.stdout.write(output.getvalue())
+                        raise
+                    elapsed = time.perf_counter() - start
+            finally:
+                os.unlink(f.name)
+            result = results.setdefault(get_handler_name(event_name, event), {'runs': [], 'jira': 0, 'github': 0})
+            result['runs'].append(elapsed)
+            result['jira'] += sum(jira_server.requests.values()) - jira_before
+            result['github'] += sum(github_server.requests.values()) - github_before
+    finally:
+        for name, value in saved_env.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+        jira_server.stop()
+        github_server.stop()
+    return results, {'jira': jira_server.requests, 'github': github_server.requests}
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def find_regressions(results, baseline):
+    """
+    Return a list of messages for handlers making more requests than in the baseline.
+    """
+    regressions = []
+    for handler, result in results.items():
+        for api in ('jira', 'github'):
+            expected = baseline.get(handler, {}).get(api)
+            if expected is not None and result[api] > expected:
+                regressions.append('%s: %d %s requests, baseline is %d' % (handler, result[api], api, expected))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--events', default=DEFAULT_EVENTS, help='JSONL file of events to replay')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help='JSON file of request counts per handler')
+    parser.add_argument('--jira-latency', type=float, default=100, help='latency of the JIRA stand-in, in ms')
+    parser.add_argument('--github-latency', type=float, default=50, help='latency of the GitHub stand-in, in ms')
+    parser.add_argument('--update-baseline', action='store_true', help='save the request counts as the new baseline')
+    args = parser.parse_args()
+
+    events = read_events(args.events)
+    start = time.perf_counter()
+    results, requests = run_benchmark(events, args.jira_latency / 1000, args.github_latency / 1000)
+    wall_time = time.perf_counter() - start
+
+    print('%-28s %6s %6s %6s %9s %9s' % ('Handler', 'Events', 'JIRA', 'GitHub', 'p50 ms', 'p95 ms'))
+    for handler, result in sorted(results.items()):
+        print('%-28s %6d %6d %6d %9.1f %9.1f' % (handler, len(result['runs']), result['jira'], result['github'],
+                                                 statistics.median(result['runs']) * 1000,
+                                                 percentile(result['runs'], 0.95) * 1000))
+    print('\n%d events in %.1fs: %d JIRA requests, %d GitHub requests' % (
+        len(events), wall_time, sum(requests['jira'].values()), sum(requests['github'].values())))
+    unknown = [route for api in requests.values() for route in api if '(unknown)' in route]
+    if unknown:
+        print('Requests without a stand-in: %s' % ', '.join(unknown))
+
+    counts = {handler: {'jira': result['jira'], 'github': result['github']} for handler, result in sorted(results.items())}
+    if args.update_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(counts, f, indent=2, sort_keys=True)
+            f.write('\n')
+        print('Baseline saved to %s' % args.baseline)
+        return
+
+    with open(args.baseline, 'r') as f:
+        baseline = json.load(f)
+    regressions = find_regressions(results, baseline)
+    for message in regressions:
+        print('REGRESSION: %s' % message)
+    fewer = [handler for handler, count in counts.items() if handler in baseline and count != baseline[handler]]
+    if fewer and not regressions:
+        print('Fewer requests than the baseline for %s, run with --update-baseline to lower it' % ', '.join(fewer))
+    if regressions:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
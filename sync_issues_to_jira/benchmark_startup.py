@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+#
+# Copyright 2024 Espressif Systems (Shanghai) PTE LTD
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""
+Measure the startup cost of the JIRA sync action.
+
+Reports the time taken to import each module in a fresh interpreter (with networking disabled, so
+an import which talks to GitHub or JIRA fails), and the time, number of GitHub calls and number of
+JIRA connections made by main() for an event which is skipped.
+
+Usage: python benchmark_startup.py [--repeat N]
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from unittest.mock import create_autospec
+
+MODULES = ['jira', 'github', 'sync_state', 'markdown2wiki', 'sync_issue', 'sync_to_jira']
+
+_IMPORT_SCRIPT = """
+import socket, sys, time
+def _no_network(*args, **kwargs):
+    raise RuntimeError('network access while importing')
+socket.socket.connect = _no_network
+start = time.perf_counter()
+import %s
+print(time.perf_counter() - start)
+"""
+
+
+def measure_import(module, repeat):
+    """
+    Return the import times of a module (including everything it imports), each in a new interpreter.
+    """
+    env = dict(os.environ)
+    env.pop('GITHUB_TOKEN', None)
+    env.pop('GITHUB_REPOSITORY', None)
+    times = []
+    for _ in range(repeat):
+        output = subprocess.check_output([sys.executable, '-c', _IMPORT_SCRIPT % module], env=env, stderr=subprocess.DEVNULL,
+                                         cwd=os.path.dirname(os.path.abspath(__file__)))
+        times.append(float(output))
+    return times
+
+
+def measure_skipped_event(repeat):
+    """
+    Return the times taken by main() to skip an unhandled event, the number of calls made to the GitHub client, and
+    the number of JIRA connections.
+    """
+    import github
+    import jira
+    import sync_issue
+    import sync_state
+    with contextlib.redirect_stderr(io.StringIO()):  # deprecation warning
+        import sync_to_jira
+
+    with tempfile.NamedTemporaryFile('w', suffix='.json', delete=False) as f:
+        json.dump({"action": "pinned", "issue": {"html_url": "https://github.com/espressif/fake/issues/1"}}, f)
+    os.environ.update({
+        'GITHUB_EVENT_NAME': 'issues',
+        'GITHUB_EVENT_PATH': f.name,
+        'GITHUB_TOKEN': 'benchmark',
+        'GITHUB_REPOSITORY': 'espressif/fake',
+        'JIRA_URL': 'https://jira.invalid/',
+        'JIRA_USER': 'benchmark',
+        'JIRA_PASS': 'benchmark',
+    })
+    times = []
+    github_calls = jira_connections = 0
+    try:
+        for _ in range(repeat):
+            github_class = create_autospec(github.Github)
+            sync_issue.Github = github_class
+            sync_issue._github_repo = None
+            jira_class = create_autospec(jira.JIRA)
+            sync_to_jira._JIRA = jira_class
+            sync_state.reset()
+            with contextlib.redirect_stdout(io.StringIO()):
+                start = time.perf_counter()
+                sync_to_jira.main()
+                times.append(time.perf_counter() - start)
+            github_calls = len(github_class.mock_calls)
+            jira_connections = jira_class.call_count
+    finally:
+        os.unlink(f.name)
+    return times, github_calls, jira_connections
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--repeat', type=int, default=5, help='number of measurements to take the median of')
+    args = parser.parse_args()
+
+    print('%-16s %10s' % ('Import', 'median ms'))
+    for module in MODULES:
+        print('%-16s %10.1f' % (module, statistics.median(measure_import(module, args.repeat)) * 1000))
+
+    times, github_calls, jira_connections = measure_skipped_event(args.repeat)
+    print('\nSkipped event: %.1f ms median, %d GitHub client calls, %d JIRA connections' % (
+        statistics.median(times) * 1000, github_calls, jira_connections))
+
+
+if __name__ == '__main__':
+    main()
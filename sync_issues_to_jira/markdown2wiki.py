@@ -0,0 +1,289 @@
+#!/usr/bin/env python3
+#
+# Copyright 2024 Espressif Systems (Shanghai) PTE LTD
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""
+In-process conversion of GitHub flavoured Markdown to JIRA wiki markup.
+
+Follows the rendering rules of https://github.com/Shogobg/markdown2confluence for the subset of
+Markdown found in GitHub issues and comments (headings, lists, code blocks, tables, links,
+emphasis and quotes), without having to spawn a Node.js process for every conversion.
+"""
+import re
+import sys
+
+# Increase whenever the generated markup changes (used to invalidate cached conversions)
+CONVERTER_VERSION = 2
+
+# Code blocks longer than this are collapsed in JIRA (same limit as markdown2confluence)
+MAX_CODE_LINES = 20
+
+# Quotes and lists nested deeper than this are converted as plain paragraphs (each level is a recursive call)
+MAX_NESTING_DEPTH = 16
+
+# Languages supported by the JIRA {code} macro
+_CODE_LANGUAGES = {lang: lang for lang in (
+    'actionscript3 bash csharp coldfusion cpp css delphi diff erlang groovy java javafx javascript '
+    'perl php none powershell python ruby scala sql vb html/xml html xml').split()}
+_CODE_LANGUAGES.update({
+    'shell': 'bash',
+    'sh': 'bash',
+    'c': 'cpp',
+    'c++': 'cpp',
+    'js': 'javascript',
+    'py': 'python',
+})
+
+_FENCE_RE = re.compile(r'^ {0,3}(`{3,}|~{3,})[ \t]*([^`\s]*)[^`]*$')
+_ATX_HEADING_RE = re.compile(r'^ {0,3}(#{1,6})(?:[ \t]+(.*?))?(?:[ \t]+#+)?[ \t]*$')
+_SETEXT_UNDERLINE_RE = re.compile(r'^ {0,3}(=+|-+)[ \t]*$')
+_HR_RE = re.compile(r'^ {0,3}([-*_])(?:[ \t]*\1){2,}[ \t]*$')
+_BLOCKQUOTE_RE = re.compile(r'^ {0,3}> ?(.*)$')
+_LIST_ITEM_RE = re.compile(r'^( {0,3})([*+-]|\d{1,9}[.)])(?:([ \t]+)(.*))?$')
+_TABLE_DELIMITER_RE = re.compile(r'^ {0,3}\|?[ \t]*:?-+:?[ \t]*(\|[ \t]*:?-+:?[ \t]*)*\|?[ \t]*$')
+_INDENTED_CODE_RE = re.compile(r'^(?: {4}|\t)')
+
+_CODE_SPAN_RE = re.compile(r'(?<!\\)(`+)(.+?)(?<!`)\1(?!`)', re.S)
+_ESCAPE_RE = re.compile(r'\\([\\`*_{}\[\]()#+\-.!|~>])')
+# The link patterns only match each run of characters one way (no brackets nested twice, no whitespace before an
+# empty URL which could also precede a title, no parentheses in titles), so unclosed links fail in linear time
+_LINK_TARGET = r'\(\s*(?:(?:<>|<?([^\s<>)][^\s>)]*)>?)(?:\s+["\'(][^"\'()]*["\')])?\s*)?\)'
+_IMAGE_RE = re.compile(r'!\[([^\[\]]*)\]' + _LINK_TARGET)
+_LINK_RE = re.compile(r'\[((?:[^\[\]]|\[[^\[\]]*\])*)\]' + _LINK_TARGET)
+_AUTOLINK_RE = re.compile(r'<((?:https?|ftp)://[^\s>]+|[^\s@<>]+@[^\s@<>]+\.[^\s@<>]+)>')
+_BARE_URL_RE = re.compile(r'(?<![\w/|\[=])((?:https?://|www\.)[^\s<\x00]*[^\s<\x00.,:;"\')\]!?*_~])')
+_STRONG_RE = re.compile(r'\*\*(?=\S)((?:[^*]|\*(?!\*))+?)(?<=\S)\*\*|(?<!\w)__(?=\S)((?:[^_]|_(?!_))+?)(?<=\S)__(?!\w)')
+_EM_RE = re.compile(r'(?<![*\w])\*(?=[^\s*])([^*]+?)(?<=[^\s*])\*(?!\*)|(?<![\w_])_(?=[^\s_])([^_]+?)(?<=[^\s_])_(?![\w_])')
+_DEL_RE = re.compile(r'~~(?=\S)((?:[^~]|~(?!~))+?)(?<=\S)~~')
+_PLACEHOLDER_RE = re.compile('\x00(\\d+)\x00')
+
+
+def convert(markdown):
+    """
+    Convert a Markdown document to JIRA wiki markup.
+    """
+    # NUL characters are used for placeholders (see _convert_inline()), and are replaced as in CommonMark
+    markdown = markdown.replace('\x00', '\ufffd')
+    lines = markdown.replace('\r\n', '\n').replace('\r', '\n').split('\n')
+    return _convert_blocks([line.expandtabs(4) for line in lines])
+
+
+def _convert_blocks(lines, depth=0):
+    if depth > MAX_NESTING_DEPTH:
+        paragraph = '\n'.join(line.strip() for line in lines if line.strip())
+        return _convert_inline(paragraph) + '\n\n' if paragraph else ''
+
+    out = []
+    i = 0
+    while i < len(lines):
+        line = lines[i]
+        if not line.strip():
+            i += 1
+            continue
+
+        m = _FENCE_RE.match(line)
+        if m:
+            fence = m.group(1)
+            closing = re.compile(r'^ {0,3}%s{%d,}[ \t]*$' % (re.escape(fence[0]), len(fence)))
+            body = []
+            i += 1
+            while i < len(lines) and not closing.match(lines[i]):
+                body.append(lines[i])
+                i += 1
+            i += 1  # skip the closing fence
+            out.append(_code_block(body, m.group(2)))
+            continue
+
+        if _INDENTED_CODE_RE.match(line):
+            body = []
+            while i < len(lines) and (_INDENTED_CODE_RE.match(lines[i]) or not lines[i].strip()):
+                body.append(lines[i][4:])
+                i += 1
+            while body and not body[-1].strip():
+                body.pop()
+            out.append(_code_block(body, None))
+            continue
+
+        m = _ATX_HEADING_RE.match(line)
+        if m:
+            out.append('h%d. %s\n\n' % (len(m.group(1)), _convert_inline(m.group(2) or '')))
+            i += 1
+            continue
+
+        if _HR_RE.match(line):
+            out.append('----\n\n')
+            i += 1
+            continue
+
+        if _BLOCKQUOTE_RE.match(line):
+            quoted = []
+            while i < len(lines) and lines[i].strip():
+                m = _BLOCKQUOTE_RE.match(lines[i])
+                quoted.append(m.group(1) if m else lines[i])  # lazy continuation line
+                i += 1
+            out.append('{quote}\n%s\n{quote}\n\n' % _convert_blocks(quoted, depth + 1).strip('\n'))
+            continue
+
+        if _LIST_ITEM_RE.match(line):
+            i = _convert_list(lines, i, out, depth)
+            continue
+
+        if '|' in line and i + 1 < len(lines) and '|' in lines[i + 1] and _TABLE_DELIMITER_RE.match(lines[i + 1]):
+            i = _convert_table(lines, i, out)
+            continue
+
+        # anything else is a paragraph, which ends at a blank line or at the start of another block
+        paragraph = [line.strip()]
+        i += 1
+        heading_level = 0
+        while i < len(lines) and lines[i].strip():
+            m = _SETEXT_UNDERLINE_RE.match(lines[i])
+            if m:
+                heading_level = 1 if m.group(1).startswith('=') else 2
+                i += 1
+                break
+            if _starts_block(lines[i]):
+                break
+            paragraph.append(lines[i].strip())
+            i += 1
+        text = _convert_inline('\n'.join(paragraph))
+        if heading_level:
+            out.append('h%d. %s\n\n' % (heading_level, text))
+        else:
+            out.append(text + '\n\n')
+
+    return ''.join(out)
+
+
+def _starts_block(line):
+    """
+    Return True if this line interrupts a paragraph.
+    """
+    m = _LIST_ITEM_RE.match(line)
+    if m and not m.group(2)[0].isdigit() and m.group(4):
+        return True
+    return any(r.match(line) for r in (_FENCE_RE, _ATX_HEADING_RE, _HR_RE, _BLOCKQUOTE_RE))
+
+
+def _code_block(body, lang):
+    if lang:
+        lang = _CODE_LANGUAGES.get(lang.lower(), '')
+    params = 'language=%s|borderStyle=solid|theme=RDark|linenumbers=true|collapse=%s' % (
+        lang or '', 'true' if len(body) > MAX_CODE_LINES else 'false')
+    return '{code:%s}\n%s\n{code}\n\n' % (params, '\n'.join(body))
+
+
+def _convert_list(lines, i, out, depth):
+    """
+    Convert the list starting at lines[i], appending the result to out. Returns the index of the first line after the list.
+
+    Like markdown2confluence, every line of an item's content gets the item marker, so nested lists come out as '**', '#*', etc.
+    """
+    first = _LIST_ITEM_RE.match(lines[i])
+    ordered = first.group(2)[0].isdigit()
+    items = []
+    content_indent = 0
+    while i < len(lines):
+        line = lines[i]
+        m = _LIST_ITEM_RE.match(line)
+        indent = len(line) - len(line.lstrip(' '))
+        if m and (not items or indent < content_indent):
+            if m.group(2)[0].isdigit() != ordered:
+                break  # a different type of list starts here
+            spacing = len(m.group(3) or ' ')
+            content_indent = len(m.group(1)) + len(m.group(2)) + (spacing if spacing <= 4 else 1)
+            items.append([m.group(4) or ''])
+        elif not line.strip():
+            items[-1].append('')
+        elif indent >= content_indent:
+            items[-1].append(line[content_indent:])
+        elif items[-1][-1].strip() and not _starts_block(line) and not m:
+            items[-1].append(line.strip())  # lazy paragraph continuation
+        else:
+            break
+        i += 1
+
+    marker = '#' if ordered else '*'
+    result = []
+    for item in items:
+        body = _convert_blocks(item, depth + 1)
+        result += [marker + line for line in body.split('\n') if line]
+    out.append('\n'.join(result) + '\n\n')
+    return i
+
+
+def _split_table_row(line):
+    line = line.strip()
+    if line.startswith('|'):
+        line = line[1:]
+    if line.endswith('|') and not line.endswith('\\|'):
+        line = line[:-1]
+    return [cell.strip() for cell in re.split(r'(?<!\\)\|', line)]
+
+
+def _convert_table(lines, i, out):
+    """
+    Convert the table starting at lines[i], appending the result to out. Returns the index of the first line after the table.
+    """
+    header = _split_table_row(lines[i])
+    rows = ['||%s||' % '||'.join(_convert_inline(cell) or ' ' for cell in header)]
+    i += 2  # skip header and delimiter rows
+    while i < len(lines) and lines[i].strip() and '|' in lines[i]:
+        cells = _split_table_row(lines[i])
+        cells = (cells + [''] * len(header))[:len(header)]
+        rows.append('|%s|' % '|'.join(_convert_inline(cell) or ' ' for cell in cells))
+        i += 1
+    out.append('\n'.join(rows) + '\n\n')
+    return i
+
+
+def _convert_inline(text):
+    """
+    Convert span-level Markdown (code, links, emphasis) in a block of text.
+    """
+    protected = []
+
+    def protect(value):
+        protected.append(value)
+        return '\x00%d\x00' % (len(protected) - 1)
+
+    text = _CODE_SPAN_RE.sub(lambda m: protect('{{%s}}' % m.group(2).strip()), text)
+    text = _ESCAPE_RE.sub(lambda m: protect(m.group(1)), text)
+    text = _IMAGE_RE.sub(lambda m: protect('!%s!' % (m.group(2) or '')), text)
+    text = _LINK_RE.sub(lambda m: protect(_link(m.group(2) or '', _convert_emphasis(m.group(1)))), text)
+    text = _AUTOLINK_RE.sub(lambda m: protect(_link(m.group(1), m.group(1))), text)
+    text = _BARE_URL_RE.sub(lambda m: protect(_link(m.group(1), m.group(1))), text)
+    text = _convert_emphasis(text)
+    text = re.sub(r'(?: {2,}|\\)\n', '\n', text)  # hard line breaks
+
+    while _PLACEHOLDER_RE.search(text):
+        text = _PLACEHOLDER_RE.sub(lambda m: protected[int(m.group(1))], text)
+    return text
+
+
+def _convert_emphasis(text):
+    # \x01 & \x02 stand in for the JIRA markers, so that '*strong*' isn't converted again as emphasis
+    text = _STRONG_RE.sub(lambda m: '\x01%s\x01' % (m.group(1) or m.group(2)), text)
+    text = _EM_RE.sub(lambda m: '\x02%s\x02' % (m.group(1) or m.group(2)), text)
+    text = _DEL_RE.sub(r'-\1-', text)
+    return text.replace('\x01', '*').replace('\x02', '_')
+
+
+def _link(href, text):
+    return '[%s]' % '|'.join([text, href] if text else [href])
+
+
+if __name__ == "__main__":
+    sys.stdout.write(convert(sys.stdin.read()))
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+#
+# Copyright 2024 Espressif Systems (Shanghai) PTE LTD
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""
+Apply a backlog of queued GitHub events to JIRA in one run.
+
+Events are read from a JSONL file, one {"event_name": ..., "event": {...}} object per line, in the
+order they happened. They are grouped by GitHub issue, and redundant events are merged before any of
+them is synced:
+
+- Only the last edit of an issue is applied (each 'edited' event carries the whole issue).
+- A label which is added and then removed again (or the other way around) is not synced at all.
+- Edits of a comment are merged into the event which created it, or into the last edit. A comment
+  which is created and deleted again is not synced at all.
+
+Each issue's remaining events are then applied in their original order, looking up the JIRA issue
+only once (see sync_issue.memoized_lookups).
+"""
+import collections
+import json
+
+import sync_issue
+
+
+def read_events(path):
+    """
+    Read a JSONL file of queued events. Returns a list of (event name, event) tuples.
+    """
+    events = []
+    with open(path, 'r') as f:
+        for line in f:
+            if line.strip():
+                entry = json.loads(line)
+                events.append((entry['event_name'], entry['event']))
+    return events
+
+
+def get_event_issue_url(event_name, event):
+    """
+    Return the URL of the GitHub issue or PR an event belongs to, or None.
+    """
+    if event_name == 'pull_request' and 'pull_request' in event:
+        return event['pull_request']['html_url']
+    return event.get('issue', {}).get('html_url')
+
+
+def group_events(events):
+    """
+    Group events by the GitHub issue they belong to, and merge redundant events of each issue.
+
+    Returns an OrderedDict of GitHub issue URL -> list of (event name, event), in the order each issue first appears.
+    Events which don't belong to an issue are grouped under None.
+    """
+    groups = collections.OrderedDict()
+    for event_name, event in events:
+        groups.setdefault(get_event_issue_url(event_name, event), []).append((event_name, event))
+    return collections.OrderedDict((url, merge_events(issue_events)) for url, issue_events in groups.items())
+
+
+def merge_events(events):
+    """
+    Merge redundant events on a single GitHub issue (see the module docstring). Keeps the order of the remaining events.
+    """
+    merged = []  # list of [event name, event], or None for events which were dropped
+    last_edit = None
+    labels = {}  # label name -> index of the pending 'labeled'/'unlabeled' event
+    comments = {}  # comment ID -> index of the event which created or last edited it
+
+    for event_name, event in events:
+        action = event.get('action')
+        if event_name in ('issues', 'pull_request') and action == 'edited':
+            if last_edit is not None:
+                merged[last_edit] = None
+            last_edit = len(merged)
+
+        elif event_name in ('issues', 'pull_request') and action in ('labeled', 'unlabeled'):
+            name = event['label']['name']
+            pending = labels.pop(name, None)
+            if pending is not None and merged[pending][1]['action'] != action:
+                merged[pending] = None  # label change was undone again
+                continue
+            labels[name] = len(merged)
+
+        elif event_name == 'issue_comment':
+            comment_id = event['comment']['id']
+            previous = comments.get(comment_id)
+            if previous is not None and action == 'edited':
+                previous_event = dict(merged[previous][1], comment=event['comment'])
+                merged[previous][1] = previous_event  # keeps 'changes' from the first edit, to find the old text
+                continue
+            if previous is not None and action == 'deleted' and merged[previous][1]['action'] == 'created':
+                merged[previous] = None
+                comments.pop(comment_id)
+                continue
+            comments[comment_id] = len(merged)
+
+        merged.append([event_name, event])
+
+    return [tuple(entry) for entry in merged if entry is not None]
+
+
+def sync_event_batch(path, handle_event):
+    """
+    Apply the events queued in a JSONL file, calling handle_event(event_name, event) for each event which remains
+    after merging.
+
+    If an event fails, the remaining events on the same issue are skipped (as they may depend on it), and the other
+    issues are still synced. Raises RuntimeError at the end if any event failed.
+    """
+    events = read_events(path)
+    groups = group_events(events)
+    print('Applying %d of %d queued events on %d issues' % (sum(len(g) for g in groups.values()), len(events), len(groups)))
+
+    failed = 0
+    for url, issue_events in groups.items():
+        with sync_issue.memoized_lookups():
+            for i, (event_name, event) in enumerate(issue_events):
+                print("Applying '%s' event (%s) for %s" % (event_name, event.get('action'), url))
+                try:
+                    handle_event(event_name, event)
+                except Exception as e:
+                    print('Failed to apply event: %s. Skipping %d later events for %s' % (e, len(issue_events) - i - 1, url))
+                    failed += 1
+                    break
+
+    if failed:
+        raise RuntimeError('Failed to apply queued events for %d issues' % failed)
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+#
+# Copyright 2024 Espressif Systems (Shanghai) PTE LTD
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""
+Skip GitHub events which were already synced.
+
+GitHub redelivers webhooks, and workflows sometimes run twice for the same event. Without this, a
+duplicate 'created' comment event adds the same JIRA comment twice. Each event is identified by its
+delivery ID where one is known (webhook server), otherwise by a hash of its event type and whole payload.
+The keys of synced events are kept in the state store (see sync_state.StateStore) for
+APPLIED_EVENT_RETENTION seconds.
+"""
+import hashlib
+import json
+
+import sync_state
+
+# Number of seconds a handler may take to sync an event before a duplicate of the event is synced instead
+EVENT_LEASE = 10 * 60
+# Number of seconds synced events are remembered for
+APPLIED_EVENT_RETENTION = 30 * 24 * 60 * 60
+
+_pruned = False
+
+
+def get_event_key(event_name, event, delivery=None):
+    """
+    Return the key identifying an event, or None if the event can't be identified (and is always synced).
+
+    Without a delivery ID the key is a hash of the whole payload: a redelivered webhook or a re-run workflow has the
+    same payload, while distinct events differ in more than the issue, action and label or comment ID (e.g. the
+    issue's labels, the sender, the 'changes' of an edit). Timestamps alone aren't enough, as they only have a
+    resolution of one second, and a bulk label change sends several 'labeled' events in the same second.
+    """
+    if delivery:
+        return 'delivery:%s' % delivery
+
+    gh_issue = event.get('pull_request') or event.get('issue')
+    if not gh_issue or 'action' not in event:
+        return None
+
+    payload = json.dumps(event, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(('%s\0%s' % (event_name, payload)).encode('utf-8')).hexdigest()
+
+
+def apply_once(handle_event, event_name, event, delivery=None):
+    """
+    Call handle_event(event_name, event), unless the same event was already synced. Returns False if it was skipped.
+    """
+    global _pruned
+    event_key = get_event_key(event_name, event, delivery)
+    if event_key is None:
+        handle_event(event_name, event)
+        return True
+
+    store = sync_state.get_store()
+    if not _pruned:
+        store.prune_applied_events(APPLIED_EVENT_RETENTION)
+        _pruned = True
+
+    if not store.claim_event(event_key, EVENT_LEASE):
+        print("Event was already synced (duplicate delivery?). Skipping.")
+        return False
+    try:
+        handle_event(event_name, event)
+    except BaseException:
+        store.release_event(event_key)
+        raise
+    store.mark_event_applied(event_key)
+    return True
@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+#
+# Copyright 2024 Espressif Systems (Shanghai) PTE LTD
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""
+Keeps the JIRA sync within GitHub's API rate limits.
+
+PyGithub already spaces content-changing requests a second apart, and retries requests which hit a
+secondary rate limit after the Retry-After time (GithubRetry). On top of that, GitHub calls made
+through call() are paced by the remaining request budget (the X-RateLimit-* headers of the last
+response): once less than RESERVE_FRACTION of the budget is left, the remaining requests are
+spread evenly until the budget is reset, so bulk jobs use the whole budget without running out.
+Calls which still fail with a rate limit error wait for Retry-After (or the budget reset, or a
+minute for secondary rate limits) and are tried again. Calls which fail with a server error (5xx)
+are tried again after an exponential backoff: PyGithub doesn't retry content-changing requests
+like PATCH. Other errors (4xx) are raised straight away.
+"""
+import threading
+import time
+
+from github.GithubException import GithubException, RateLimitExceededException
+from github.PaginatedList import PaginatedList
+
+import sync_trace
+
+# Start pacing requests when less than this fraction of the request budget is left
+RESERVE_FRACTION = 0.1
+# Number of times a call is tried again after a rate limit error
+MAX_RATE_LIMIT_RETRIES = 3
+# Wait before trying again after a rate limit error without a Retry-After or reset time (a secondary rate
+# limit, GitHub asks to wait at least a minute), in seconds
+DEFAULT_RATE_LIMIT_WAIT = 60
+# Number of times a call is tried again after a server error (5xx), and the first wait before that in seconds
+# (doubled for each retry)
+MAX_SERVER_ERROR_RETRIES = 3
+SERVER_ERROR_BACKOFF = 2
+# Longest wait for a rate limit, in seconds (a longer wait would outlast the workflow run anyway)
+MAX_RATE_LIMIT_WAIT = 15 * 60
+
+_limiter = None
+
+
+def get_limiter():
+    """
+    Return the process-wide RateLimiter.
+    """
+    global _limiter
+    if _limiter is None:
+        _limiter = RateLimiter()
+    return _limiter
+
+
+def call(fn, *args, **kwargs):
+    """
+    Make a GitHub request by calling fn(*args, **kwargs), pacing it with the process-wide RateLimiter.
+    """
+    return get_limiter().call(fn, *args, **kwargs)
+
+
+def iterate(items):
+    """
+    Iterate over a PaginatedList (get_issues(), get_pulls(), etc.), fetching each page with call().
+
+    Other iterables are iterated as they are.
+    """
+    if not isinstance(items, PaginatedList):
+        yield from items
+        return
+    page_number = 0
+    page = call(items.get_page, page_number)
+    page_size = getattr(get_limiter().requester, 'per_page', None)
+    if not isinstance(page_size, int):
+        page_size = len(page)  # not known, the first page is full unless it's the only one
+    while page:
+        yield from page
+        if len(page) < page_size:
+            break  # last page
+        page_number += 1
+        page = call(items.get_page, page_number)
+
+
+def get_raw_data(github_object):
+    """
+    Return the JSON data of a GitHub object (an issue, comment, etc.) as received from the API.
+
+    The raw_data property isn't used: objects listed in a page aren't complete, and raw_data fetches each one again
+    (one more request per object, which isn't made through call()).
+    """
+    return github_object._rawData
+
+
+def print_stats():
+    if _limiter is not None:
+        print('GitHub: %d calls, %d retries, %.1fs waiting for rate limits and retries' % (
+            _limiter.calls, _limiter.retries, _limiter.waited))
+
+
+class RateLimiter(object):
+    """
+    Paces GitHub calls by the remaining request budget, and retries calls which fail with a rate limit error or a
+    server error.
+
+    Counts the calls made, the retries and the time spent waiting. Safe to use from multiple threads.
+    """
+
+    def __init__(self):
+        self.requester = None
+        self.calls = 0
+        self.retries = 0
+        self.waited = 0.0
+        self._lock = threading.Lock()
+
+    def attach(self, github):
+        """
+        Read the request budget from the responses of this Github client.
+
+        The budget is read from the client's Requester, which keeps the X-RateLimit-* headers of the last response.
+        Github.rate_limiting can't be used: before any headers are seen it asks GET /rate_limit, which is an extra
+        request, and fails with 404 on GitHub Enterprise Server with rate limiting disabled.
+        """
+        self.requester = getattr(github, '_Github__requester', None)
+
+    def call(self, fn, *args, **kwargs):
+        rate_limit_retries = 0
+        server_error_retries = 0
+        while True:
+            self._wait(self._get_pacing_delay())
+            with self._lock:
+                self.calls += 1
+            try:
+                with sync_trace.span('github', getattr(fn, '__name__', 'call')):
+                    return fn(*args, **kwargs)
+            except GithubException as e:
+                wait = _get_rate_limit_wait(e)
+                if wait is not None:
+                    if rate_limit_retries == MAX_RATE_LIMIT_RETRIES:
+                        raise
+                    rate_limit_retries += 1
+                    print('GitHub rate limit reached, trying again in %ds' % wait)
+                elif isinstance(e.status, int) and e.status >= 500:
+                    if server_error_retries == MAX_SERVER_ERROR_RETRIES:
+                        raise
+                    wait = SERVER_ERROR_BACKOFF * 2 ** server_error_retries
+                    server_error_retries += 1
+                    print('GitHub server error %d, trying again in %ds' % (e.status, wait))
+                else:
+                    raise
+                with self._lock:
+                    self.retries += 1
+                self._wait(wait, 'github retry')
+
+    def _get_pacing_delay(self):
+        """
+        Return how long to wait before the next call, to make the remaining request budget last until it is reset.
+        """
+        if self.requester is None:
+            return 0
+        budget = self.requester.rate_limiting
+        reset = self.requester.rate_limiting_resettime
+        if not isinstance(budget, tuple) or not isinstance(reset, (int, float)) or budget[1] <= 0 or reset <= 0:
+            return 0  # no rate limit headers seen (yet, or rate limiting is disabled)
+        remaining, limit = budget
+        until_reset = reset - time.time()
+        if until_reset <= 0 or remaining > limit * RESERVE_FRACTION:
+            return 0
+        if remaining <= 0:
+            return min(until_reset + 1, MAX_RATE_LIMIT_WAIT)
+        return min(until_reset / remaining, MAX_RATE_LIMIT_WAIT)
+
+    def _wait(self, seconds, reason='github rate limit'):
+        if seconds <= 0:
+            return
+        with sync_trace.span('sleep', reason):
+            time.sleep(seconds)
+        with self._lock:
+            self.waited += seconds
+
+
+def _get_rate_limit_wait(error):
+    """
+    Return how long to wait before trying again after a GitHub error, or None if it isn't a rate limit error.
+    """
+    headers = {k.lower(): v for k, v in (error.headers or {}).items()}
+    budget_used_up = headers.get('x-ratelimit-remaining') == '0'
+    rate_limited = error.status == 429 or (error.status == 403 and ('retry-after' in headers or budget_used_up))
+    if not rate_limited and not isinstance(error, RateLimitExceededException):
+        return None
+    if 'retry-after' in headers:
+        wait = float(headers['retry-after'])
+    elif budget_used_up and 'x-ratelimit-reset' in headers:
+        wait = float(headers['x-ratelimit-reset']) - time.time() + 1
+    else:
+        wait = DEFAULT_RATE_LIMIT_WAIT  # secondary rate limit, the reset time is for the primary one
+    return max(1, min(wait, MAX_RATE_LIMIT_WAIT))
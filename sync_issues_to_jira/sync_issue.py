@@ -17,51 +17,137 @@
 from jira import JIRA, JIRAError
 from github import Github
 from github.GithubException import GithubException
+import collections
+import concurrent.futures
+import contextlib
+import datetime
+import hashlib
 import json
 import os
-import random
 import re
 import subprocess
 import sys
 import tempfile
+import threading
 import time
+import uuid
+
+import markdown2wiki
+import sync_github
+import sync_jira
+import sync_state
+import sync_trace
 
 # 10101 is ID for New Feature issue type in Jira.
 JIRA_NEW_FEATURE_TYPE_ID = 10101
 # 10004 is ID for Bug issue type in Jira.
 JIRA_BUG_TYPE_ID = 10004
-# Initialize GitHub instance
-GITHUB = Github(os.environ["GITHUB_TOKEN"])
-# Initialize GitHub repository
-REPO = GITHUB.get_repo(os.environ['GITHUB_REPOSITORY'])
+# Default number of seconds a handler may take to create a JIRA issue before other handlers create it instead (handlers
+# waiting for a claim stop waiting as soon as it's released, this is only for handlers which never release it)
+DEFAULT_CREATION_LEASE = 60
+# JIRA project properties holding the claims on creating the JIRA issue of a GitHub issue (see _creation_claim())
+CLAIM_PROPERTY_PREFIX = 'github-sync-claim-'
+# Number of seconds between setting a claim in JIRA and reading it back
+CLAIM_SETTLE_TIME = 1
+# Longest wait between checks of a claim held by another handler, in seconds
+MAX_CLAIM_POLL_INTERVAL = 4
+# Default number of seconds JIRA metadata (issue types, components) is cached for
+DEFAULT_METADATA_TTL = 24 * 60 * 60
+# Number of issues mirrored at the same time by sync_issues_manually()
+DEFAULT_SYNC_CONCURRENCY = 4
+MAX_SYNC_CONCURRENCY = 16
+# JIRA issue property holding the fingerprint of the synced fields (see _get_fingerprint())
+FINGERPRINT_PROPERTY = 'github-sync-fingerprint'
+# Number of threads running independent steps of a handler in the background (see _in_background())
+STEP_CONCURRENCY = 8
+# Number of issues, PRs or collaborators per page of GitHub results
+GITHUB_PAGE_SIZE = 100
+# Number of minutes back the issues created by the sync are searched, after creating an issue failed (see _post_issue())
+CREATED_ISSUE_SEARCH_MINUTES = 10
+_github_repo = None
+_GITHUB_REPO_LOCK = threading.Lock()
+_GITHUB_WRITE_LOCK = threading.Lock()
+_lookup_memo = threading.local()
+_step_executor = None
+_STEP_EXECUTOR_LOCK = threading.Lock()
+
+
+def get_github_repo():
+    """
+    Return the GitHub repository being synced (GITHUB_REPOSITORY), using the REST API at GITHUB_API_URL if it is set.
 
+    The GitHub client is only created the first time this is called, so importing this module and handling events
+    which end early (unhandled events, etc.) makes no GitHub requests. Later calls return the same repository object.
 
-def handle_issue_opened(jira, event):
-    gh_issue = event["issue"]
-    issue = _find_jira_issue(jira, gh_issue, False)
+    Requests made through sync_github.call() are paced by the client's remaining rate limit budget.
+    """
+    global _github_repo
+    with _GITHUB_REPO_LOCK:
+        if _github_repo is None:
+            kwargs = {}
+            if os.environ.get('GITHUB_API_URL'):
+                kwargs['base_url'] = os.environ['GITHUB_API_URL']  # GitHub Enterprise Server, or a local stand-in
+            github = Github(os.environ["GITHUB_TOKEN"], **kwargs)
+            github.per_page = GITHUB_PAGE_SIZE  # fewer requests when listing issues, PRs and collaborators
+            sync_github.get_limiter().attach(github)
+            _github_repo = sync_github.call(github.get_repo, os.environ['GITHUB_REPOSITORY'])
+        return _github_repo
+
+
+def _in_background(fn, *args):
+    """
+    Start fn(*args) in a worker thread and return its concurrent.futures.Future, so a handler can make a JIRA request
+    while it waits for another step that doesn't depend on it (rendering Markdown, fetching JIRA metadata).
+
+    Only use this for steps which don't look up JIRA issues, as _find_jira_issue() memoizes lookups per thread.
+    """
+    global _step_executor
+    with _STEP_EXECUTOR_LOCK:
+        if _step_executor is None:
+            _step_executor = concurrent.futures.ThreadPoolExecutor(max_workers=STEP_CONCURRENCY, thread_name_prefix='sync-step')
+    return _step_executor.submit(sync_trace.propagate(fn), *args)
 
-    if issue is not None:
-        print('Issue already exists (another event was dispatched first?)')
-        return
 
-    print('Creating new JIRA issue for new GitHub issue')
-    _create_jira_issue(jira, event["issue"])
+def handle_issue_opened(jira, event):
+    _mirror_issue(jira, event["issue"])
 
 
 def handle_issue_edited(jira, event):
     gh_issue = event["issue"]
+    description = _in_background(_get_description, gh_issue)  # while looking up the JIRA issue
     issue = _find_jira_issue(jira, gh_issue, True)
+    fingerprint = _get_fingerprint(jira, issue)
+    old_fingerprint = dict(fingerprint)
 
     fields = {
-        "description": _get_description(gh_issue),
+        "description": description.result(),
         "summary": _get_summary(gh_issue),
     }
 
     _update_components_field(jira, fields, issue)
 
-    issue.update(fields=fields)
+    fields_hash = _hash_fingerprint(fields)
+    if fingerprint.get("fields") == fields_hash:
+        print("Synced fields are unchanged, not updating JIRA issue")
+    else:
+        try:
+            issue.update(fields=fields)
+        except JIRAError as error:
+            if not _invalidate_jira_metadata(error, issue.fields.project.key):
+                raise
+            print('JIRA rejected cached metadata, retrying with fresh metadata')
+            fields.pop("components", None)
+            _update_components_field(jira, fields, issue)
+            issue.update(fields=fields)
+            fields_hash = _hash_fingerprint(fields)
+        fingerprint["fields"] = fields_hash
 
-    _update_link_resolved(jira, gh_issue, issue)
+    _update_link_resolved(jira, gh_issue, issue, fingerprint)
+
+    if fingerprint == old_fingerprint:
+        print("Nothing synced from GitHub has changed, not commenting on JIRA issue")
+        return
+    _set_fingerprint(jira, issue, fingerprint)
 
     _leave_jira_issue_comment(jira, event, "edited", True, jira_issue=issue)
 
@@ -132,52 +218,226 @@ def handle_issue_reopened(jira, event):
 
 def handle_comment_created(jira, event):
     gh_comment = event["comment"]
+    if sync_state.get_store().get_comment(gh_comment["id"]) is not None:
+        print("Comment is already mirrored to JIRA")
+        return
 
+    body = _in_background(_get_jira_comment_body, gh_comment)  # while looking up the JIRA issue
     jira_issue = _find_jira_issue(jira, event["issue"], True)
-    jira.add_comment(jira_issue.id, _get_jira_comment_body(gh_comment))
+    if sync_state.get_store().get_comment(gh_comment["id"]) is not None:
+        print("Comment was mirrored with the earlier comments of the new JIRA issue")
+        return
+    _add_jira_comment(jira, jira_issue, gh_comment, body.result())
 
 
 def handle_comment_edited(jira, event):
     gh_comment = event["comment"]
-    old_gh_body = _markdown2wiki(event["changes"]["body"]["from"])
 
-    jira_issue = _find_jira_issue(jira, event["issue"], True)
+    body = _in_background(_get_jira_comment_body, gh_comment)  # while loading the JIRA comment
+    jira_comment = _find_jira_comment(jira, gh_comment)
+    if jira_comment is not None:
+        jira_comment.update(body=body.result())
+        return
 
-    # Look for the old comment and update it if we find it
-    old_jira_body = _get_jira_comment_body(gh_comment, old_gh_body)
-    found = False
+    # Comment isn't in the index (i.e. it was mirrored before the index existed), look for the old comment text instead
+    jira_issue = _find_jira_issue(jira, event["issue"], True)
+    if sync_state.get_store().get_comment(gh_comment["id"]) is not None:
+        print("Comment was mirrored with the earlier comments of the new JIRA issue")
+        return
+    old_jira_body = _get_jira_comment_body(gh_comment, _markdown2wiki(event["changes"]["body"]["from"]))
     for comment in jira.comments(jira_issue.key):
         if comment.body == old_jira_body:
-            comment.update(body=_get_jira_comment_body(gh_comment))
-            found = True
-            break
+            comment.update(body=body.result())
+            sync_state.get_store().set_comment(gh_comment["id"], jira_issue.key, comment.id)
+            return
 
-    if not found:  # if we didn't find the old comment, make a new comment about the edit
-        jira.add_comment(jira_issue.id, _get_jira_comment_body(gh_comment))
+    # if we didn't find the old comment, make a new comment about the edit
+    _add_jira_comment(jira, jira_issue, gh_comment, body.result())
 
 
 def handle_comment_deleted(jira, event):
     gh_comment = event["comment"]
+    jira_comment = _find_jira_comment(jira, gh_comment)
+    if jira_comment is not None:
+        jira_comment.update(body="[GitHub issue comment|%s] by @%s was deleted." % (gh_comment["html_url"], gh_comment["user"]["login"]))
+        sync_state.get_store().delete_comment(gh_comment["id"])
+        return
+
     jira_issue = _find_jira_issue(jira, event["issue"], True)
-    jira.add_comment(
-        jira_issue.id, "@%s deleted [GitHub issue comment|%s]" % (gh_comment["user"]["login"], gh_comment["html_url"])
+    _add_comment(
+        jira, jira_issue.id, "@%s deleted [GitHub issue comment|%s]" % (gh_comment["user"]["login"], gh_comment["html_url"])
     )
 
 
+def _add_jira_comment(jira, jira_issue, gh_comment, body=None):
+    """
+    Mirror a GitHub comment to the JIRA issue, and remember the JIRA comment for later edits.
+
+    body is the JIRA comment text, if the caller already rendered it.
+    """
+    if body is None:
+        body = _get_jira_comment_body(gh_comment)
+    jira_comment = _add_comment(jira, jira_issue.id, body)
+    sync_state.get_store().set_comment(gh_comment["id"], jira_issue.key, jira_comment.id)
+    return jira_comment
+
+
+def _add_comment(jira, issue_id, body):
+    """
+    Add a comment to a JIRA issue.
+
+    Adding comments isn't retried after a failure which JIRA may have handled anyway (see sync_jira.may_have_succeeded()),
+    so the comments of the issue are checked for it before adding it again.
+    """
+    try:
+        return jira.add_comment(issue_id, body)
+    except JIRAError as error:
+        if not sync_jira.may_have_succeeded(error):
+            raise
+        print('Adding JIRA comment failed (%s), checking if it was added' % error.status_code)
+        for comment in reversed(jira.comments(issue_id)):
+            if comment.body == body:
+                return comment
+        return jira.add_comment(issue_id, body)
+
+
+def _backfill_comments(jira, gh_issue, jira_issue):
+    """
+    Mirror the earlier comments of a GitHub issue to its JIRA issue, when the JIRA issue is created after they were
+    made (i.e. the 'opened' event was missed). Returns the number of comments mirrored.
+
+    The comments are listed a page at a time, and their bodies are all converted in the background (see
+    _in_background()) while the pages are fetched. They're then added one at a time, in order, as JIRA orders comments
+    by the time they were added. Comments which are already mirrored (see sync_state.StateStore) are skipped.
+    """
+    if gh_issue.get("comments", 1) == 0:
+        return 0  # the comment count is in webhook payloads, no need to ask GitHub
+    store = sync_state.get_store()
+    api_gh_issue = sync_github.call(get_github_repo().get_issue, gh_issue["number"])
+    pending = []
+    for gh_comment in sync_github.iterate(api_gh_issue.get_comments()):
+        gh_comment = sync_github.get_raw_data(gh_comment)
+        if store.get_comment(gh_comment["id"]) is None:
+            pending.append((gh_comment, _in_background(_get_jira_comment_body, gh_comment)))
+
+    if pending:
+        print("Mirroring %d earlier comments to %s" % (len(pending), jira_issue.key))
+    for gh_comment, body in pending:
+        _add_jira_comment(jira, jira_issue, gh_comment, body.result())
+    return len(pending)
+
+
+def _find_jira_comment(jira, gh_comment):
+    """
+    Return the JIRA comment mirroring a GitHub comment, if it is in the index (see sync_state.StateStore).
+    """
+    store = sync_state.get_store()
+    mirror = store.get_comment(gh_comment["id"])
+    if mirror is None:
+        return None
+    try:
+        return jira.comment(*mirror)
+    except JIRAError as e:
+        print("Mirrored comment %s of %s could not be loaded (%s)" % (mirror[1], mirror[0], e.status_code))
+        store.delete_comment(gh_comment["id"])
+        return None
+
+
 # Works both for issues and pull requests
 def sync_issues_manually(jira, event):
-    # Get issue numbers that were entered manually when triggering workflow
-    issue_numbers = event['inputs']['issue-numbers']
-    issues = re.split('\W+', issue_numbers)
-    # Process every issue
-    for issue_number in issues:
+    """
+    Mirror the issues and PRs entered manually when triggering the workflow.
+
+    The JIRA work for each issue runs in a pool of worker threads. The pool size is the 'concurrency' input of the
+    workflow (or the JIRA_SYNC_CONCURRENCY environment variable), at most MAX_SYNC_CONCURRENCY.
+    """
+    issue_numbers = []
+    for issue_number in re.split(r'\W+', event['inputs']['issue-numbers']):
         if not issue_number.isnumeric():
             print(f'Wrong issue number entered: {issue_number} Skipping...')
             continue
-        gh_issue = REPO.get_issue(number=int(issue_number))
-        event['issue'] = gh_issue.raw_data
-        print(f'Mirroring issue: #{issue_number} to Jira')
-        handle_issue_opened(jira, event)
+        issue_numbers.append(int(issue_number))
+
+    concurrency = event['inputs'].get('concurrency') or os.environ.get('JIRA_SYNC_CONCURRENCY') or DEFAULT_SYNC_CONCURRENCY
+    concurrency = max(1, min(int(concurrency), MAX_SYNC_CONCURRENCY))
+
+    gh_issues = _get_github_issues(issue_numbers)
+    results = {}
+    for issue_number in issue_numbers:
+        if issue_number not in gh_issues:
+            results[issue_number] = ('failed', 'GitHub issue not found')
+
+    def mirror(gh_issue):
+        print(f'Mirroring issue: #{gh_issue["number"]} to Jira')
+        try:
+            issue, created = _mirror_issue(jira, gh_issue)
+            return ('created' if created else 'already existed', issue.key)
+        except Exception as e:
+            return ('failed', '%s: %s' % (type(e).__name__, e))
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=concurrency) as executor:
+        futures = {executor.submit(sync_trace.propagate(mirror), gh_issue): number for number, gh_issue in gh_issues.items()}
+        for future in concurrent.futures.as_completed(futures):
+            results[futures[future]] = future.result()
+
+    print('Mirroring summary:')
+    for issue_number in sorted(results):
+        print('  #%d: %s (%s)' % (issue_number, *results[issue_number]))
+    counts = collections.Counter(status for status, _ in results.values())
+    print(', '.join('%d %s' % (counts[status], status) for status in ('created', 'already existed', 'failed')))
+    if counts['failed']:
+        raise RuntimeError('Failed to mirror %d issues' % counts['failed'])
+    return results
+
+
+def _get_github_issues(issue_numbers):
+    """
+    Fetch GitHub issues and PRs by number. Returns a dict of number -> issue data (as in webhook payloads).
+
+    If it takes fewer requests, the repository's issues are listed one page at a time (newest first) instead of
+    fetching each issue on its own.
+    """
+    wanted = set(issue_numbers)
+    result = {}
+    if not wanted:
+        return result
+
+    issues = get_github_repo().get_issues(state="all", sort="created", direction="desc")
+    page_number = 0
+    page = sync_github.call(issues.get_page, page_number)
+    while page:
+        for gh_issue in page:
+            if gh_issue.number in wanted:
+                result[gh_issue.number] = sync_github.get_raw_data(gh_issue)
+        oldest = page[-1].number
+        remaining = [n for n in wanted - set(result) if n < oldest]
+        pages_needed = (oldest - min(remaining)) / len(page) if remaining else 0
+        if pages_needed == 0 or pages_needed > len(remaining):
+            break
+        page_number += 1
+        page = sync_github.call(issues.get_page, page_number)
+
+    for issue_number in sorted(wanted - set(result)):
+        try:
+            result[issue_number] = sync_github.get_raw_data(sync_github.call(get_github_repo().get_issue, number=issue_number))
+        except GithubException as e:
+            print('Could not fetch GitHub issue #%d: %s' % (issue_number, e))
+    return result
+
+
+def _mirror_issue(jira, gh_issue):
+    """
+    Create the JIRA issue for a GitHub issue, unless it already exists.
+
+    Returns a tuple of (JIRA issue, True if it was created).
+    """
+    with _creation_claim(jira, gh_issue) as issue:
+        if issue is not None:
+            print('Issue already exists (another event was dispatched first?)')
+            return issue, False
+
+        print('Creating new JIRA issue for new GitHub issue')
+        return _create_jira_issue(jira, gh_issue), True
 
 
 def _check_issue_label(label):
@@ -192,7 +452,7 @@ def _check_issue_label(label):
     return label
 
 
-def _update_link_resolved(jira, gh_issue, jira_issue):
+def _update_link_resolved(jira, gh_issue, jira_issue, fingerprint=None):
     """
     Update the 'resolved' status of the remote "synced from" link, based on the
     GitHub issue open/closed status.
@@ -200,8 +460,20 @@ def _update_link_resolved(jira, gh_issue, jira_issue):
     (A 'resolved' link is shown in strikethrough format in JIRA interface.)
 
     Also updates the link title, if GitHub issue title has changed.
+
+    Nothing is updated if the title and status are the same as at the last sync (see _get_fingerprint()). If
+    fingerprint is passed, the caller saves the updated fingerprint. Otherwise it is read and saved here.
     """
+    save_fingerprint = fingerprint is None
+    if save_fingerprint:
+        fingerprint = _get_fingerprint(jira, jira_issue)
+
     resolved = gh_issue["state"] != "open"
+    link_hash = _hash_fingerprint({"title": gh_issue["title"], "resolved": resolved})
+    if fingerprint.get("link") == link_hash:
+        print("Remote link is unchanged, not updating it")
+        return
+
     for link in jira.remote_links(jira_issue):
         if hasattr(link, "globalId") and link.globalId == gh_issue["html_url"]:
             new_link = dict(link.raw["object"])  # RemoteLink update() requires all fields as a JSON object, it seems
@@ -209,13 +481,83 @@ def _update_link_resolved(jira, gh_issue, jira_issue):
             new_link["status"]["resolved"] = resolved
             link.update(new_link, globalId=link.globalId, relationship=link.relationship)
 
+    fingerprint["link"] = link_hash
+    if save_fingerprint:
+        _set_fingerprint(jira, jira_issue, fingerprint)
+
+
+def _get_fingerprint(jira, jira_issue):
+    """
+    Return the fingerprint of what was last synced to this JIRA issue, as a dict with keys "fields" (hash of the
+    summary, description and components) and "link" (hash of the remote link title and status). Keys are missing
+    if they were never saved.
+
+    The fingerprint is kept in a JIRA issue property, which _find_jira_issue() fetches along with the issue.
+    Otherwise it costs another request.
+    """
+    raw = getattr(jira_issue, "raw", None)
+    if isinstance(raw, dict) and "properties" in raw:
+        value = raw["properties"].get(FINGERPRINT_PROPERTY)
+    else:
+        try:
+            value = jira.issue_property(jira_issue.key, FINGERPRINT_PROPERTY).raw["value"]
+        except JIRAError:
+            value = None  # property was never set
+    return dict(value) if isinstance(value, dict) else {}
+
+
+def _set_fingerprint(jira, jira_issue, fingerprint):
+    jira.add_issue_property(jira_issue.key, FINGERPRINT_PROPERTY, fingerprint)
+    raw = getattr(jira_issue, "raw", None)
+    if isinstance(raw, dict):
+        raw.setdefault("properties", {})[FINGERPRINT_PROPERTY] = dict(fingerprint)
+
+
+def _hash_fingerprint(value):
+    return hashlib.sha256(json.dumps(value, sort_keys=True).encode("utf-8")).hexdigest()
+
 
 def _markdown2wiki(markdown):
     """
-    Convert markdown to JIRA wiki format. Uses https://github.com/Shogobg/markdown2confluence
+    Convert markdown to JIRA wiki format.
+
+    The conversion is done in-process by markdown2wiki.py. Setting JIRA_MARKDOWN_CONVERTER=markdown2confluence
+    switches back to https://github.com/Shogobg/markdown2confluence (much slower, as it runs a Node.js process).
+
+    Results are cached by content, see sync_state.MarkdownCache.
     """
     if markdown is None:
         return "\n"  # Allow empty/blank input
+
+    use_markdown2confluence = os.environ.get('JIRA_MARKDOWN_CONVERTER', 'builtin') == 'markdown2confluence'
+    converter_version = 'markdown2confluence' if use_markdown2confluence else 'builtin-%d' % markdown2wiki.CONVERTER_VERSION
+    cache = sync_state.get_markdown_cache()
+    cache_key = cache.key(markdown, converter_version)
+    result = cache.get(cache_key)
+    if result is not None:
+        return result
+
+    if use_markdown2confluence:
+        result = _markdown2confluence(markdown)
+        if result is None:
+            return markdown
+    else:
+        try:
+            result = markdown2wiki.convert(markdown)
+        except Exception as e:
+            print("Failed to convert Markdown: %r. JIRA issue will have raw Markdown contents." % e)
+            return markdown
+
+    if len(result) > 16384:  # limit any single body of text to 16KB (JIRA API limits total text to 32KB)
+        result = result[:16376] + "\n\n[...]"  # add newlines to encourage end of any formatting blocks
+    cache.put(cache_key, result)
+    return result
+
+
+def _markdown2confluence(markdown):
+    """
+    Convert markdown to JIRA wiki format using the markdown2confluence CLI. Returns None if the conversion fails.
+    """
     with tempfile.TemporaryDirectory() as tmp_dir:
         md_path = os.path.join(tmp_dir, 'markdown.md')
         conf_path = os.path.join(tmp_dir, 'confluence.txt')
@@ -225,15 +567,13 @@ def _markdown2wiki(markdown):
                 mdf.write('\n')
 
         try:
-            subprocess.check_call(['markdown2confluence', md_path, conf_path])
+            with sync_trace.span('subprocess', 'markdown2confluence'):
+                subprocess.check_call(['markdown2confluence', md_path, conf_path])
             with open(conf_path, 'r') as f:
-                result = f.read()
-            if len(result) > 16384:  # limit any single body of text to 16KB (JIRA API limits total text to 32KB)
-                result = result[:16376] + "\n\n[...]"  # add newlines to encourage end of any formatting blocks
-            return result
+                return f.read()
         except subprocess.CalledProcessError as e:
             print("Failed to run markdown2confluence: %s. JIRA issue will have raw Markdown contents." % e)
-            return markdown
+            return None
 
 
 def _get_description(gh_issue):
@@ -290,38 +630,162 @@ def _get_summary(gh_issue):
     return result
 
 
-def _create_jira_issue(jira, gh_issue):
+def _create_jira_issue(jira, gh_issue, prefetch=False):
     """
     Create a new JIRA issue from the provided GitHub issue, then return the JIRA issue.
+
+    This takes two JIRA requests: creating the issue (with the custom GitHub Issue field set) and adding the remote
+    link (with the right title and resolved status). If the custom field can't be set when creating the issue, it is
+    updated afterwards instead.
+
+    If an earlier call created the JIRA issue but failed before adding the remote link (which makes the issue
+    findable), the same JIRA issue is finished instead of creating another one.
+
+    If prefetch is False, the returned issue only has its id and key loaded, not its fields.
     """
-    issuetype = _get_jira_issue_type(jira, gh_issue)
-    if issuetype is None:
-        issuetype = os.environ.get('JIRA_ISSUE_TYPE', 'Task')
+    store = sync_state.get_store()
+    unlinked_key = store.get_unlinked_jira_key(gh_issue["html_url"])
+    if unlinked_key is not None:
+        # an earlier attempt created the JIRA issue, but failed before adding the remote link
+        print('Finishing creation of JIRA issue %s' % unlinked_key)
+        issue = jira.issue(unlinked_key)
+        _add_remote_link(jira, issue, gh_issue)
+        _update_github_with_jira_key(gh_issue, issue)
+        return issue
+
+    gh_issue_field = {'customfield_12100': {'value': 'Open' if gh_issue["state"] == "open" else 'Closed'}}
+    try:
+        issue = _create_issue(jira, gh_issue, gh_issue_field, prefetch)
+    except JIRAError as error:
+        if 'customfield_12100' not in str(error.text):
+            raise
+        print('Could not set GitHub Issue field when creating new issue, setting it afterwards')
+        issue = _create_issue(jira, gh_issue, {}, prefetch)
+        try :
+            issue.update(fields=gh_issue_field)
+        except JIRAError as error:
+            print(f'Could not set GitHub Issue field when creating new issue with error: {error}')
+    store.set_unlinked_jira_key(gh_issue["html_url"], issue.key)
+
+    _add_remote_link(jira, issue, gh_issue)
+    _update_github_with_jira_key(gh_issue, issue)
+    return issue
+
+
+def _create_issue(jira, gh_issue, extra_fields, prefetch):
+    """
+    Create the JIRA issue for the provided GitHub issue, retrying once if JIRA rejects cached metadata.
+    """
+    fields = _get_create_fields(jira, gh_issue)
+    fields.update(extra_fields)
+    try:
+        return _post_issue(jira, gh_issue, fields, prefetch)
+    except JIRAError as error:
+        if not _invalidate_jira_metadata(error, os.environ['JIRA_PROJECT']):
+            raise
+        print('JIRA rejected cached metadata, retrying with fresh metadata')
+        fields = _get_create_fields(jira, gh_issue)
+        fields.update(extra_fields)
+        return _post_issue(jira, gh_issue, fields, prefetch)
+
+
+def _post_issue(jira, gh_issue, fields, prefetch):
+    """
+    Create a JIRA issue with the given fields.
+
+    Creating issues isn't retried after a failure which JIRA may have handled anyway (see sync_jira.may_have_succeeded()),
+    so the issues created in the project by the sync in the last CREATED_ISSUE_SEARCH_MINUTES are searched for one with
+    the same summary and GitHub URL before creating it again.
+    """
+    try:
+        return jira.create_issue(fields, prefetch=prefetch)
+    except JIRAError as error:
+        if not sync_jira.may_have_succeeded(error):
+            raise
+        print('Creating JIRA issue failed (%s), checking if it was created' % error.status_code)
+        jql_query = 'project = "%s" and creator = currentUser() and created >= -%dm order by created desc' % (
+            os.environ['JIRA_PROJECT'], CREATED_ISSUE_SEARCH_MINUTES)
+        for issue in jira.search_issues(jql_query, fields="summary,description"):
+            if issue.fields.summary == fields["summary"] and gh_issue["html_url"] in (issue.fields.description or ""):
+                print('JIRA issue %s was created' % issue.key)
+                return jira.issue(issue.key) if prefetch else issue
+        return jira.create_issue(fields, prefetch=prefetch)
+
+
+def _get_create_fields(jira, gh_issue):
+    """
+    Return the fields for a new JIRA issue created from the provided GitHub issue.
+
+    The issue type, project and components (each a JIRA request unless the metadata is stored) are looked up at the
+    same time, while the description is rendered.
+    """
+    project_key = os.environ['JIRA_PROJECT']
+    issuetype = _in_background(_get_create_issue_type, jira, gh_issue)
+    project = _in_background(_get_jira_metadata, 'project:%s' % project_key, lambda: jira.project(project_key))
+    components = {}
+    components_done = _in_background(_update_components_field, jira, components, None)
 
     fields = {
         "summary": _get_summary(gh_issue),
-        "project": os.environ['JIRA_PROJECT'],
         "description": _get_description(gh_issue),
-        "issuetype": issuetype,
         "labels": [_get_jira_label(l) for l in gh_issue["labels"]],
     }
-    _update_components_field(jira, fields, None)
+    fields["project"] = {"id": project.result()["id"]}
+    fields["issuetype"] = issuetype.result()
+    components_done.result()
+    fields.update(components)
+    return fields
 
-    issue = jira.create_issue(fields)
-    
-    try :
-        # Sets value of custom GitHub Issue field to Open 
-        issue.update(fields={'customfield_12100': {'value': 'Open'}})
-    except JIRAError as error:
-        print(f'Could not set GitHub Issue field to Open when creating new issue with error: {error}')
 
-    _add_remote_link(jira, issue, gh_issue)
-    _update_github_with_jira_key(gh_issue, issue)
-    if gh_issue["state"] != "open":
-        # mark the link to GitHub as resolved
-        _update_link_resolved(jira, gh_issue, issue)
+def _get_create_issue_type(jira, gh_issue):
+    """
+    Return the issue type for a new JIRA issue: the type matching the GitHub labels, or else JIRA_ISSUE_TYPE (default
+    "Task").
+    """
+    issuetype = _get_jira_issue_type(jira, gh_issue)
+    if issuetype is None:
+        issuetype = os.environ.get('JIRA_ISSUE_TYPE', 'Task')
+        for issue_type in _get_jira_metadata('issue_types', jira.issue_types):
+            if issue_type["name"] == issuetype:
+                return {"id": issue_type["id"]}  # saves JIRA looking up the type by name
+    return issuetype
 
-    return issue
+
+def _get_jira_metadata(name, fetch):
+    """
+    Return JIRA metadata (issue types, projects, components) from the state store. Calls fetch() to get the metadata from
+    JIRA if it is not stored or older than JIRA_METADATA_TTL seconds.
+
+    fetch() returns either a list of JIRA resources or a single resource, and the stored value keeps only their 'id',
+    'key' and 'name' attributes.
+    """
+    ttl = float(os.environ.get('JIRA_METADATA_TTL', DEFAULT_METADATA_TTL))
+    store = sync_state.get_store()
+    value = store.get_metadata(name, ttl)
+    if value is None:
+        resources = fetch()
+
+        def to_dict(resource):
+            return {attr: getattr(resource, attr) for attr in ("id", "key", "name") if hasattr(resource, attr)}
+        value = [to_dict(r) for r in resources] if isinstance(resources, list) else to_dict(resources)
+        store.set_metadata(name, value)
+    return value
+
+
+def _invalidate_jira_metadata(error, project_key):
+    """
+    Forget stored metadata related to a field JIRA rejected. Returns True if any stored metadata was used for the field,
+    i.e. the request is worth retrying.
+    """
+    store = sync_state.get_store()
+    text = str(error.text)
+    invalidated = False
+    for field, name in (("issuetype", "issue_types"), ("project", "project:%s" % project_key),
+                        ("components", "components:%s" % project_key)):
+        if field in text and store.get_metadata(name, float("inf")) is not None:
+            store.delete_metadata(name)
+            invalidated = True
+    return invalidated
 
 
 def _add_remote_link(jira, issue, gh_issue):
@@ -334,30 +798,28 @@ def _add_remote_link(jira, issue, gh_issue):
         destination={
             "url": gh_url,
             "title": gh_issue["title"],
+            "status": {"resolved": gh_issue["state"] != "open"},  # see _update_link_resolved()
         },
         globalId=gh_url,  # globalId is always the GitHub URL
         relationship="synced from",
     )
+    store = sync_state.get_store()
+    store.set_jira_key(gh_url, issue.key)
+    store.delete_unlinked_jira_key(gh_url)
 
 
 def _update_github_with_jira_key(gh_issue, jira_issue):
     """Append the new JIRA issue key to the GitHub issue
     (updates made by github actions don't trigger new actions)
     """
+    api_gh_issue = sync_github.call(get_github_repo().get_issue, gh_issue["number"])
+    if "(%s)" % jira_issue.key in api_gh_issue.title:
+        return  # an earlier attempt added it
 
-    api_gh_issue = REPO.get_issue(gh_issue["number"])
-
-    retries = 5
-    while True:
-        try:
-            api_gh_issue.edit(title="%s (%s)" % (api_gh_issue.title, jira_issue.key))
-            break
-        except GithubException as e:
-            if retries == 0:
-                raise
-            print("GitHub edit failed: %s (%d retries)" % (e, retries))
-            time.sleep(random.randrange(1, 5))
-            retries -= 1
+    # GitHub asks for content-changing requests to be made one at a time. PyGithub spaces them a second apart, and
+    # sync_github waits out rate limits and retries server errors (PyGithub doesn't retry PATCH requests).
+    with _GITHUB_WRITE_LOCK:
+        sync_github.call(api_gh_issue.edit, title="%s (%s)" % (api_gh_issue.title, jira_issue.key))
 
 
 def _update_components_field(jira, fields, existing_issue=None):
@@ -379,12 +841,12 @@ def _update_components_field(jira, fields, existing_issue=None):
 
     if existing_issue:
         # may be a different project if the issue was moved
-        project = jira.project(existing_issue.fields.project.key)
+        project_key = existing_issue.fields.project.key
     else:
-        project = jira.project(os.environ['JIRA_PROJECT'])
-    project_components = jira.project_components(project)
+        project_key = os.environ['JIRA_PROJECT']
+    project_components = _get_jira_metadata('components:%s' % project_key, lambda: jira.project_components(project_key))
 
-    if component not in [c.name for c in project_components]:
+    if component not in [c["name"] for c in project_components]:
         print("JIRA project doesn't contain the configured component, not updating components field")
         return
 
@@ -393,9 +855,9 @@ def _update_components_field(jira, fields, existing_issue=None):
     fields["components"] = [{"name": component}]
     # keep any existing components as well
     if existing_issue:
-        for component in existing_issue.fields.components:
-            if component.name != component:
-                fields["components"].append({"name": component.name})
+        for existing_component in existing_issue.fields.components:
+            if existing_component.name != component:
+                fields["components"].append({"name": existing_component.name})
 
 
 def _get_jira_issue_type(jira, gh_issue):
@@ -408,7 +870,7 @@ def _get_jira_issue_type(jira, gh_issue):
     """
     gh_labels = [l["name"] for l in gh_issue["labels"]]
 
-    issue_types = jira.issue_types()
+    issue_types = _get_jira_metadata('issue_types', jira.issue_types)
 
     for gh_label in gh_labels:
         # Type: Feature Request label should match New Feature issue type in Jira
@@ -421,78 +883,299 @@ def _get_jira_issue_type(jira, gh_issue):
             print('GitHub label is \'Type: Bug :bug:\'. Mapping to Bug Jira issue type')
             return {"id": JIRA_BUG_TYPE_ID}  # JIRA API needs JSON here
         for issue_type in issue_types:
-            type_name = issue_type.name.lower()
+            type_name = issue_type["name"].lower()
             if gh_label.lower() in [type_name, "type: %s" % (type_name,)]:
                 # a match!
-                print("Mapping GitHub label '%s' to JIRA issue type '%s'" % (gh_label, issue_type.name))
-                return {"id": issue_type.id}  # JIRA API needs JSON here
+                print("Mapping GitHub label '%s' to JIRA issue type '%s'" % (gh_label, issue_type["name"]))
+                return {"id": issue_type["id"]}  # JIRA API needs JSON here
 
     return None  # updating a field to None seems to cause 'no change' for JIRA
 
 
-def _find_jira_issue(jira, gh_issue, make_new=False, retries=5):
+@contextlib.contextmanager
+def memoized_lookups():
+    """
+    Context manager in which _find_jira_issue() only looks up the JIRA issue for each GitHub issue once (per thread),
+    for applying several events to the same issues (see sync_batch.py).
+    """
+    _lookup_memo.issues = {}
+    try:
+        yield
+    finally:
+        _lookup_memo.issues = None
+
+
+def _find_jira_issue(jira, gh_issue, make_new=False):
     """Look for a JIRA issue which has a remote link to the provided GitHub issue.
 
     Will also find "manually synced" issues that point to each other by name
     (see README), and create the remote link.
 
-    If make_new is True, a new issue will be created if one is not found.
-
-    retries is an internal parameter used when make_new is set, to try and
-    avoid races when creating issues (wait a random amount of time and then look
-    again). This is useful because often events on a GitHub issue come in a
-    flurry (for example if someone creates and then edits or labels an issue),
-    # and they're not always processed in order.
+    If make_new is True, a new issue will be created if one is not found (see
+    _creation_claim() for how this avoids racing with the handler of the 'opened'
+    event, which creates the JIRA issue for new GitHub issues).
     """
+    memo = getattr(_lookup_memo, "issues", None)
+    if memo is not None and gh_issue["html_url"] in memo:
+        return memo[gh_issue["html_url"]]
+    issue = _lookup_jira_issue(jira, gh_issue, make_new)
+    if memo is not None and issue is not None:
+        memo[gh_issue["html_url"]] = issue
+    return issue
+
+
+def _lookup_jira_issue(jira, gh_issue, make_new):
     url = gh_issue["html_url"]
+    issue = _find_indexed_jira_issue(jira, gh_issue)
+    if issue is not None:
+        return issue
+
     jql_query = 'issue in issuesWithRemoteLinksByGlobalId("%s") order by updated desc' % url
     print("JQL query: %s" % jql_query)
-    r = jira.search_issues(jql_query)
+    r = jira.search_issues(jql_query, properties=FINGERPRINT_PROPERTY)
     if len(r) == 0:
         print("WARNING: No JIRA issues have a remote link with globalID '%s'" % url)
 
-        # Check if the github title ends in (JIRA-KEY). If we can find that JIRA issue and the JIRA issue description contains the
-        # GitHub URL, assume this item was manually synced over.
-        m = re.search(r"\(([A-Z]+-\d+)\)\s*$", gh_issue["title"])
-        if m is not None:
-            try:
-                issue = jira.issue(m.group(1))
-                if gh_issue["html_url"] in issue.fields.description:
-                    print(
-                        "Looks like this JIRA issue %s was manually synced. Adding a remote link for future lookups."
-                        % issue.key
-                    )
-                    _add_remote_link(jira, issue, gh_issue)
-                    return issue
-            except jira.exceptions.JIRAError:
-                pass  # issue doesn't exist or unauthorized
-
-            # note: not logging anything on failure to avoid
-            # potential information leak about other JIRA IDs
+        issue = _find_manually_synced_jira_issue(jira, gh_issue)
+        if issue is not None:
+            return issue
 
         if not make_new:
             return None
-        elif retries > 0:
-            # Wait a random amount of time to see if this JIRA issue is still being created by another
-            # GitHub Action. This is a hacky way to try and avoid the case where a GitHub issue is created
-            # and edited in a short window of time, and the two GitHub Actions race each other and produce
-            # two JIRA issues.
-            #
-            # The 'create' event will always create the issue, so it should be processed first unless it's
-            # delayed by more than (retries * min(range)) seconds. This does mean that it can take up to 5
-            # minutes for an old issue (created before the sync was installed), or an issue where the created
-            # event sync failed, to sync in.
-            print('Waiting to see if issue is created by another Action... (retries={})'.format(retries))
-            time.sleep(random.randrange(30, 60))
-            return _find_jira_issue(jira, gh_issue, True, retries - 1)
-        else:
+
+        with _creation_claim(jira, gh_issue) as issue:
+            if issue is not None:
+                return issue
             print('Creating missing issue in JIRA')
-            return _create_jira_issue(jira, gh_issue)
+            issue = _create_jira_issue(jira, gh_issue, prefetch=True)
+            _backfill_comments(jira, gh_issue, issue)
+            return issue
     if len(r) > 1:
         print("WARNING: Remote Link globalID '%s' returns multiple JIRA issues. Using last-updated only." % url)
+    sync_state.get_store().set_jira_key(url, r[0].key)
     return r[0]
 
 
+def _find_manually_synced_jira_issue(jira, gh_issue):
+    """
+    Check if the github title ends in (JIRA-KEY). If we can find that JIRA issue and the JIRA issue description contains the
+    GitHub URL, assume this item was manually synced over, and add the remote link for future lookups.
+    """
+    m = re.search(r"\(([A-Z]+-\d+)\)\s*$", gh_issue["title"])
+    if m is None:
+        return None
+    try:
+        issue = jira.issue(m.group(1))
+        if gh_issue["html_url"] in issue.fields.description:
+            print(
+                "Looks like this JIRA issue %s was manually synced. Adding a remote link for future lookups."
+                % issue.key
+            )
+            _add_remote_link(jira, issue, gh_issue)
+            return issue
+    except JIRAError:
+        pass  # issue doesn't exist or unauthorized
+
+    # note: not logging anything on failure to avoid
+    # potential information leak about other JIRA IDs
+    return None
+
+
+@contextlib.contextmanager
+def _creation_claim(jira, gh_issue):
+    """
+    Context manager which claims the creation of the JIRA issue for gh_issue, so that events on the same GitHub issue
+    which are handled at the same time don't create two JIRA issues (events on a GitHub issue often come in a flurry,
+    for example if someone creates and then edits or labels an issue, and they're not always processed in order.)
+
+    Yields the JIRA issue if it exists once the claim is held (another handler created it, maybe while waiting for the
+    claim). Otherwise yields None, and the caller holds the claim until the end of the 'with' block and should create
+    the JIRA issue.
+
+    The claim is held in the state store (see sync_state.StateStore), which handlers in this process share, and in a
+    JIRA project property (see _claim_shared_creation()), which handlers in other workflow runs see. Handlers waiting
+    for a claim check it every few seconds, and go ahead as soon as it is released, or after JIRA_CREATION_LEASE seconds
+    if it never is. If no handler holds a claim, the JIRA issue is created straight away: the handler of the 'opened'
+    event finds it when it gets the claim.
+    """
+    store = sync_state.get_store()
+    url = gh_issue["html_url"]
+    lease = float(os.environ.get('JIRA_CREATION_LEASE', DEFAULT_CREATION_LEASE))
+    owner = uuid.uuid4().hex
+    delay = 1
+
+    while True:
+        if store.claim_creation(url, owner, lease):
+            claimed = time.time()
+            expiry = _claim_shared_creation(jira, url, owner, lease)
+            if expiry is None:
+                break
+            store.release_creation(url, owner)
+        else:
+            expiry = store.get_creation_claim_expiry(url) or time.time()
+        print('Waiting for JIRA issue to be created by another handler... (claim expires in %.0fs)' % (expiry - time.time()))
+        with sync_trace.span('sleep', 'creation claim'):
+            time.sleep(max(0, min(delay, expiry - time.time())))
+        delay = min(delay * 2, MAX_CLAIM_POLL_INTERVAL)
+
+    try:
+        # the handler which held the claim before may have created the issue, even if we didn't wait for it
+        yield _find_jira_issue(jira, gh_issue, False)
+    finally:
+        _release_shared_creation(jira, url, owner, claimed + lease)
+        store.release_creation(url, owner)
+
+
+_shared_claims_failed = False
+
+
+def _claim_shared_creation(jira, url, owner, lease):
+    """
+    Claim the creation of the JIRA issue for a GitHub URL in a JIRA project property. Returns None if the claim is
+    ours, or else the time when the claim of the other handler expires.
+
+    JIRA can't set a property only if it isn't set already, so the claim is set and then read back CLAIM_SETTLE_TIME
+    seconds later: of the handlers which claim at the same time, only the last one to set it reads back its own claim.
+
+    If the property can't be used (e.g. the JIRA user can't administer the project), only claims in the state store
+    are used for the rest of the run.
+    """
+    global _shared_claims_failed
+    if _shared_claims_failed:
+        return None
+    project = os.environ['JIRA_PROJECT']
+    key = _get_claim_property(url)
+    try:
+        claim = sync_jira.get_project_property(jira, project, key)
+        if claim is None or claim["expires"] <= time.time():
+            sync_jira.set_project_property(jira, project, key, {"url": url, "owner": owner, "expires": time.time() + lease})
+            with sync_trace.span('sleep', 'creation claim'):
+                time.sleep(CLAIM_SETTLE_TIME)
+            claim = sync_jira.get_project_property(jira, project, key)
+    except JIRAError as e:
+        print("WARNING: Could not use JIRA project property %s for the creation claim (%s), only claims in this run "
+              "are seen" % (key, e.status_code))
+        _shared_claims_failed = True
+        return None
+    if claim is None:
+        return time.time()  # released by a handler which claimed at the same time, try again
+    return None if claim["owner"] == owner else claim["expires"]
+
+
+def _release_shared_creation(jira, url, owner, expiry):
+    """
+    Release a claim set by _claim_shared_creation(), which expires at the given time. Once it has expired, the claim is
+    only deleted if it wasn't taken over by another handler.
+    """
+    if _shared_claims_failed:
+        return
+    project = os.environ['JIRA_PROJECT']
+    key = _get_claim_property(url)
+    try:
+        if time.time() >= expiry:
+            claim = sync_jira.get_project_property(jira, project, key)
+            if claim is None or claim["owner"] != owner:
+                return  # taken over by another handler
+        sync_jira.delete_project_property(jira, project, key)
+    except JIRAError as e:
+        print("WARNING: Could not release the creation claim %s (%s), it expires in %.0fs" % (key, e.status_code, expiry - time.time()))
+
+
+def _get_claim_property(url):
+    return CLAIM_PROPERTY_PREFIX + hashlib.sha256(url.encode("utf-8")).hexdigest()[:32]
+
+
+def _find_indexed_jira_issue(jira, gh_issue):
+    """
+    Look up the JIRA issue for this GitHub issue in the local index (see sync_state.StateStore), without
+    running a JQL search.
+
+    The index entry is only trusted if the JIRA issue still has the remote link to the GitHub issue. Returns None
+    if there is no valid entry, and the caller should fall back to searching JIRA.
+    """
+    url = gh_issue["html_url"]
+    store = sync_state.get_store()
+    key = store.get_jira_key(url)
+    if key is None:
+        return None
+
+    try:
+        issue = jira.issue(key, properties=FINGERPRINT_PROPERTY)
+        if any(getattr(link, "globalId", None) == url for link in jira.remote_links(issue.key)):
+            if issue.key != key:
+                store.set_jira_key(url, issue.key)  # issue was moved to another project
+            return issue
+    except JIRAError as e:
+        print("Indexed JIRA issue %s could not be loaded (%s)" % (key, e.status_code))
+
+    print("Index entry for '%s' is stale, searching JIRA instead" % url)
+    store.delete_jira_key(url)
+    return None
+
+
+def _search_jira_issues_by_url(jira, gh_urls):
+    """
+    Find the JIRA issues synced from a list of GitHub URLs, using one JQL search per 50 URLs. Returns a dict of
+    GitHub URL -> JIRA issue key.
+    """
+    return {url: issue.key for url, issue in _search_synced_jira_issues(jira, gh_urls).items()}
+
+
+def _search_synced_jira_issues(jira, gh_urls, fields="summary", properties=None):
+    """
+    Find the JIRA issues synced from a list of GitHub URLs, using one JQL search per 50 URLs. Returns a dict of
+    GitHub URL -> JIRA issue, with the listed fields (and issue properties) loaded.
+
+    The search also returns any other JIRA issue with a link to one of the URLs (e.g. an issue which links to a GitHub
+    issue it mentions, or an issue synced from another repository with the same number in its summary), so the remote
+    links of each result are checked (DEFAULT_SYNC_CONCURRENCY at a time). Where several JIRA issues link to a URL, the
+    one named after it (see _get_summary()) is used, and otherwise the last updated one.
+    """
+    if "summary" not in fields.split(","):
+        fields = "summary," + fields
+    result = {}
+    for i in range(0, len(gh_urls), 50):
+        batch = set(gh_urls[i:i + 50])
+        jql_query = 'issue in issuesWithRemoteLinksByGlobalId(%s) order by updated asc' % ", ".join(
+            '"%s"' % url for url in batch)
+        results = jira.search_issues(jql_query, maxResults=False, fields=fields, properties=properties)
+
+        def get_linked_urls(issue):
+            return {getattr(link, "globalId", None) for link in jira.remote_links(issue.key)} & batch
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=DEFAULT_SYNC_CONCURRENCY) as executor:
+            linked_urls = list(executor.map(sync_trace.propagate(get_linked_urls), results))
+        named = set()
+        for issue, urls in zip(results, linked_urls):  # in update order, so the last updated issue wins
+            m = re.match(r"(GH|PR) #(\d+):", issue.fields.summary)
+            for url in urls:
+                if m and (m.group(1) == "PR") == ("/pull/" in url) and int(m.group(2)) == _get_issue_number(url):
+                    result[url] = issue
+                    named.add(url)
+                elif url not in named:
+                    result[url] = issue
+    return result
+
+
+def _get_issue_number(gh_url):
+    return int(gh_url.rstrip("/").rsplit("/", 1)[1])
+
+
+def rebuild_jira_key_index(jira):
+    """
+    Rebuild the local GitHub URL -> JIRA key index from scratch, for all issues and PRs in the repository.
+    """
+    store = sync_state.get_store()
+    gh_urls = [gh_issue.html_url for gh_issue in sync_github.iterate(get_github_repo().get_issues(state="all"))]
+    print("Looking up JIRA issues for %d GitHub issues and PRs" % len(gh_urls))
+    jira_keys = _search_jira_issues_by_url(jira, gh_urls)
+
+    store.clear_jira_keys()
+    for url, key in jira_keys.items():
+        store.set_jira_key(url, key)
+    print("Indexed %d synced issues" % len(jira_keys))
+
+
 def _leave_jira_issue_comment(jira, event, verb, should_create, jira_issue=None):
     """
     Leave a simple comment that the GitHub issue corresponding to this event was 'verb' by the GitHub user in question.
@@ -513,7 +1196,8 @@ def _leave_jira_issue_comment(jira, event, verb, should_create, jira_issue=None)
     except KeyError:
         user = gh_issue["user"]["login"]
 
-    jira.add_comment(
+    _add_comment(
+        jira,
         jira_issue.id,
         "The [GitHub %s|%s] has been %s by @%s" % ("PR" if is_pr else "issue", gh_issue["html_url"], verb, user),
     )
@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+#
+# Copyright 2024 Espressif Systems (Shanghai) PTE LTD
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""
+HTTP session settings for the JIRA client, so bulk syncing can run several JIRA requests at once.
+
+- Keep-alive connections are pooled, with room for POOL_SIZE connections to the JIRA server (requests only
+  keeps 10 by default, and drops the connections above that after each request).
+- Requests answered with 429 (Too Many Requests) or 503 (Service Unavailable) are retried up to MAX_RETRIES
+  times, after the Retry-After time or an exponential backoff. POST requests (creating issues, adding comments)
+  are only retried after 429, which JIRA answers without handling the request: a 503 may come from a proxy after
+  JIRA handled it, and sending it again would create a second issue or comment. Callers handle these failures
+  instead (see may_have_succeeded()).
+- The number of JIRA requests in flight is limited by an AIMD (additive increase, multiplicative decrease)
+  limit: it grows by one for each round of successful requests, and is halved when JIRA answers 429 or 503.
+
+Also has the JIRA requests the client doesn't have methods for (project properties).
+"""
+import json
+import re
+import threading
+import time
+import urllib.parse
+
+import requests.adapters
+from jira import JIRAError
+from urllib3.util.retry import Retry
+
+import sync_trace
+
+# Number of keep-alive connections kept to the JIRA server, and the most JIRA requests in flight at once
+POOL_SIZE = 16
+# Number of JIRA requests in flight at once to start with
+INITIAL_CONCURRENCY = 4
+# Number of times a request is retried after a 429 or 503 response, or a failed connection
+MAX_RETRIES = 3
+OVERLOAD_STATUSES = (429, 503)
+# Statuses of failed requests which JIRA may have handled anyway (the answer was lost behind a proxy)
+UNCERTAIN_STATUSES = (502, 503, 504)
+# The concurrency limit is halved at most once in this many seconds (requests in flight at the same time
+# usually all get rejected together)
+BACKOFF_INTERVAL = 1.0
+
+_limiter = None
+
+
+def get_limiter():
+    """
+    Return the process-wide AIMDLimiter for JIRA requests.
+    """
+    global _limiter
+    if _limiter is None:
+        _limiter = AIMDLimiter(INITIAL_CONCURRENCY, 1, POOL_SIZE)
+    return _limiter
+
+
+def configure_session(session):
+    """
+    Set up the JIRA client's session (a jira.resilientsession.ResilientSession) as described in the module docstring.
+    """
+    retry = _Retry(total=MAX_RETRIES, connect=MAX_RETRIES, read=0, status=MAX_RETRIES, status_forcelist=OVERLOAD_STATUSES,
+                   backoff_factor=1, respect_retry_after_header=True, raise_on_status=False)
+    adapter = _LimitedHTTPAdapter(get_limiter(), pool_connections=1, pool_maxsize=POOL_SIZE, max_retries=retry)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    session.max_retries = 0  # retried by the adapter instead, ResilientSession would retry each failure again
+
+
+def may_have_succeeded(error):
+    """
+    Return True if JIRA may have handled a request which failed with this JIRAError, so that a POST request shouldn't
+    simply be sent again.
+    """
+    return error.status_code in UNCERTAIN_STATUSES
+
+
+def get_project_property(jira, project, key):
+    """
+    Return the value of a JIRA project property, or None if it isn't set.
+    """
+    try:
+        return jira._get_json('project/%s/properties/%s' % (project, key))['value']
+    except JIRAError as e:
+        if e.status_code == 404:
+            return None
+        raise
+
+
+def set_project_property(jira, project, key, value):
+    """
+    Set a JIRA project property (this needs the Administer Projects permission).
+    """
+    jira._session.put(jira._get_url('project/%s/properties/%s' % (project, key)), data=json.dumps(value))
+
+
+def delete_project_property(jira, project, key):
+    jira._session.delete(jira._get_url('project/%s/properties/%s' % (project, key)))
+
+
+def print_stats():
+    if _limiter is not None:
+        print('JIRA: %d requests, concurrency limit halved %d times, ended at %d' % (
+            _limiter.requests, _limiter.backoffs, _limiter.limit))
+
+
+class AIMDLimiter(object):
+    """
+    Limits the number of requests in flight. The limit grows by one after 'limit' successful requests, and is halved
+    when a request is rejected because the server is overloaded. Safe to use from multiple threads.
+    """
+
+    def __init__(self, initial, minimum, maximum):
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.in_flight = 0
+        self.requests = 0
+        self.backoffs = 0
+        self._last_backoff = None
+        self._condition = threading.Condition()
+
+    def acquire(self):
+        """
+        Wait until another request may be sent.
+        """
+        with self._condition:
+            self._condition.wait_for(lambda: self.in_flight < int(self.limit))
+            self.in_flight += 1
+            self.requests += 1
+
+    def release(self, overloaded=None):
+        """
+        Record that a request finished. overloaded is True if the server rejected it as overloaded, False if it was
+        handled, or None if it failed for another reason (and says nothing about the server's load).
+        """
+        with self._condition:
+            self.in_flight -= 1
+            if overloaded:
+                now = time.monotonic()
+                if self._last_backoff is None or now - self._last_backoff >= BACKOFF_INTERVAL:
+                    self.limit = max(self.minimum, self.limit / 2)
+                    self.backoffs += 1
+                    self._last_backoff = now
+            elif overloaded is not None:
+                self.limit = min(self.maximum, self.limit + 1 / self.limit)
+            self._condition.notify_all()
+
+
+class _Retry(Retry):
+    """
+    Retry which retries idempotent requests after OVERLOAD_STATUSES, and requests of other methods (POST) after 429.
+    """
+
+    def is_retry(self, method, status_code, has_retry_after=False):
+        if status_code == 429 and status_code in self.status_forcelist:
+            return True
+        return super().is_retry(method, status_code, has_retry_after)
+
+
+class _LimitedHTTPAdapter(requests.adapters.HTTPAdapter):
+    """
+    HTTPAdapter which sends each request within the concurrency limit of an AIMDLimiter.
+    """
+
+    def __init__(self, limiter, **kwargs):
+        self.limiter = limiter
+        super().__init__(**kwargs)
+
+    def send(self, request, **kwargs):
+        self.limiter.acquire()
+        overloaded = None
+        try:
+            with sync_trace.span('jira', _get_span_name(request)):
+                response = super().send(request, **kwargs)
+            overloaded = _was_overloaded(response)
+            return response
+        finally:
+            self.limiter.release(overloaded)
+
+
+def _was_overloaded(response):
+    """
+    Return True if the server answered the request (or one of its retries) with 429 or 503.
+    """
+    if response.status_code in OVERLOAD_STATUSES:
+        return True
+    retries = getattr(response.raw, 'retries', None)
+    return any(attempt.status in OVERLOAD_STATUSES for attempt in getattr(retries, 'history', ()))
+
+
+def _get_span_name(request):
+    """
+    Return the name of a JIRA request for tracing: the method and the REST API path, with issue keys, IDs and hashes
+    replaced so that requests of the same kind are counted together (e.g. 'GET issue/{key}/remotelink').
+    """
+    path = urllib.parse.urlsplit(request.url).path
+    path = re.sub(r'^.*?/rest/api/\d+/', '', path)
+    path = re.sub(r'(^|/)[A-Z][A-Z0-9_]*-\d+(?=/|$)', r'\1{key}', path)
+    path = re.sub(r'(^|/)\d+(?=/|$)', r'\1{id}', path)
+    path = re.sub(r'[0-9a-f]{16,}(?=/|$)', '{hash}', path)  # e.g. creation claim properties
+    return '%s %s' % (request.method, path)
@@ -14,30 +14,88 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 #
+import concurrent.futures
 import os
 from jira import JIRA
-from github import Github
-from sync_issue import _find_jira_issue, _create_jira_issue
+from sync_issue import _find_manually_synced_jira_issue, _create_jira_issue, _creation_claim, _search_jira_issues_by_url, get_github_repo
+from sync_issue import DEFAULT_SYNC_CONCURRENCY
+import sync_github
+import sync_state
+import sync_trace
 
 
 def sync_remain_prs(jira):
     """
     Sync remain PRs (i.e. PRs without any comments) to Jira
+
+    The collaborators list is fetched once, and the open PRs which are already synced are found with a few batched
+    JQL searches, so only PRs which need a new JIRA issue cost further requests. Those are created by a pool of
+    DEFAULT_SYNC_CONCURRENCY worker threads.
+
+    The newest PR number checked and any PRs which failed to sync are saved in the state store (see
+    sync_state.StateStore), so later runs only check newer PRs and retry the failed ones. Set the full_sweep input
+    to check all open PRs again.
+    """
+    repo = get_github_repo()
+    store = sync_state.get_store()
+    cursor = None if os.environ.get('INPUT_FULL_SWEEP') else store.get_cursor('remain_prs')
+    if cursor is None:
+        print("Checking all open PRs")
+        cursor = {"number": 0, "failed": []}
+    else:
+        print("Checking open PRs newer than #%d, and retrying %d failed PRs" % (cursor["number"], len(cursor["failed"])))
+
+    prs = []
+    for pr in sync_github.iterate(repo.get_pulls(state="open", sort="created", direction="desc")):
+        if pr.number <= cursor["number"]:
+            break  # this and all older PRs were checked by an earlier run
+        prs.append(pr)
+    checked = {pr.number for pr in prs}
+    for number in cursor["failed"]:
+        if number not in checked:
+            pr = sync_github.call(repo.get_pull, number)
+            if pr.state == "open":
+                prs.append(pr)
+
+    collaborators = {user.login for user in sync_github.iterate(repo.get_collaborators())} if prs else set()
+    gh_issues = [_get_gh_issue(pr) for pr in prs if pr.user.login not in collaborators]
+
+    jira_keys = _search_jira_issues_by_url(jira, [gh_issue["html_url"] for gh_issue in gh_issues])
+    for url, key in jira_keys.items():
+        store.set_jira_key(url, key)
+    print("%d of %d PRs from non-collaborators are synced to JIRA" % (len(jira_keys), len(gh_issues)))
+
+    def sync(gh_issue):
+        try:
+            if _find_manually_synced_jira_issue(jira, gh_issue) is not None:
+                return True
+            with _creation_claim(jira, gh_issue) as issue:
+                if issue is None:
+                    _create_jira_issue(jira, gh_issue)
+            return True
+        except Exception as e:
+            print("Failed to sync PR #%d: %s" % (gh_issue["number"], e))
+            return False
+
+    unsynced = [gh_issue for gh_issue in gh_issues if gh_issue["html_url"] not in jira_keys]
+    with concurrent.futures.ThreadPoolExecutor(max_workers=DEFAULT_SYNC_CONCURRENCY) as executor:
+        results = executor.map(sync_trace.propagate(sync), unsynced)
+        failed = sorted(gh_issue["number"] for gh_issue, ok in zip(unsynced, results) if not ok)
+
+    store.set_cursor('remain_prs', {"number": max(checked | {cursor["number"]}), "failed": failed})
+    if failed:
+        raise RuntimeError("Failed to sync PRs: %s" % ", ".join("#%d" % n for n in failed))
+
+
+def _get_gh_issue(pr):
+    """
+    Mock a github issue using a PR
     """
-    github = Github(os.environ['GITHUB_TOKEN'])
-    repo = github.get_repo(os.environ['GITHUB_REPOSITORY'])
-    prs = repo.get_pulls(state="open", sort="created", direction="desc")
-    for pr in prs:
-        if not repo.has_in_collaborators(pr.user.login):
-            # mock a github issue using current PR
-            gh_issue = {"pull_request": True,
-                        "labels": [{"name": l.name} for l in pr.labels],
-                        "number": pr.number,
-                        "title": pr.title,
-                        "html_url": pr.html_url,
-                        "user": {"login": pr.user.login},
-                        "state": pr.state,
-                        "body": pr.body}
-            issue = _find_jira_issue(jira, gh_issue)
-            if issue is None:
-                _create_jira_issue(jira, gh_issue)
+    return {"pull_request": True,
+            "labels": [{"name": l.name} for l in pr.labels],
+            "number": pr.number,
+            "title": pr.title,
+            "html_url": pr.html_url,
+            "user": {"login": pr.user.login},
+            "state": pr.state,
+            "body": pr.body}
@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+#
+# Copyright 2024 Espressif Systems (Shanghai) PTE LTD
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""
+Reconciliation of the JIRA issues with the GitHub issues and PRs they were synced from, for events which were missed.
+
+Each run lists the GitHub issues and PRs updated since the last run (the 'since' parameter of the GitHub API), and
+compares them with their JIRA issues in batches. Only what differs is fixed:
+
+- the JIRA summary (see sync_issue._get_summary())
+- labels added on GitHub (labels missing on GitHub are left alone, they may have been added in JIRA)
+- the custom GitHub Issue field (Open or Closed)
+- the title and resolved status of the remote link (see sync_issue._update_link_resolved())
+- open issues and PRs (from non-collaborators) without a JIRA issue get one, with their earlier comments
+
+The time of the last reconciled update is saved in the state store after each batch, so an interrupted run resumes
+where it stopped, and each run costs requests in proportion to the number of issues updated since the last run.
+"""
+import concurrent.futures
+import datetime
+import os
+import threading
+
+from jira import JIRAError
+
+import sync_github
+import sync_state
+import sync_trace
+from sync_issue import (DEFAULT_SYNC_CONCURRENCY, FINGERPRINT_PROPERTY, GITHUB_PAGE_SIZE, _backfill_comments,
+                        _check_issue_label, _create_jira_issue, _creation_claim, _find_manually_synced_jira_issue,
+                        _get_github_issues, _get_jira_label, _get_summary, _search_synced_jira_issues,
+                        _update_link_resolved, get_github_repo)
+
+# How far back the first run looks for updated issues, in seconds (set the full_sweep input to check all issues)
+DEFAULT_LOOKBACK = 24 * 60 * 60
+# Number of issues compared with JIRA at a time (one JQL search), and between checkpoints
+BATCH_SIZE = 50
+GITHUB_ISSUE_FIELD = 'customfield_12100'
+_TIME_FORMAT = '%Y-%m-%dT%H:%M:%SZ'
+
+
+def reconcile(jira):
+    """
+    Reconcile the JIRA issues of the GitHub issues and PRs updated since the last run, as described in the module
+    docstring.
+
+    Issues which fail to reconcile are saved in the cursor along with the time, and are tried again in the next run.
+    Set the full_sweep input to check all issues and PRs in the repository.
+    """
+    repo = get_github_repo()
+    store = sync_state.get_store()
+    # issues updated while running are left to the next run, which keeps runs short even if the repo is busy
+    until = datetime.datetime.now(datetime.timezone.utc).replace(microsecond=0)
+    cursor = None if os.environ.get('INPUT_FULL_SWEEP') else store.get_cursor('reconcile')
+    if cursor is None:
+        since = None if os.environ.get('INPUT_FULL_SWEEP') else until - datetime.timedelta(seconds=DEFAULT_LOOKBACK)
+        cursor = {"since": _format_time(since), "failed": []}
+    print("Reconciling issues and PRs updated since %s, and retrying %d failed issues" % (
+        cursor["since"] or "the beginning", len(cursor["failed"])))
+
+    reconciler = _Reconciler(jira, repo)
+    failed = set(cursor["failed"])
+    if failed:
+        failed -= reconciler.run(list(_get_github_issues(sorted(failed)).values()))
+        store.set_cursor('reconcile', dict(cursor, failed=sorted(failed)))
+
+    batch = []
+    for gh_issue in _list_updated_issues(repo, _parse_time(cursor["since"]), until):
+        batch.append(gh_issue)
+        if len(batch) == BATCH_SIZE:
+            failed = _run_batch(reconciler, batch, failed)
+            batch = []
+    if batch:
+        failed = _run_batch(reconciler, batch, failed)
+
+    print("Reconciled %d issues and PRs: %d updated, %d created, %d failed" % (
+        reconciler.checked, reconciler.updated, reconciler.created, len(failed)))
+    if failed:
+        raise RuntimeError("Failed to reconcile issues: %s" % ", ".join("#%d" % n for n in sorted(failed)))
+
+
+def _run_batch(reconciler, batch, failed):
+    """
+    Reconcile a batch of GitHub issues, and save the checkpoint. Returns the updated set of failed issue numbers.
+    """
+    numbers = {gh_issue["number"] for gh_issue in batch}
+    failed = (failed - numbers) | (numbers - reconciler.run(batch))
+    sync_state.get_store().set_cursor('reconcile', {"since": batch[-1]["updated_at"], "failed": sorted(failed)})
+    return failed
+
+
+def _list_updated_issues(repo, since, until):
+    """
+    Yield the GitHub issues and PRs (as dicts, as in webhook payloads) updated between since and until,
+    least recently updated first.
+
+    Each page is listed from the time of the last issue in the previous page, instead of by page number: issues
+    updated while listing move to the end of the list, which would shift the later pages and skip issues.
+    """
+    seen = set()
+    page_number = 0
+    while True:
+        kwargs = {} if since is None else {"since": since}
+        issues = repo.get_issues(state="all", sort="updated", direction="asc", **kwargs)
+        page = [sync_github.get_raw_data(gh_issue) for gh_issue in sync_github.call(issues.get_page, page_number)]
+        for gh_issue in page:
+            if _parse_time(gh_issue["updated_at"]) <= until and (gh_issue["number"], gh_issue["updated_at"]) not in seen:
+                yield gh_issue
+        if len(page) < GITHUB_PAGE_SIZE or _parse_time(page[-1]["updated_at"]) > until:
+            return
+        seen.update((gh_issue["number"], gh_issue["updated_at"]) for gh_issue in page)
+        last = _parse_time(page[-1]["updated_at"])
+        if since is None or last > since:
+            since = last
+            page_number = 0
+        else:
+            page_number += 1  # a whole page of issues updated in the same second
+
+
+def _parse_time(value):
+    if value is None:
+        return None
+    return datetime.datetime.strptime(value, _TIME_FORMAT).replace(tzinfo=datetime.timezone.utc)
+
+
+def _format_time(value):
+    return None if value is None else value.strftime(_TIME_FORMAT)
+
+
+class _Reconciler(object):
+    """
+    Compares batches of GitHub issues with their JIRA issues, and fixes the differences. Counts the issues checked,
+    updated and created.
+    """
+
+    def __init__(self, jira, repo):
+        self.jira = jira
+        self.repo = repo
+        self.checked = 0
+        self.updated = 0
+        self.created = 0
+        self._collaborators = None
+        self._lock = threading.Lock()
+
+    def run(self, gh_issues):
+        """
+        Reconcile a batch of GitHub issues. Returns the set of issue numbers which were reconciled without errors.
+        """
+        skipped = {gh_issue["number"] for gh_issue in gh_issues if self._is_collaborator_pr(gh_issue)}
+        gh_issues = [gh_issue for gh_issue in gh_issues if gh_issue["number"] not in skipped]
+        jira_issues = _search_synced_jira_issues(self.jira, [gh_issue["html_url"] for gh_issue in gh_issues],
+                                                 fields="summary,labels,%s" % GITHUB_ISSUE_FIELD,
+                                                 properties=FINGERPRINT_PROPERTY)
+        store = sync_state.get_store()
+        for url, jira_issue in jira_issues.items():
+            store.set_jira_key(url, jira_issue.key)
+
+        def reconcile_issue(gh_issue):
+            try:
+                jira_issue = jira_issues.get(gh_issue["html_url"])
+                if jira_issue is None:
+                    self._create_missing(gh_issue)
+                else:
+                    self._update(gh_issue, jira_issue)
+                return gh_issue["number"]
+            except Exception as e:
+                print("Failed to reconcile #%d: %s" % (gh_issue["number"], e))
+                return None
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=DEFAULT_SYNC_CONCURRENCY) as executor:
+            done = set(executor.map(sync_trace.propagate(reconcile_issue), gh_issues))
+        self.checked += len(gh_issues)
+        return (done - {None}) | skipped  # PRs from collaborators aren't synced
+
+    def _is_collaborator_pr(self, gh_issue):
+        if "pull_request" not in gh_issue:
+            return False
+        if self._collaborators is None:
+            self._collaborators = {user.login for user in sync_github.iterate(self.repo.get_collaborators())}
+        return gh_issue["user"]["login"] in self._collaborators
+
+    def _create_missing(self, gh_issue):
+        if gh_issue["state"] != "open" or _find_manually_synced_jira_issue(self.jira, gh_issue) is not None:
+            return
+        with _creation_claim(self.jira, gh_issue) as issue:
+            if issue is None:
+                print("Creating missing JIRA issue for #%d" % gh_issue["number"])
+                _backfill_comments(self.jira, gh_issue, _create_jira_issue(self.jira, gh_issue))
+                with self._lock:
+                    self.created += 1
+
+    def _update(self, gh_issue, jira_issue):
+        fields = {}
+        summary = _get_summary(gh_issue)
+        if jira_issue.fields.summary != summary:
+            fields["summary"] = summary
+
+        labels = list(jira_issue.fields.labels)
+        for gh_label in gh_issue["labels"]:
+            label = _get_jira_label(gh_label)
+            if _check_issue_label(label) is not None and label not in labels:
+                labels.append(label)
+        if labels != list(jira_issue.fields.labels):
+            fields["labels"] = labels
+
+        state = 'Open' if gh_issue["state"] == "open" else 'Closed'
+        raw_fields = jira_issue.raw.get("fields", {}) if isinstance(jira_issue.raw, dict) else {}
+        if GITHUB_ISSUE_FIELD in raw_fields and (raw_fields[GITHUB_ISSUE_FIELD] or {}).get("value") != state:
+            fields[GITHUB_ISSUE_FIELD] = {'value': state}
+
+        if fields:
+            print("Updating %s for #%d: %s" % (jira_issue.key, gh_issue["number"], ", ".join(sorted(fields))))
+            try:
+                jira_issue.update(fields=fields)
+            except JIRAError as error:
+                if GITHUB_ISSUE_FIELD not in fields or GITHUB_ISSUE_FIELD not in str(error.text):
+                    raise
+                print(f'Could not set GitHub Issue field when reconciling issue with error: {error}')
+                del fields[GITHUB_ISSUE_FIELD]
+                if fields:
+                    jira_issue.update(fields=fields)
+            with self._lock:
+                self.updated += 1
+
+        _update_link_resolved(self.jira, gh_issue, jira_issue)
@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+#
+# Copyright 2024 Espressif Systems (Shanghai) PTE LTD
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""
+Long-running webhook receiver for the JIRA sync.
+
+Receives GitHub webhook deliveries over HTTP and syncs them with the same handlers as the action
+(see sync_to_jira.handle_event), but connects to JIRA and GitHub only once, and keeps
+the in-memory state (JIRA metadata, Markdown cache, etc.) between events. Events which fail to sync
+are spooled (see sync_spool.py) if JIRA_SYNC_STATE_DIR is set.
+
+Events are handled one at a time in the order they were received, by a worker thread, so deliveries
+are acknowledged straight away (GitHub gives up on a delivery after 10 seconds).
+"""
+import hashlib
+import hmac
+import http.server
+import json
+import os
+import queue
+import threading
+import traceback
+
+import sync_dedupe
+import sync_github
+import sync_jira
+import sync_spool
+import sync_state
+import sync_trace
+import sync_to_jira
+
+# Default port the server listens on
+DEFAULT_PORT = 8080
+# GitHub doesn't send payloads bigger than 25MB
+MAX_PAYLOAD_SIZE = 25 * 1024 * 1024
+
+
+def verify_signature(secret, body, signature):
+    """
+    Return True if signature (the X-Hub-Signature-256 header) is the HMAC of the request body with the webhook secret.
+    """
+    if not signature or not signature.startswith('sha256='):
+        return False
+    expected = hmac.new(secret, body, hashlib.sha256).hexdigest()
+    return hmac.compare_digest(expected, signature[len('sha256='):])
+
+
+class WebhookServer(http.server.HTTPServer):
+    """
+    HTTP server which checks and queues webhook deliveries, and calls handle_event(event_name, event, delivery) for
+    each of them from a worker thread (delivery is the X-GitHub-Delivery header).
+    """
+
+    def __init__(self, address, secret, repository, handle_event):
+        super().__init__(address, _WebhookRequestHandler)
+        self.secret = secret
+        self.repository = repository
+        self.events = queue.Queue()
+        self._handle_event = handle_event
+        self._worker = threading.Thread(target=self._process_events, daemon=True)
+        self._worker.start()
+
+    def _process_events(self):
+        while True:
+            delivery, event_name, event = self.events.get()
+            try:
+                print("Handling delivery %s ('%s' event)" % (delivery, event_name))
+                self._handle_event(event_name, event, delivery)
+            except Exception:
+                print("Failed to handle delivery %s:" % delivery)
+                traceback.print_exc()
+            finally:
+                self.events.task_done()
+
+
+class _WebhookRequestHandler(http.server.BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        # health check
+        self._respond(200, 'ok')
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        if length > MAX_PAYLOAD_SIZE:
+            self._respond(413, 'Payload too large')
+            return
+        body = self.rfile.read(length)
+
+        if not verify_signature(self.server.secret, body, self.headers.get('X-Hub-Signature-256')):
+            self._respond(401, 'Invalid signature')
+            return
+
+        event_name = self.headers.get('X-GitHub-Event')
+        delivery = self.headers.get('X-GitHub-Delivery')
+        try:
+            event = json.loads(body)
+        except ValueError:
+            self._respond(400, 'Invalid JSON payload')
+            return
+
+        if event_name == 'ping':
+            self._respond(200, 'pong')
+            return
+
+        repository = event.get('repository', {}).get('full_name')
+        if repository != self.server.repository:
+            print("Ignoring delivery %s for repository %s" % (delivery, repository))
+            self._respond(202, 'Ignored')
+            return
+
+        self.server.events.put((delivery, event_name, event))
+        self._respond(202, 'Queued')
+
+    def _respond(self, status, message):
+        body = message.encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'text/plain')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def main():
+    secret = os.environ['GITHUB_WEBHOOK_SECRET'].encode('utf-8')
+    repository = os.environ['GITHUB_REPOSITORY']
+    port = int(os.environ.get('JIRA_SYNC_SERVER_PORT', DEFAULT_PORT))
+
+    jira = sync_to_jira.connect_jira()
+
+    def sync_event(event_name, event):
+        sync_to_jira.handle_event(jira, event_name, event)
+
+    def sync_delivery(event_name, event, delivery):
+        # skip redelivered events, and spool the event if it fails
+        sync_dedupe.apply_once(lambda n, e: sync_spool.handle_or_spool(sync_event, n, e), event_name, event, delivery)
+
+    server = WebhookServer(('', port), secret, repository, sync_delivery)
+    print('Listening for GitHub webhooks on port %d' % port)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        sync_state.print_stats()
+        sync_github.print_stats()
+        sync_jira.print_stats()
+        sync_trace.write_report()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+#
+# Copyright 2024 Espressif Systems (Shanghai) PTE LTD
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""
+Spool for GitHub events which fail to sync (for example because JIRA is down or rate limiting us).
+
+Failed events are saved in the state store (see sync_state.StateStore) together with the reason, and
+replayed later in the order they were received. Later events on an issue with spooled events are
+spooled behind them, so the events of each issue are always synced in order. The run still fails (see
+check_spooled()), and the state directory should be saved even so.
+
+Events which fail to replay MAX_REPLAY_ATTEMPTS times are given up on: they're moved out of the spool to the dead
+events, so later events on the same issue are no longer held up behind them. Dead events can be moved back into the
+spool with replay_spool(requeue_dead=True).
+
+Replaying an event doesn't repeat steps which already succeeded: created JIRA issues are found through
+the JIRA key index, mirrored comments through the comment index, and unchanged fields are not written
+again (see sync_issue._get_fingerprint).
+"""
+import threading
+import time
+
+import sync_state
+import sync_trace
+from sync_batch import get_event_issue_url
+
+# Number of spooled events read from the store at a time
+REPLAY_BATCH_SIZE = 50
+# Replay stops after this many batches in a row had failures (JIRA is probably still unavailable)
+MAX_FAILING_BATCHES = 3
+# Maximum wait between batches with failures, in seconds
+MAX_REPLAY_DELAY = 60
+# Number of failed replays after which an event is given up on
+MAX_REPLAY_ATTEMPTS = 10
+
+_failed_events = 0  # events spooled by handle_or_spool() because they failed
+_FAILED_EVENTS_LOCK = threading.Lock()
+
+
+def handle_or_spool(handle_event, event_name, event):
+    """
+    Call handle_event(event_name, event), and spool the event if it fails.
+
+    Events are only spooled if the state is persisted between runs (JIRA_SYNC_STATE_DIR is set), otherwise the
+    exception is raised as before. Spooled events are reported as errors in the summary of the workflow run ('::error::'
+    lines), and check_spooled() fails the run once all events were handled.
+    """
+    global _failed_events
+    store = sync_state.get_store()
+    url = get_event_issue_url(event_name, event)
+    persistent = sync_state.get_state_dir() is not None
+
+    if persistent and url is not None and store.has_spooled_events(url):
+        print('::warning::Earlier events for %s are waiting in the spool, spooling this event behind them' % url)
+        store.spool_event(url, event_name, event, 'Waiting for earlier spooled events')
+        return
+
+    try:
+        handle_event(event_name, event)
+    except Exception as e:
+        if not persistent:
+            raise
+        print("::error::Failed to sync '%s' event for %s, adding it to the spool: %s" % (event_name, url, e))
+        store.spool_event(url, event_name, event, '%s: %s' % (type(e).__name__, e))
+        with _FAILED_EVENTS_LOCK:
+            _failed_events += 1
+
+
+def check_spooled():
+    """
+    Raise RuntimeError if handle_or_spool() spooled any failed events, so that the run fails instead of hiding them.
+    """
+    if _failed_events:
+        raise RuntimeError('Failed to sync %d events, they were added to the spool' % _failed_events)
+
+
+def replay_spool(handle_event, batch_size=REPLAY_BATCH_SIZE, requeue_dead=False):
+    """
+    Replay spooled events in the order they were spooled, calling handle_event(event_name, event) for each one.
+
+    Events which fail again stay in the spool, and so do all later events on the same issue, unless the event has
+    now failed MAX_REPLAY_ATTEMPTS times and is moved to the dead events. Batches with failures are followed by an
+    increasing wait, and replaying stops after MAX_FAILING_BATCHES of them in a row. If requeue_dead is True, the
+    dead events are moved back to the end of the spool first.
+
+    Events which are still failing or were given up on are reported as errors at the end. The run itself succeeds,
+    as the spool already holds them for the next replay.
+    """
+    store = sync_state.get_store()
+    if requeue_dead:
+        print('Moved %d dead events back to the spool' % store.requeue_dead_events())
+    print('Replaying %d spooled events' % store.count_spooled_events())
+    blocked = set()  # issues with an event which failed again
+    replayed = failed = 0
+    last_id = 0
+    failing_batches = 0
+    delay = 1
+
+    while True:
+        batch = store.get_spooled_events(last_id, batch_size)
+        if not batch:
+            break
+        batch_failed = False
+        for spool_id, url, event_name, event, attempts in batch:
+            last_id = spool_id
+            if url is not None and url in blocked:
+                continue
+            print("Replaying '%s' event (%s) for %s, spooled %d times before" % (event_name, event.get('action'), url, attempts + 1))
+            try:
+                handle_event(event_name, event)
+            except Exception as e:
+                print('Replay failed: %s' % e)
+                reason = '%s: %s' % (type(e).__name__, e)
+                failed += 1
+                batch_failed = True
+                if attempts + 1 >= MAX_REPLAY_ATTEMPTS:
+                    print('Giving up on the event after %d failed replays' % (attempts + 1))
+                    store.kill_spooled_event(spool_id, reason)
+                else:
+                    store.update_spooled_event(spool_id, reason)
+                    blocked.add(url)
+                continue
+            store.delete_spooled_event(spool_id)
+            replayed += 1
+
+        if not batch_failed:
+            failing_batches = 0
+            delay = 1
+            continue
+        failing_batches += 1
+        if failing_batches >= MAX_FAILING_BATCHES:
+            print('Replay keeps failing, stopping until the next run')
+            break
+        print('Waiting %ds before replaying more events' % delay)
+        with sync_trace.span('sleep', 'spool replay backoff'):
+            time.sleep(delay)
+        delay = min(delay * 2, MAX_REPLAY_DELAY)
+
+    print('Replayed %d events, %d failed, %d left in the spool' % (replayed, failed, store.count_spooled_events()))
+    if blocked:
+        # '::error::' lines are shown as errors in the summary of the workflow run
+        print('::error::Events for %d issues are still failing to sync to JIRA: %s' % (
+            len(blocked), ', '.join(sorted(url or '(no issue)' for url in blocked))))
+    dead_events = store.get_dead_events()
+    if dead_events:
+        print('::error::Gave up on syncing %d events to JIRA after %d failed replays each (set replay_spool to '
+              '"retry-dead" to try them again):' % (len(dead_events), MAX_REPLAY_ATTEMPTS))
+        for url, event_name, reason, attempts in dead_events:
+            print("  '%s' event for %s: %s" % (event_name, url, reason))
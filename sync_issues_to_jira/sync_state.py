@@ -0,0 +1,467 @@
+#!/usr/bin/env python3
+#
+# Copyright 2024 Espressif Systems (Shanghai) PTE LTD
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""
+State kept by the JIRA sync between runs.
+
+If the JIRA_SYNC_STATE_DIR environment variable is set, state is stored in that directory
+(which can be saved and restored between workflow runs using actions/cache). Otherwise
+state is only kept in memory for the lifetime of the process.
+"""
+import collections
+import hashlib
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+# Default size limit of the Markdown conversion cache, in MB
+DEFAULT_MARKDOWN_CACHE_MB = 50
+
+_markdown_cache = None
+_store = None
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jira_keys (
+    github_url TEXT PRIMARY KEY,
+    jira_key TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS unlinked_issues (
+    github_url TEXT PRIMARY KEY,
+    jira_key TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS creation_claims (
+    github_url TEXT PRIMARY KEY,
+    owner TEXT NOT NULL,
+    expires REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS cursors (
+    name TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS comments (
+    github_comment_id INTEGER PRIMARY KEY,
+    jira_issue_key TEXT NOT NULL,
+    jira_comment_id TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS spool (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    github_url TEXT,
+    event_name TEXT NOT NULL,
+    event TEXT NOT NULL,
+    reason TEXT NOT NULL,
+    attempts INTEGER NOT NULL,
+    queued REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS dead_events (
+    id INTEGER PRIMARY KEY,
+    github_url TEXT,
+    event_name TEXT NOT NULL,
+    event TEXT NOT NULL,
+    reason TEXT NOT NULL,
+    attempts INTEGER NOT NULL,
+    queued REAL NOT NULL,
+    died REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS applied_events (
+    event_key TEXT PRIMARY KEY,
+    applied REAL,
+    expires REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS metadata (
+    name TEXT PRIMARY KEY,
+    value TEXT NOT NULL,
+    fetched REAL NOT NULL
+);
+"""
+
+
+def get_state_dir():
+    """
+    Return the directory where state is persisted, or None if state is only kept in memory.
+    """
+    state_dir = os.environ.get('JIRA_SYNC_STATE_DIR')
+    if not state_dir:
+        return None
+    os.makedirs(state_dir, exist_ok=True)
+    return state_dir
+
+
+def get_markdown_cache():
+    """
+    Return the process-wide cache of Markdown -> JIRA wiki conversions.
+    """
+    global _markdown_cache
+    if _markdown_cache is None:
+        state_dir = get_state_dir()
+        max_mb = float(os.environ.get('JIRA_SYNC_MARKDOWN_CACHE_MB', DEFAULT_MARKDOWN_CACHE_MB))
+        _markdown_cache = MarkdownCache(os.path.join(state_dir, 'markdown') if state_dir else None, int(max_mb * 1024 * 1024))
+    return _markdown_cache
+
+
+def get_store():
+    """
+    Return the process-wide StateStore.
+    """
+    global _store
+    if _store is None:
+        state_dir = get_state_dir()
+        _store = StateStore(os.path.join(state_dir, 'sync_state.db') if state_dir else ':memory:')
+    return _store
+
+
+def print_stats():
+    """
+    Print usage statistics for the state used in this run.
+    """
+    if _markdown_cache is not None:
+        print('Markdown cache: %d hits, %d misses' % (_markdown_cache.hits, _markdown_cache.misses))
+    if _store is not None:
+        print('JIRA key index: %d hits, %d misses, %d stale' % (_store.key_hits, _store.key_misses, _store.key_stale))
+        spooled = _store.count_spooled_events()
+        if spooled:
+            print('Spooled events waiting for replay: %d' % spooled)
+        dead = _store.count_dead_events()
+        if dead:
+            print('Spooled events given up on: %d' % dead)
+
+
+def reset():
+    """
+    Forget all state objects created by this process (the next access creates them again from the environment).
+    """
+    global _markdown_cache, _store
+    _markdown_cache = None
+    if _store is not None:
+        _store.close()
+    _store = None
+
+
+class MarkdownCache(object):
+    """
+    Content-addressed cache of converted text, with a total size limit and least-recently-used eviction.
+
+    Each entry is stored in a file named after the hash of the converter version and the Markdown text. Using
+    an entry updates its modification time, which is the order used for eviction. If path is None, entries are
+    kept in memory only.
+    """
+
+    def __init__(self, path, max_bytes):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._memory = collections.OrderedDict()
+        self._size = 0
+        if path is not None:
+            os.makedirs(path, exist_ok=True)
+            self._size = sum(e.stat().st_size for e in os.scandir(path) if e.is_file())
+
+    @staticmethod
+    def key(markdown, converter_version):
+        return hashlib.sha256(('%s\0%s' % (converter_version, markdown)).encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        """
+        Return the cached value for key, or None if it is not cached.
+        """
+        with self._lock:
+            if self.path is None:
+                value = self._memory.get(key)
+                if value is not None:
+                    self._memory.move_to_end(key)
+            else:
+                entry_path = os.path.join(self.path, key)
+                try:
+                    with open(entry_path, 'r', encoding='utf-8') as f:
+                        value = f.read()
+                    os.utime(entry_path)
+                except FileNotFoundError:
+                    value = None
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            if self.path is None:
+                if key in self._memory:
+                    self._size -= len(self._memory.pop(key).encode('utf-8'))
+                self._memory[key] = value
+                self._size += len(value.encode('utf-8'))
+            else:
+                # write to a temporary file first, so concurrent readers never see a partial entry
+                fd, tmp_path = tempfile.mkstemp(dir=self.path, prefix='.tmp')
+                with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                    f.write(value)
+                entry_path = os.path.join(self.path, key)
+                try:
+                    self._size -= os.path.getsize(entry_path)  # replaced below
+                except FileNotFoundError:
+                    pass
+                self._size += os.path.getsize(tmp_path)
+                os.replace(tmp_path, entry_path)
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        """
+        Remove least recently used entries until the cache is at 90% of its size limit.
+        """
+        target = self.max_bytes * 0.9
+        if self.path is None:
+            while self._memory and self._size > target:
+                _, value = self._memory.popitem(last=False)
+                self._size -= len(value.encode('utf-8'))
+            return
+
+        entries = sorted((e for e in os.scandir(self.path) if e.is_file() and not e.name.startswith('.')),
+                         key=lambda e: e.stat().st_mtime)
+        self._size = sum(e.stat().st_size for e in entries)
+        for entry in entries:
+            if self._size <= target:
+                break
+            try:
+                size = entry.stat().st_size
+                os.unlink(entry.path)
+                self._size -= size
+            except FileNotFoundError:
+                pass  # already evicted by a concurrent run
+
+
+class StateStore(object):
+    """
+    SQLite database holding the sync state which isn't stored in JIRA or GitHub.
+
+    Holds:
+    - An index of GitHub issue URL -> JIRA issue key, used to find the JIRA issue for a GitHub issue without
+      searching JIRA.
+    - JIRA issues which were created but don't have their remote link to the GitHub issue yet, so a failed creation
+      can be finished without creating another JIRA issue.
+    - Claims on creating the JIRA issue for a GitHub issue, so only one handler creates it.
+    - An index of GitHub comment ID -> JIRA issue key & comment ID, for the comments mirrored to JIRA.
+    - A spool of GitHub events which failed to sync, to be replayed later (see sync_spool.py).
+    - The GitHub events which were already synced, so duplicate deliveries are skipped (see sync_dedupe.py).
+    - Cursors, recording how far incremental jobs have got.
+    - JIRA metadata (issue types, project components, etc.) which rarely changes.
+
+    Safe to use from multiple threads.
+    """
+
+    def __init__(self, path):
+        self._db = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._lock = threading.Lock()
+        self.key_hits = 0
+        self.key_misses = 0
+        self.key_stale = 0
+        with self._lock:
+            self._db.executescript(_SCHEMA)
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def _execute(self, sql, params=()):
+        with self._lock:
+            return self._db.execute(sql, params).fetchall()
+
+    def get_jira_key(self, github_url):
+        rows = self._execute('SELECT jira_key FROM jira_keys WHERE github_url = ?', (github_url,))
+        if rows:
+            self.key_hits += 1
+            return rows[0][0]
+        self.key_misses += 1
+        return None
+
+    def set_jira_key(self, github_url, jira_key):
+        self._execute('INSERT OR REPLACE INTO jira_keys (github_url, jira_key) VALUES (?, ?)', (github_url, jira_key))
+
+    def delete_jira_key(self, github_url):
+        """
+        Remove a stale index entry.
+        """
+        self.key_stale += 1
+        self._execute('DELETE FROM jira_keys WHERE github_url = ?', (github_url,))
+
+    def clear_jira_keys(self):
+        self._execute('DELETE FROM jira_keys')
+
+    def get_unlinked_jira_key(self, github_url):
+        rows = self._execute('SELECT jira_key FROM unlinked_issues WHERE github_url = ?', (github_url,))
+        return rows[0][0] if rows else None
+
+    def set_unlinked_jira_key(self, github_url, jira_key):
+        self._execute('INSERT OR REPLACE INTO unlinked_issues (github_url, jira_key) VALUES (?, ?)', (github_url, jira_key))
+
+    def delete_unlinked_jira_key(self, github_url):
+        self._execute('DELETE FROM unlinked_issues WHERE github_url = ?', (github_url,))
+
+    def claim_creation(self, github_url, owner, lease_seconds):
+        """
+        Claim the creation of the JIRA issue for github_url, for lease_seconds. Returns False if another owner holds
+        an unexpired claim.
+        """
+        now = time.time()
+        with self._lock:
+            cursor = self._db.execute(
+                'INSERT INTO creation_claims (github_url, owner, expires) VALUES (?, ?, ?) '
+                'ON CONFLICT (github_url) DO UPDATE SET owner = excluded.owner, expires = excluded.expires '
+                'WHERE creation_claims.owner = excluded.owner OR creation_claims.expires <= ?',
+                (github_url, owner, now + lease_seconds, now))
+            return cursor.rowcount == 1
+
+    def get_creation_claim_expiry(self, github_url):
+        """
+        Return the time when the current claim on creating the JIRA issue for github_url expires, or None if there is
+        no current claim.
+        """
+        rows = self._execute('SELECT expires FROM creation_claims WHERE github_url = ? AND expires > ?', (github_url, time.time()))
+        return rows[0][0] if rows else None
+
+    def release_creation(self, github_url, owner):
+        self._execute('DELETE FROM creation_claims WHERE github_url = ? AND owner = ?', (github_url, owner))
+
+    def get_cursor(self, name):
+        """
+        Return the value saved for cursor 'name', or None if it was never saved.
+        """
+        rows = self._execute('SELECT value FROM cursors WHERE name = ?', (name,))
+        return json.loads(rows[0][0]) if rows else None
+
+    def set_cursor(self, name, value):
+        self._execute('INSERT OR REPLACE INTO cursors (name, value) VALUES (?, ?)', (name, json.dumps(value)))
+
+    def get_metadata(self, name, max_age):
+        """
+        Return the metadata value saved as 'name', or None if it is missing or older than max_age seconds.
+        """
+        rows = self._execute('SELECT value FROM metadata WHERE name = ? AND fetched > ?', (name, time.time() - max_age))
+        return json.loads(rows[0][0]) if rows else None
+
+    def set_metadata(self, name, value):
+        self._execute('INSERT OR REPLACE INTO metadata (name, value, fetched) VALUES (?, ?, ?)', (name, json.dumps(value), time.time()))
+
+    def delete_metadata(self, name):
+        self._execute('DELETE FROM metadata WHERE name = ?', (name,))
+
+    def get_comment(self, github_comment_id):
+        """
+        Return (JIRA issue key, JIRA comment ID) of the mirror of a GitHub comment, or None if it isn't known.
+        """
+        rows = self._execute('SELECT jira_issue_key, jira_comment_id FROM comments WHERE github_comment_id = ?', (github_comment_id,))
+        return rows[0] if rows else None
+
+    def set_comment(self, github_comment_id, jira_issue_key, jira_comment_id):
+        self._execute('INSERT OR REPLACE INTO comments (github_comment_id, jira_issue_key, jira_comment_id) VALUES (?, ?, ?)',
+                      (github_comment_id, jira_issue_key, jira_comment_id))
+
+    def delete_comment(self, github_comment_id):
+        self._execute('DELETE FROM comments WHERE github_comment_id = ?', (github_comment_id,))
+
+    def spool_event(self, github_url, event_name, event, reason):
+        self._execute('INSERT INTO spool (github_url, event_name, event, reason, attempts, queued) VALUES (?, ?, ?, ?, 0, ?)',
+                      (github_url, event_name, json.dumps(event), reason, time.time()))
+
+    def get_spooled_events(self, after_id, limit):
+        """
+        Return up to 'limit' spooled events with IDs greater than after_id, oldest first, as a list of
+        (ID, GitHub URL, event name, event, attempts) tuples.
+        """
+        rows = self._execute('SELECT id, github_url, event_name, event, attempts FROM spool WHERE id > ? ORDER BY id LIMIT ?',
+                             (after_id, limit))
+        return [(row[0], row[1], row[2], json.loads(row[3]), row[4]) for row in rows]
+
+    def has_spooled_events(self, github_url):
+        return bool(self._execute('SELECT 1 FROM spool WHERE github_url = ? LIMIT 1', (github_url,)))
+
+    def count_spooled_events(self):
+        return self._execute('SELECT COUNT(*) FROM spool')[0][0]
+
+    def update_spooled_event(self, spool_id, reason):
+        """
+        Record another failed attempt to replay a spooled event.
+        """
+        self._execute('UPDATE spool SET reason = ?, attempts = attempts + 1 WHERE id = ?', (reason, spool_id))
+
+    def delete_spooled_event(self, spool_id):
+        self._execute('DELETE FROM spool WHERE id = ?', (spool_id,))
+
+    def kill_spooled_event(self, spool_id, reason):
+        """
+        Record another failed attempt to replay a spooled event, and move it out of the spool to the dead events.
+        """
+        with self._lock:
+            with self._db:
+                self._db.execute('BEGIN')
+                self._db.execute('INSERT INTO dead_events (id, github_url, event_name, event, reason, attempts, queued, died) '
+                                 'SELECT id, github_url, event_name, event, ?, attempts + 1, queued, ? FROM spool WHERE id = ?',
+                                 (reason, time.time(), spool_id))
+                self._db.execute('DELETE FROM spool WHERE id = ?', (spool_id,))
+
+    def get_dead_events(self):
+        """
+        Return the events which were given up on, oldest first, as a list of (GitHub URL, event name, reason, attempts).
+        """
+        return self._execute('SELECT github_url, event_name, reason, attempts FROM dead_events ORDER BY id')
+
+    def count_dead_events(self):
+        return self._execute('SELECT COUNT(*) FROM dead_events')[0][0]
+
+    def requeue_dead_events(self):
+        """
+        Move the dead events back to the end of the spool, with their attempts reset. Returns the number of events moved.
+        """
+        with self._lock:
+            with self._db:
+                self._db.execute('BEGIN')
+                moved = self._db.execute('INSERT INTO spool (github_url, event_name, event, reason, attempts, queued) '
+                                         'SELECT github_url, event_name, event, reason, 0, queued FROM dead_events ORDER BY id').rowcount
+                self._db.execute('DELETE FROM dead_events')
+        return moved
+
+    def claim_event(self, event_key, lease_seconds):
+        """
+        Claim the syncing of an event for lease_seconds. Returns False if the event was already synced, or another
+        handler is syncing it.
+        """
+        now = time.time()
+        with self._lock:
+            cursor = self._db.execute(
+                'INSERT INTO applied_events (event_key, applied, expires) VALUES (?, NULL, ?) '
+                'ON CONFLICT (event_key) DO UPDATE SET expires = excluded.expires '
+                'WHERE applied_events.applied IS NULL AND applied_events.expires <= ?',
+                (event_key, now + lease_seconds, now))
+            return cursor.rowcount == 1
+
+    def mark_event_applied(self, event_key):
+        self._execute('UPDATE applied_events SET applied = ? WHERE event_key = ?', (time.time(), event_key))
+
+    def release_event(self, event_key):
+        """
+        Release the claim on an event which failed to sync, so it can be synced again.
+        """
+        self._execute('DELETE FROM applied_events WHERE event_key = ? AND applied IS NULL', (event_key,))
+
+    def prune_applied_events(self, max_age):
+        """
+        Forget events which were synced more than max_age seconds ago.
+        """
+        self._execute('DELETE FROM applied_events WHERE applied < ?', (time.time() - max_age,))
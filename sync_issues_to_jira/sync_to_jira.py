@@ -23,20 +23,103 @@ warnings.warn(
 )
 
 from jira import JIRA
-from github import Github
 import os
 import sys
 import json
+import threading
+from sync_batch import sync_event_batch
+from sync_dedupe import apply_once
 from sync_pr import sync_remain_prs
+from sync_reconcile import reconcile
+from sync_spool import check_spooled, handle_or_spool, replay_spool
 from sync_issue import *
+import sync_github
+import sync_jira
+import sync_state
+import sync_trace
 
 
 
 class _JIRA(JIRA):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        sync_jira.configure_session(self._session)  # pooled connections, retries and a concurrency limit
+
     def applicationlinks(self):
         return []  # disable this function as we don't need it and it makes add_remote_links() slow
 
 
+class LazyJIRA(object):
+    """
+    Stands in for the JIRA client, and only connects to JIRA (which takes a few requests) when the client is first
+    used. Events which are skipped never connect at all.
+    """
+
+    def __init__(self, connect):
+        self._connect = connect
+        self._client = None
+        self._lock = threading.Lock()
+
+    def _get_client(self):
+        with self._lock:
+            if self._client is None:
+                self._client = self._connect()
+            return self._client
+
+    def connect_async(self):
+        """
+        Start connecting in the background, while doing something else which may still decide to skip the event.
+        """
+        def connect():
+            try:
+                self._get_client()
+            except Exception:
+                pass  # raised again when the client is used
+        threading.Thread(target=sync_trace.propagate(connect), daemon=True).start()
+
+    def __getattr__(self, name):
+        return getattr(self._get_client(), name)
+
+
+# Longest event summary printed by log_event(), in characters
+MAX_EVENT_LOG_LENGTH = 1000
+
+ACTION_HANDLERS = {
+    'issues': {
+        'opened': handle_issue_opened,
+        'edited': handle_issue_edited,
+        'closed': handle_issue_closed,
+        'deleted': handle_issue_deleted,
+        'reopened': handle_issue_reopened,
+        'labeled': handle_issue_labeled,
+        'unlabeled': handle_issue_unlabeled,
+    },
+    'issue_comment': {
+        'created': handle_comment_created,
+        'edited': handle_comment_edited,
+        'deleted': handle_comment_deleted,
+    },
+}
+
+
+def connect_jira():
+    """
+    Connect to the JIRA server configured in the environment.
+    """
+    print('Connecting to Jira Server...')
+
+    # Check if the JIRA_PASS is token or password
+    token_or_pass = os.environ['JIRA_PASS']
+    with sync_trace.span('jira', 'connect'):
+        if token_or_pass.startswith('token:'):
+            print("Authenticating with JIRA_TOKEN ...")
+            token = token_or_pass[6:]  # Strip the 'token:' prefix
+            return _JIRA(os.environ['JIRA_URL'], token_auth=token)
+        else:
+            print("Authenticating with JIRA_USER and JIRA_PASS ...")
+            return _JIRA(os.environ['JIRA_URL'], basic_auth=(os.environ['JIRA_USER'], token_or_pass))
+
+
 def main():
     if 'GITHUB_REPOSITORY' not in os.environ:
         print('Not running in GitHub action context, nothing to do')
@@ -46,30 +129,50 @@ def main():
         print('Not an Espressif repo, nothing to sync to JIRA')
         return
 
-    # Connect to Jira server
-    print('Connecting to Jira Server...')
+    jira = LazyJIRA(connect_jira)
 
-    # Check if the JIRA_PASS is token or password
-    token_or_pass = os.environ['JIRA_PASS']
-    if token_or_pass.startswith('token:'):
-        print("Authenticating with JIRA_TOKEN ...")
-        token = token_or_pass[6:]  # Strip the 'token:' prefix
-        jira = _JIRA(os.environ['JIRA_URL'], token_auth=token)
-    else:
-        print("Authenticating with JIRA_USER and JIRA_PASS ...")
-        jira = _JIRA(os.environ['JIRA_URL'], basic_auth=(os.environ['JIRA_USER'], token_or_pass))
+    # Rebuild the local GitHub URL -> JIRA key index if requested
+    if os.environ.get('INPUT_REBUILD_INDEX'):
+        with sync_trace.handler('rebuild_index'):
+            rebuild_jira_key_index(jira)
+        return
 
     # Check if it's a cron job
     if os.environ.get('INPUT_CRON_JOB'):
-        sync_remain_prs(jira)
+        with sync_trace.handler('cron_job'):
+            sync_remain_prs(jira)
+        return
+
+    # Fix the JIRA issues of GitHub issues updated since the last reconciliation (see sync_reconcile.py)
+    if os.environ.get('INPUT_RECONCILE'):
+        with sync_trace.handler('reconcile'):
+            reconcile(jira)
+        return
+
+    def sync_event(event_name, event):
+        handle_event(jira, event_name, event)
+
+    def sync_new_event(event_name, event):
+        # skip duplicates, and spool the event if it fails
+        apply_once(lambda n, e: handle_or_spool(sync_event, n, e), event_name, event)
+
+    # Replay events which failed to sync earlier (see sync_spool.py)
+    if os.environ.get('INPUT_REPLAY_SPOOL'):
+        replay_spool(sync_event, requeue_dead=os.environ['INPUT_REPLAY_SPOOL'] == 'retry-dead')
+        return
+
+    # Apply a backlog of queued events (see sync_batch.py)
+    if os.environ.get('INPUT_EVENTS_FILE'):
+        sync_event_batch(os.environ['INPUT_EVENTS_FILE'], sync_new_event)
+        check_spooled()
         return
 
     # The path of the file with the complete webhook event payload. For example, /github/workflow/event.json.
     with open(os.environ['GITHUB_EVENT_PATH'], 'r') as f:
         event = json.load(f)
-        print(json.dumps(event, indent=4))
 
     event_name = os.environ['GITHUB_EVENT_NAME']
+    log_event(event_name, event)
 
     # Check if event is workflow_dispatch and action is mirror issues. If so, run manual mirroring and skip rest of the script. Works both for issues and pull requests.
     if event_name == 'workflow_dispatch':
@@ -89,12 +192,62 @@ def main():
             return
 
         print(f'Starting manual sync of issues: {issue_numbers}')
-        sync_issues_manually(jira, event)
+        with sync_trace.handler('workflow_dispatch.mirror-issues'):
+            sync_issues_manually(jira, event)
         return
 
-    # The name of the webhook event that triggered the workflow.
-    action = event["action"]
+    sync_new_event(event_name, event)
+    check_spooled()
+
+
+def log_event(event_name, event):
+    """
+    Print a one-line summary of a webhook event (the IDs, action, sender and labels), at most MAX_EVENT_LOG_LENGTH
+    characters long. The full payload of a PR event, with its repository objects, can be megabytes of JSON.
+
+    If JIRA_SYNC_EVENT_DUMP is set, the full payload is also written to that file, for debugging.
+    """
+    line = json.dumps(get_event_summary(event_name, event))
+    if len(line) > MAX_EVENT_LOG_LENGTH:
+        line = line[:MAX_EVENT_LOG_LENGTH - 4] + ' ...'
+    print('Event: %s' % line)
+
+    dump_path = os.environ.get('JIRA_SYNC_EVENT_DUMP')
+    if dump_path:
+        with open(dump_path, 'w') as f:
+            json.dump(event, f, indent=4)
+        print('Full event payload written to %s' % dump_path)
+
 
+def get_event_summary(event_name, event):
+    """
+    Return the fields of a webhook event which identify what happened, as a dict.
+    """
+    summary = {'event': event_name, 'action': event.get('action')}
+    gh_issue = event.get('issue') or event.get('pull_request')
+    if isinstance(gh_issue, dict):
+        summary['number'] = gh_issue.get('number')
+        summary['url'] = gh_issue.get('html_url')
+        summary['state'] = gh_issue.get('state')
+        summary['user'] = (gh_issue.get('user') or {}).get('login')
+        summary['labels'] = [label.get('name') for label in gh_issue.get('labels') or []]
+    if isinstance(event.get('comment'), dict):
+        summary['comment'] = event['comment'].get('id')
+    if isinstance(event.get('label'), dict):
+        summary['label'] = event['label'].get('name')
+    if isinstance(event.get('sender'), dict):
+        summary['sender'] = event['sender'].get('login')
+    if event.get('inputs'):
+        summary['inputs'] = event['inputs']  # workflow_dispatch
+    return summary
+
+
+def handle_event(jira, event_name, event):
+    """
+    Sync a single 'issues', 'pull_request' or 'issue_comment' event to JIRA, using the handler in ACTION_HANDLERS.
+
+    Also used by the webhook server (sync_server.py), which passes the same jira object for every event.
+    """
     if event_name == 'pull_request':
         # Treat pull request events just like issues events for syncing purposes
         # (we can check the 'pull_request' key in the "issue" later to know if this is an issue or a PR)
@@ -103,39 +256,34 @@ def main():
         if "pull_request" not in event["issue"]:
             event["issue"]["pull_request"] = True  # we don't care about the value
 
-    # don't sync if user is our collaborator
-    github = Github(os.environ['GITHUB_TOKEN'])
-    repo = github.get_repo(os.environ['GITHUB_REPOSITORY'])
-    gh_issue = event["issue"]
-    is_pr = "pull_request" in gh_issue
-    if is_pr and repo.has_in_collaborators(gh_issue["user"]["login"]):
-        print("Skipping issue sync for Pull Request from collaborator")
+    if event_name not in ACTION_HANDLERS:
+        print("No handler for event '%s'. Skipping." % event_name)
         return
 
-    action_handlers = {
-        'issues': {
-            'opened': handle_issue_opened,
-            'edited': handle_issue_edited,
-            'closed': handle_issue_closed,
-            'deleted': handle_issue_deleted,
-            'reopened': handle_issue_reopened,
-            'labeled': handle_issue_labeled,
-            'unlabeled': handle_issue_unlabeled,
-        },
-        'issue_comment': {
-            'created': handle_comment_created,
-            'edited': handle_comment_edited,
-            'deleted': handle_comment_deleted,
-        },
-    }
-
-    if event_name not in action_handlers:
-        print("No handler for event '%s'. Skipping." % event_name)
-    elif action not in action_handlers[event_name]:
+    # The name of the webhook event that triggered the workflow.
+    action = event["action"]
+    if action not in ACTION_HANDLERS[event_name]:
         print("No handler '%s' action '%s'. Skipping." % (event_name, action))
-    else:
-        action_handlers[event_name][action](jira, event)
+        return
+
+    with sync_trace.handler('%s.%s' % (event_name, action)):
+        # don't sync if user is our collaborator
+        gh_issue = event["issue"]
+        is_pr = "pull_request" in gh_issue
+        if is_pr and isinstance(jira, LazyJIRA):
+            jira.connect_async()  # while asking GitHub
+        if is_pr and sync_github.call(get_github_repo().has_in_collaborators, gh_issue["user"]["login"]):
+            print("Skipping issue sync for Pull Request from collaborator")
+            return
+
+        ACTION_HANDLERS[event_name][action](jira, event)
 
 
 if __name__ == "__main__":
-    main()
+    try:
+        main()
+    finally:
+        sync_state.print_stats()
+        sync_github.print_stats()
+        sync_jira.print_stats()
+        sync_trace.write_report()
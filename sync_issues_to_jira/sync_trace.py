@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+#
+# Copyright 2024 Espressif Systems (Shanghai) PTE LTD
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""
+Timing of the JIRA requests, GitHub calls, subprocesses and sleeps made while syncing.
+
+Tracing is enabled by setting JIRA_SYNC_TRACE_DIR. Each timed step is a span with a category ('jira', 'github',
+'subprocess', 'sleep' or 'handler'), a name (e.g. 'GET issue/{key}') and the handler it was made for (e.g.
+'issues.opened'). At the end of the run write_report() saves a summary of the spans as sync-trace-summary.json in
+JIRA_SYNC_TRACE_DIR, and if JIRA_SYNC_TRACE_CHROME is also set, every span as sync-trace.json in the Chrome trace
+format (open it in chrome://tracing or https://ui.perfetto.dev).
+
+When tracing is disabled span() returns a shared no-op context manager, so instrumented code costs next to nothing.
+"""
+import contextlib
+import json
+import os
+import threading
+import time
+
+# Most spans kept for the Chrome trace (the summary always counts all of them)
+MAX_TRACE_SPANS = 100000
+
+_enabled = None
+_lock = threading.Lock()
+_local = threading.local()
+_start = time.perf_counter()
+_spans = []  # (category, name, handler, start, duration, thread ID) for the Chrome trace
+_dropped = 0
+_totals = {}  # (category, name) -> [count, total seconds, longest seconds]
+_handler_totals = {}  # (handler, category) -> [count, total seconds]
+_NO_SPAN = contextlib.nullcontext()
+
+
+def is_enabled():
+    global _enabled
+    if _enabled is None:
+        _enabled = bool(os.environ.get('JIRA_SYNC_TRACE_DIR'))
+    return _enabled
+
+
+def reset():
+    """
+    Forget all spans, and check JIRA_SYNC_TRACE_DIR again on the next span.
+    """
+    global _enabled, _start, _dropped
+    with _lock:
+        _enabled = None
+        _start = time.perf_counter()
+        _spans.clear()
+        _dropped = 0
+        _totals.clear()
+        _handler_totals.clear()
+
+
+def span(category, name):
+    """
+    Return a context manager timing the step in its 'with' block.
+    """
+    if not is_enabled():
+        return _NO_SPAN
+    return _Span(category, name)
+
+
+def get_handler():
+    """
+    Return the name of the handler running in this thread, or None.
+    """
+    return getattr(_local, 'handler', None)
+
+
+@contextlib.contextmanager
+def handler(name):
+    """
+    Context manager labelling the spans in its 'with' block (in this thread) with the handler name, and timing it.
+    """
+    previous = get_handler()
+    _local.handler = name
+    try:
+        with span('handler', name):
+            yield
+    finally:
+        _local.handler = previous
+
+
+def propagate(fn):
+    """
+    Return a function calling fn with the current handler name, to label the spans of work done in another thread.
+    """
+    if not is_enabled():
+        return fn
+    name = get_handler()
+
+    def call_in_handler(*args, **kwargs):
+        previous = get_handler()
+        _local.handler = name
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _local.handler = previous
+    return call_in_handler
+
+
+def get_summary():
+    """
+    Return the summary of the spans recorded so far, as written to sync-trace-summary.json.
+    """
+    with _lock:
+        totals = sorted(_totals.items(), key=lambda item: -item[1][1])
+        handler_totals = sorted(_handler_totals.items(), key=lambda item: (item[0][0] or '', item[0][1]))
+        summary = {
+            'wall_time': round(time.perf_counter() - _start, 6),
+            'spans': [{'category': category, 'name': name, 'count': count, 'total': round(total, 6),
+                       'max': round(longest, 6)} for (category, name), (count, total, longest) in totals],
+            'handlers': {},
+        }
+        for (handler_name, category), (count, total) in handler_totals:
+            summary['handlers'].setdefault(handler_name or '(none)', {})[category] = {'count': count, 'total': round(total, 6)}
+        summary['dropped_trace_spans'] = _dropped
+    return summary
+
+
+def write_report():
+    """
+    Write the span summary (and Chrome trace, if JIRA_SYNC_TRACE_CHROME is set) to JIRA_SYNC_TRACE_DIR.
+    """
+    if not is_enabled():
+        return
+    trace_dir = os.environ['JIRA_SYNC_TRACE_DIR']
+    os.makedirs(trace_dir, exist_ok=True)
+    summary = get_summary()
+    with open(os.path.join(trace_dir, 'sync-trace-summary.json'), 'w') as f:
+        json.dump(summary, f, indent=2)
+    print('Trace: %.1fs in total, %s' % (summary['wall_time'], ', '.join(
+        '%s %d calls %.1fs' % (category, count, total) for category, count, total in _get_category_totals(summary))))
+
+    if os.environ.get('JIRA_SYNC_TRACE_CHROME'):
+        pid = os.getpid()
+        with _lock:
+            events = [{'name': name, 'cat': category, 'ph': 'X', 'ts': round((start - _start) * 1e6),
+                       'dur': round(duration * 1e6), 'pid': pid, 'tid': thread, 'args': {'handler': handler_name}}
+                      for category, name, handler_name, start, duration, thread in _spans]
+        with open(os.path.join(trace_dir, 'sync-trace.json'), 'w') as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+    print('Trace written to %s' % trace_dir)
+
+
+def _get_category_totals(summary):
+    totals = {}
+    for entry in summary['spans']:
+        if entry['category'] != 'handler':
+            count, total = totals.get(entry['category'], (0, 0))
+            totals[entry['category']] = (count + entry['count'], total + entry['total'])
+    return [(category, count, total) for category, (count, total) in sorted(totals.items())]
+
+
+def _record(category, name, start, duration):
+    global _dropped
+    handler_name = get_handler()
+    with _lock:
+        totals = _totals.get((category, name))
+        if totals is None:
+            _totals[(category, name)] = [1, duration, duration]
+        else:
+            totals[0] += 1
+            totals[1] += duration
+            totals[2] = max(totals[2], duration)
+        if category != 'handler':
+            handler_totals = _handler_totals.setdefault((handler_name, category), [0, 0.0])
+            handler_totals[0] += 1
+            handler_totals[1] += duration
+        if len(_spans) < MAX_TRACE_SPANS:
+            _spans.append((category, name, handler_name, start, duration, threading.get_ident()))
+        else:
+            _dropped += 1
+
+
+class _Span(object):
+    __slots__ = ('category', 'name', 'start')
+
+    def __init__(self, category, name):
+        self.category = category
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        _record(self.category, self.name, self.start, time.perf_counter() - self.start)
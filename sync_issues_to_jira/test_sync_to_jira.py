@@ -14,18 +14,59 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 #
+import concurrent.futures
+import contextlib
+import datetime
+import io
 import jira
 import github
 import json
+import markdown2wiki
+import benchmark_handlers
+import sync_batch
+import sync_dedupe
+import sync_github
 import sync_to_jira
 import sync_issue
+import sync_jira
+import sync_pr
+import sync_reconcile
+import sync_server
+import sync_spool
+import sync_state
+import sync_trace
 import os
+import re
 import unittest
 import unittest.mock
 from unittest.mock import create_autospec
 import tempfile
+import threading
+import time
+import types
+import urllib.error
+import urllib.request
 
 MOCK_GITHUB_TOKEN = "iamagithubtoken"
+# the real clients, which run_sync_issue() replaces with mocks
+REAL_JIRA_CLASS = sync_to_jira._JIRA
+REAL_GITHUB_CLASS = sync_issue.Github
+# JIRA project properties (creation claims), which the JIRA mocks don't keep: see setUpModule()
+PROJECT_PROPERTIES = {}
+REAL_PROJECT_PROPERTY_FUNCTIONS = {name: getattr(sync_jira, name) for name in (
+    'get_project_property', 'set_project_property', 'delete_project_property')}
+
+
+def setUpModule():
+    patchers = [unittest.mock.patch.multiple(
+        sync_jira,
+        get_project_property=lambda jira, project, key: PROJECT_PROPERTIES.get(key),
+        set_project_property=lambda jira, project, key, value: PROJECT_PROPERTIES.__setitem__(key, value),
+        delete_project_property=lambda jira, project, key: PROJECT_PROPERTIES.pop(key, None)),
+        unittest.mock.patch.object(sync_issue, 'CLAIM_SETTLE_TIME', 0)]
+    for patcher in patchers:
+        patcher.start()
+        unittest.addModuleCleanup(patcher.stop)
 
 
 def run_sync_issue(event_name, event, jira_issue=None):
@@ -50,6 +91,7 @@ def run_sync_issue(event_name, event, jira_issue=None):
         os.environ['JIRA_USER'] = 'test_user'
         os.environ['JIRA_PASS'] = 'test_pass'
         os.environ['GITHUB_REPOSITORY'] = 'espressif/fake'
+        os.environ.pop('GITHUB_API_URL', None)
 
         github_class = create_autospec(github.Github)
 
@@ -59,6 +101,8 @@ def run_sync_issue(event_name, event, jira_issue=None):
         github_class.return_value.get_repo.return_value.has_in_collaborators.return_value = False
 
         jira_class = create_autospec(jira.JIRA)
+        jira_class.return_value.create_issue.return_value.key = "TEST-1"
+        jira_class.return_value.add_comment.return_value.id = "10001"
 
         # fake a issue_types response also
         issue_type_bug = create_autospec(jira.resources.IssueType)
@@ -77,6 +121,12 @@ def run_sync_issue(event_name, event, jira_issue=None):
             issue_type_new_feature,
         ]
 
+        project = create_autospec(jira.resources.Project)
+        project.id = "10000"
+        project.key = "TEST"
+        project.name = "Test project"
+        jira_class.return_value.project.return_value = project
+
         if jira_issue is not None:
             jira_class.return_value.search_issues.return_value = [jira_issue]
             remote_link = create_autospec(jira.resources.RemoteLink)
@@ -91,8 +141,10 @@ def run_sync_issue(event_name, event, jira_issue=None):
             jira_class.return_value.search_issues.return_value = []
 
         sync_to_jira._JIRA = jira_class
-        sync_to_jira.Github = github_class
         sync_issue.Github = github_class
+        sync_issue._github_repo = None  # connect to the mock GitHub API on first use
+        sync_github._limiter = None
+        sync_state.reset()  # each run starts without any state, like a new action container
         sync_to_jira.main()
 
         return jira_class.return_value  # mock JIRA object
@@ -101,6 +153,24 @@ def run_sync_issue(event_name, event, jira_issue=None):
         os.unlink(event_file.name)
 
 
+@contextlib.contextmanager
+def github_stand_in(issues):
+    """
+    Point get_github_repo() at a stand-in for the GitHub API with these issues (see benchmark_handlers.py), using the
+    real GitHub client. Yields the stand-in server, which counts the requests it answers.
+    """
+    server = benchmark_handlers.GitHubStandIn(0, issues).start()
+    env = {'GITHUB_API_URL': server.url, 'GITHUB_TOKEN': MOCK_GITHUB_TOKEN, 'GITHUB_REPOSITORY': benchmark_handlers.REPOSITORY}
+    try:
+        with unittest.mock.patch.dict(os.environ, env), \
+                unittest.mock.patch.object(sync_issue, 'Github', REAL_GITHUB_CLASS), \
+                unittest.mock.patch.object(sync_issue, '_github_repo', None), \
+                unittest.mock.patch.object(sync_github, '_limiter', None):
+            yield server
+    finally:
+        server.stop()
+
+
 class TestIssuesEvents(unittest.TestCase):
 
     def test_issue_opened(self):
@@ -145,6 +215,115 @@ class TestIssuesEvents(unittest.TestCase):
         update_args = issue_obj.edit.call_args[1]
         self.assertIn("title", update_args)
 
+    def test_issue_created_with_two_requests(self):
+        sync_state.reset()
+        self.addCleanup(sync_state.reset)
+        m_jira = create_autospec(jira.JIRA)(None)
+        m_jira.create_issue.return_value.key = "TEST-5"
+        gh_issue = {"html_url": "https://github.com/espressif/fake/issues/5",
+                    "number": 5,
+                    "title": "Closed issue",
+                    "body": "",
+                    "user": {"login": "testuser"},
+                    "labels": [],
+                    "state": "closed",
+                    }
+        # metadata is already cached from earlier runs
+        sync_state.get_store().set_metadata('project:TEST', {"id": "10000", "key": "TEST"})
+        sync_state.get_store().set_metadata('issue_types', [{"id": "3", "name": "Task"}])
+
+        with unittest.mock.patch.dict(os.environ, {'JIRA_PROJECT': 'TEST'}), \
+                unittest.mock.patch.object(sync_issue, '_update_github_with_jira_key'):
+            sync_issue._create_jira_issue(m_jira, gh_issue)
+
+        self.assertEqual(["create_issue", "add_remote_link"], [call[0] for call in m_jira.method_calls])
+        fields = m_jira.create_issue.call_args[0][0]
+        self.assertEqual({"value": "Closed"}, fields["customfield_12100"])
+        self.assertEqual({"id": "10000"}, fields["project"])
+        self.assertEqual({"id": "3"}, fields["issuetype"])
+        destination = m_jira.add_remote_link.call_args[1]["destination"]
+        self.assertEqual({"resolved": True}, destination["status"])
+        m_jira.create_issue.return_value.update.assert_not_called()
+
+    def test_issue_created_without_custom_field(self):
+        sync_state.reset()
+        self.addCleanup(sync_state.reset)
+        m_jira = create_autospec(jira.JIRA)(None)
+        m_issue = unittest.mock.Mock(key="TEST-6")
+        m_jira.create_issue.side_effect = [jira.JIRAError(status_code=400, text="Field 'customfield_12100' cannot be set"), m_issue]
+        gh_issue = {"html_url": "https://github.com/espressif/fake/issues/6",
+                    "number": 6,
+                    "title": "Open issue",
+                    "body": "",
+                    "user": {"login": "testuser"},
+                    "labels": [],
+                    "state": "open",
+                    }
+        sync_state.get_store().set_metadata('project:TEST', {"id": "10000", "key": "TEST"})
+        sync_state.get_store().set_metadata('issue_types', [])
+
+        with unittest.mock.patch.dict(os.environ, {'JIRA_PROJECT': 'TEST'}), \
+                unittest.mock.patch.object(sync_issue, '_update_github_with_jira_key'):
+            sync_issue._create_jira_issue(m_jira, gh_issue)
+
+        self.assertNotIn("customfield_12100", m_jira.create_issue.call_args[0][0])
+        m_issue.update.assert_called_once_with(fields={'customfield_12100': {'value': 'Open'}})
+
+    def test_github_title_edit_retried(self):
+        m_issue = unittest.mock.Mock(key="TEST-1")
+        with unittest.mock.patch.object(sync_issue, 'get_github_repo') as m_get_repo, \
+                unittest.mock.patch.object(sync_github.time, 'sleep') as m_sleep:
+            api_gh_issue = m_get_repo.return_value.get_issue.return_value
+            api_gh_issue.title = "Some issue"
+            api_gh_issue.edit.side_effect = [github.GithubException(502, {}, {}), None]
+            sync_issue._update_github_with_jira_key({"number": 1}, m_issue)
+            self.assertEqual(2, api_gh_issue.edit.call_count)
+            api_gh_issue.edit.assert_called_with(title="Some issue (TEST-1)")
+            m_sleep.assert_called_once_with(sync_github.SERVER_ERROR_BACKOFF)
+
+            # not added twice
+            api_gh_issue.title = "Some issue (TEST-1)"
+            sync_issue._update_github_with_jira_key({"number": 1}, m_issue)
+            self.assertEqual(2, api_gh_issue.edit.call_count)
+
+    def test_failed_creation_not_repeated(self):
+        gh_issue = {"html_url": "https://github.com/espressif/fake/issues/3", "number": 3}
+        m_jira = create_autospec(jira.JIRA)(None)
+        m_jira.create_issue.side_effect = jira.JIRAError(status_code=502)
+        created = unittest.mock.Mock(key="TEST-3")
+        created.fields = unittest.mock.Mock(summary="GH #3: Test", description="[GitHub issue|%s]" % gh_issue["html_url"])
+        other = unittest.mock.Mock(key="TEST-2")
+        other.fields = unittest.mock.Mock(summary="GH #3: Test", description="[GitHub issue|https://github.com/espressif/other/issues/3]")
+        m_jira.search_issues.return_value = [other, created]
+        with unittest.mock.patch.dict(os.environ, {'JIRA_PROJECT': 'TEST'}), \
+                unittest.mock.patch.object(sync_issue, '_get_create_fields', return_value={"summary": "GH #3: Test"}):
+            # JIRA may have created the issue before the request failed
+            self.assertIs(created, sync_issue._create_issue(m_jira, gh_issue, {}, False))
+            m_jira.create_issue.assert_called_once()
+
+            # not created, so it is created again
+            m_jira.create_issue.side_effect = [jira.JIRAError(status_code=502), "issue"]
+            m_jira.search_issues.return_value = [other]
+            self.assertEqual("issue", sync_issue._create_issue(m_jira, gh_issue, {}, False))
+
+            # JIRA didn't handle the request
+            m_jira.search_issues.reset_mock()
+            m_jira.create_issue.side_effect = jira.JIRAError(status_code=500)
+            with self.assertRaises(jira.JIRAError):
+                sync_issue._create_issue(m_jira, gh_issue, {}, False)
+            m_jira.search_issues.assert_not_called()
+
+    def test_failed_comment_not_repeated(self):
+        m_jira = create_autospec(jira.JIRA)(None)
+        m_jira.add_comment.side_effect = jira.JIRAError(status_code=504)
+        m_jira.comments.return_value = [unittest.mock.Mock(body="Body"), unittest.mock.Mock(body="Other")]
+        self.assertIs(m_jira.comments.return_value[0], sync_issue._add_comment(m_jira, "1", "Body"))
+        m_jira.add_comment.assert_called_once_with("1", "Body")
+
+        m_jira.add_comment.side_effect = [jira.JIRAError(status_code=503), "comment"]
+        m_jira.comments.return_value = []
+        self.assertEqual("comment", sync_issue._add_comment(m_jira, "1", "Body"))
+
     def test_issue_closed(self):
         m_jira = self._test_issue_simple_comment("closed")
 
@@ -206,6 +385,7 @@ class TestIssuesEvents(unittest.TestCase):
         m_issue = create_autospec(jira.Issue)(None, None)
         jira_id = hash(action) % 1001
         m_issue.id = jira_id
+        m_issue.key = "FAKE-%d" % (hash(action) % 333,)
 
         m_jira = run_sync_issue('issues', event, m_issue)
 
@@ -297,5 +477,1371 @@ class TestIssueCommentEvents(unittest.TestCase):
         return m_jira
 
 
+class TestMarkdown2Wiki(unittest.TestCase):
+
+    def test_headings_and_paragraphs(self):
+        result = markdown2wiki.convert("# Title\n\nSome text\nnext line\n\nSetext\n------\n")
+        self.assertEqual("h1. Title\n\nSome text\nnext line\n\nh2. Setext\n\n", result)
+
+    def test_emphasis_and_links(self):
+        result = markdown2wiki.convert("**bold** _em_ ~~del~~ `a_b*c` [text](https://example.com) snake_case_name")
+        self.assertEqual("*bold* _em_ -del- {{a_b*c}} [text|https://example.com] snake_case_name\n\n", result)
+
+    def test_lists(self):
+        result = markdown2wiki.convert("- one\n- two\n  - nested\n\n1. first\n2. second\n")
+        self.assertEqual("*one\n*two\n**nested\n\n#first\n#second\n\n", result)
+
+    def test_code_blocks(self):
+        result = markdown2wiki.convert("```python\nprint('*not emphasis*')\n```\n")
+        self.assertEqual("{code:language=python|borderStyle=solid|theme=RDark|linenumbers=true|collapse=false}\n"
+                         "print('*not emphasis*')\n{code}\n\n", result)
+        long_code = "```\n" + "x\n" * (markdown2wiki.MAX_CODE_LINES + 1) + "```"
+        self.assertIn("language=|", markdown2wiki.convert(long_code))
+        self.assertIn("collapse=true", markdown2wiki.convert(long_code))
+
+    def test_quotes_and_tables(self):
+        result = markdown2wiki.convert("> quoted\n\n| A | B |\n|---|---|\n| 1 | 2 |\n")
+        self.assertEqual("{quote}\nquoted\n{quote}\n\n||A||B||\n|1|2|\n\n", result)
+
+    def test_pathological_input(self):
+        self.assertEqual(2 * (markdown2wiki.MAX_NESTING_DEPTH + 1), markdown2wiki.convert("> " * 1000 + "x").count("{quote}"))
+        self.assertTrue(markdown2wiki.convert("- " * 1000 + "x").startswith("*" * (markdown2wiki.MAX_NESTING_DEPTH + 1) + "- "))
+        self.assertEqual("{{\ufffd0\ufffd}} [\ufffd0\ufffd|x]\n\n", markdown2wiki.convert("`\x000\x00` [\x000\x00](x)"))
+        for markdown in ("[a](" + " " * 60000, "![a](" + " " * 60000, "[a](x (" * 10000, "![" * 30000, "[a" * 30000):
+            start = time.perf_counter()
+            markdown2wiki.convert(markdown)
+            self.assertLess(time.perf_counter() - start, 2, markdown[:10])  # quadratic time would take minutes
+
+    def test_failed_conversion_falls_back_to_markdown(self):
+        with unittest.mock.patch.object(markdown2wiki, 'convert', side_effect=RecursionError), \
+                unittest.mock.patch.object(sync_state, 'get_markdown_cache') as m_get_cache:
+            m_get_cache.return_value.get.return_value = None
+            self.assertEqual("> quoted", sync_issue._markdown2wiki("> quoted"))
+        m_get_cache.return_value.put.assert_not_called()
+
+    def test_long_body_truncated(self):
+        result = sync_issue._markdown2wiki("word " * 5000)
+        self.assertLessEqual(len(result), 16384)
+        self.assertTrue(result.endswith("\n\n[...]"))
+
+
+class TestMarkdownCache(unittest.TestCase):
+
+    def test_cached_conversion(self):
+        with tempfile.TemporaryDirectory() as state_dir:
+            with unittest.mock.patch.dict(os.environ, {'JIRA_SYNC_STATE_DIR': state_dir}):
+                sync_state.reset()
+                try:
+                    with unittest.mock.patch.object(markdown2wiki, 'convert', wraps=markdown2wiki.convert) as m_convert:
+                        first = sync_issue._markdown2wiki("Some *markdown*")
+                        second = sync_issue._markdown2wiki("Some *markdown*")
+                        self.assertEqual(first, second)
+                        self.assertEqual(1, m_convert.call_count)
+                    cache = sync_state.get_markdown_cache()
+                    self.assertEqual((1, 1), (cache.hits, cache.misses))
+                    self.assertEqual(1, len(os.listdir(os.path.join(state_dir, 'markdown'))))
+                finally:
+                    sync_state.reset()
+
+    def test_lru_eviction(self):
+        with tempfile.TemporaryDirectory() as cache_dir:
+            cache = sync_state.MarkdownCache(cache_dir, 100)
+            cache.put('a', 'x' * 40)
+            cache.put('b', 'x' * 40)
+            os.utime(os.path.join(cache_dir, 'a'), (0, 0))
+            cache.put('c', 'x' * 40)  # over the limit, evicts least recently used 'a'
+            self.assertIsNone(cache.get('a'))
+            self.assertIsNotNone(cache.get('b'))
+            self.assertIsNotNone(cache.get('c'))
+
+    def test_overwrite_counted_once(self):
+        with tempfile.TemporaryDirectory() as cache_dir:
+            cache = sync_state.MarkdownCache(cache_dir, 100)
+            cache.put('a', 'x' * 40)
+            cache.put('a', 'x' * 40)
+            self.assertEqual(40, cache._size)
+            cache.put('b', 'x' * 40)  # within the limit, nothing evicted
+            self.assertIsNotNone(cache.get('a'))
+
+    def test_memory_cache(self):
+        cache = sync_state.MarkdownCache(None, 100)
+        cache.put('a', 'x' * 60)
+        cache.put('b', 'x' * 60)
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual('x' * 60, cache.get('b'))
+
+
+class TestJiraKeyIndex(unittest.TestCase):
+
+    GH_ISSUE = {"html_url": "https://github.com/espressif/fake/issues/7",
+                "number": 7,
+                "title": "Indexed issue",
+                "state": "open",
+                }
+
+    def setUp(self):
+        sync_state.reset()
+        self.addCleanup(sync_state.reset)
+        self.m_jira = create_autospec(jira.JIRA)(None)
+        self.m_issue = create_autospec(jira.Issue)(None, None)
+        self.m_issue.key = "TEST-7"
+        self.m_jira.issue.return_value = self.m_issue
+        self.m_jira.search_issues.return_value = [self.m_issue]
+
+    def _remote_links(self, global_id):
+        remote_link = create_autospec(jira.resources.RemoteLink)
+        remote_link.globalId = global_id
+        self.m_jira.remote_links.return_value = [remote_link]
+
+    def test_index_hit_skips_search(self):
+        sync_state.get_store().set_jira_key(self.GH_ISSUE["html_url"], "TEST-7")
+        self._remote_links(self.GH_ISSUE["html_url"])
+
+        self.assertEqual(self.m_issue, sync_issue._find_jira_issue(self.m_jira, self.GH_ISSUE))
+        self.m_jira.issue.assert_called_once_with("TEST-7", properties=sync_issue.FINGERPRINT_PROPERTY)
+        self.m_jira.search_issues.assert_not_called()
+
+    def test_stale_index_falls_back_to_search(self):
+        store = sync_state.get_store()
+        store.set_jira_key(self.GH_ISSUE["html_url"], "OLD-1")
+        self._remote_links("https://github.com/espressif/fake/issues/8")
+
+        self.assertEqual(self.m_issue, sync_issue._find_jira_issue(self.m_jira, self.GH_ISSUE))
+        self.m_jira.search_issues.assert_called_once()
+        self.assertEqual("TEST-7", store.get_jira_key(self.GH_ISSUE["html_url"]))
+
+    def test_rebuild_index(self):
+        store = sync_state.get_store()
+        store.set_jira_key("https://github.com/espressif/fake/issues/1", "OLD-1")
+        self._remote_links(self.GH_ISSUE["html_url"])
+        self.m_issue.fields = unittest.mock.Mock(summary="Summary changed in JIRA")
+        gh_issue = unittest.mock.Mock(html_url=self.GH_ISSUE["html_url"])
+        with unittest.mock.patch.object(sync_issue, 'get_github_repo') as m_get_repo:
+            m_repo = m_get_repo.return_value
+            m_repo.get_issues.return_value = [gh_issue]
+            sync_issue.rebuild_jira_key_index(self.m_jira)
+
+        self.assertIsNone(store.get_jira_key("https://github.com/espressif/fake/issues/1"))
+        self.assertEqual("TEST-7", store.get_jira_key(self.GH_ISSUE["html_url"]))
+
+
+class TestCreationClaim(unittest.TestCase):
+
+    def setUp(self):
+        sync_state.reset()
+        self.addCleanup(sync_state.reset)
+        self.addCleanup(PROJECT_PROPERTIES.clear)
+        os.environ['JIRA_PROJECT'] = 'TEST'
+        self.m_jira = create_autospec(jira.JIRA)(None)
+        self.m_jira.search_issues.return_value = []
+        self.gh_issue = {"html_url": "https://github.com/espressif/fake/issues/9",
+                         "number": 9,
+                         "title": "New issue",
+                         "state": "open",
+                         "comments": 0,
+                         }
+        self.claim = sync_issue._get_claim_property(self.gh_issue["html_url"])
+        self.m_issue = create_autospec(jira.Issue)(None, None)
+        self.m_issue.key = "TEST-9"
+
+    def _find_jira_issue(self, on_wait=None):
+        """
+        Find or create the JIRA issue. Returns the issue, the _create_jira_issue() mock and the times waited for the
+        claim. on_wait(n) is called when waiting for the n-th time.
+        """
+        waits = []
+
+        def sleep(seconds):
+            if seconds:  # not CLAIM_SETTLE_TIME
+                waits.append(seconds)
+                if on_wait is not None:
+                    on_wait(len(waits))
+
+        with unittest.mock.patch.object(sync_issue, '_create_jira_issue') as m_create, \
+                unittest.mock.patch('time.sleep', side_effect=sleep):
+            issue = sync_issue._find_jira_issue(self.m_jira, self.gh_issue, True)
+        return issue, m_create, waits
+
+    def _created_by_other_run(self, n):
+        if n == 2:  # the other run creates the JIRA issue and releases its claim
+            PROJECT_PROPERTIES.pop(self.claim)
+            self.m_jira.search_issues.return_value = [self.m_issue]
+
+    def test_created_without_waiting(self):
+        issue, m_create, waits = self._find_jira_issue()
+        self.assertEqual(m_create.return_value, issue)
+        self.assertEqual([], waits)
+        self.assertEqual({}, PROJECT_PROPERTIES)  # released
+
+    def test_waits_for_claim_of_other_run(self):
+        PROJECT_PROPERTIES[self.claim] = {"owner": "other", "expires": time.time() + 60}
+        issue, m_create, waits = self._find_jira_issue(self._created_by_other_run)
+        self.assertEqual(self.m_issue, issue)
+        m_create.assert_not_called()
+        self.assertEqual([1, 2], waits)
+        # one search before claiming, and one once claimed: waiting only reads the claim
+        self.assertEqual(2, self.m_jira.search_issues.call_count)
+
+    def test_last_claim_set_wins(self):
+        set_property = sync_jira.set_project_property
+
+        def set_at_same_time(jira, project, key, value):
+            set_property(jira, project, key, value)
+            if m_set.call_count == 1:  # another run sets its claim just after ours
+                set_property(jira, project, key, {"owner": "other", "expires": time.time() + 60})
+
+        with unittest.mock.patch.object(sync_jira, 'set_project_property', side_effect=set_at_same_time) as m_set:
+            issue, m_create, waits = self._find_jira_issue(self._created_by_other_run)
+        self.assertEqual(self.m_issue, issue)
+        m_create.assert_not_called()
+
+    def test_expired_claim_taken_over(self):
+        PROJECT_PROPERTIES[self.claim] = {"owner": "crashed", "expires": time.time() - 1}
+        issue, m_create, waits = self._find_jira_issue()
+        self.assertEqual(m_create.return_value, issue)
+        self.assertEqual([], waits)
+        self.assertEqual({}, PROJECT_PROPERTIES)
+
+    def test_without_project_properties(self):
+        with unittest.mock.patch.object(sync_issue, '_shared_claims_failed', False), \
+                unittest.mock.patch.object(sync_jira, 'get_project_property', side_effect=jira.JIRAError(status_code=403)) as m_get:
+            issue, m_create, waits = self._find_jira_issue()
+            self.assertEqual(m_create.return_value, issue)
+            sync_issue._find_jira_issue(self.m_jira, dict(self.gh_issue, html_url=self.gh_issue["html_url"] + "0"), False)
+        m_get.assert_called_once()  # not tried again in the same run
+
+    def test_claim_held_by_other_handler(self):
+        store = sync_state.get_store()
+        self.assertTrue(store.claim_creation(self.gh_issue["html_url"], "other", 60))
+        self.assertFalse(store.claim_creation(self.gh_issue["html_url"], "mine", 60))
+        store.release_creation(self.gh_issue["html_url"], "other")
+        self.assertTrue(store.claim_creation(self.gh_issue["html_url"], "mine", 60))
+        self.assertFalse(store.claim_creation(self.gh_issue["html_url"], "other", 60))
+
+
+class TestManualSync(unittest.TestCase):
+
+    def setUp(self):
+        sync_state.reset()
+        self.addCleanup(sync_state.reset)
+        os.environ['JIRA_PROJECT'] = 'TEST'
+
+    def _gh_issue(self, number):
+        gh_issue = unittest.mock.Mock(number=number)
+        gh_issue._rawData = {"html_url": "https://github.com/espressif/fake/issues/%d" % number,
+                             "number": number,
+                             "title": "Issue %d" % number,
+                             "state": "open",
+                             }
+        return gh_issue
+
+    def test_bulk_mirroring(self):
+        m_jira = create_autospec(jira.JIRA)(None)
+        existing = create_autospec(jira.Issue)(None, None)
+        existing.key = "TEST-2"
+        # issue 2 is already synced, 1 and 3 are not
+        m_jira.search_issues.side_effect = lambda jql, **kwargs: [existing] if jql.endswith('issues/2") order by updated desc') else []
+        event = {"inputs": {"action": "mirror-issues", "issue-numbers": "1, 2,3 x", "concurrency": "2"}}
+
+        with unittest.mock.patch.object(sync_issue, 'get_github_repo') as m_get_repo, \
+                unittest.mock.patch.object(sync_issue, '_create_jira_issue') as m_create:
+            m_repo = m_get_repo.return_value
+            m_repo.get_issues.return_value.get_page.side_effect = [[self._gh_issue(n) for n in (4, 3, 2)], []]
+            m_repo.get_issue.side_effect = lambda number: self._gh_issue(number)
+            m_create.side_effect = lambda jira, gh_issue: unittest.mock.Mock(key="TEST-%d" % gh_issue["number"])
+            results = sync_issue.sync_issues_manually(m_jira, event)
+
+        self.assertEqual({1: ('created', 'TEST-1'), 2: ('already existed', 'TEST-2'), 3: ('created', 'TEST-3')}, results)
+        # issues 2 & 3 came from the listed page, only issue 1 was fetched on its own
+        m_repo.get_issue.assert_called_once_with(number=1)
+
+    def test_issues_read_from_listed_page(self):
+        issues = [self._gh_issue(n)._rawData for n in range(1, 11)]
+        with github_stand_in(issues) as server:
+            result = sync_issue._get_github_issues([3, 5, 7])
+            calls = sync_github.get_limiter().calls
+
+        self.assertEqual({3: "Issue 3", 5: "Issue 5", 7: "Issue 7"}, {n: gh_issue["title"] for n, gh_issue in result.items()})
+        # one request for the page of issues, none for the issues in it, and all through the rate limiter
+        self.assertEqual({'GET /repos/espressif/fake': 1, 'GET /repos/espressif/fake/issues': 1}, dict(server.requests))
+        self.assertEqual(2, calls)
+
+    def test_failures_reported(self):
+        m_jira = create_autospec(jira.JIRA)(None)
+        m_jira.search_issues.side_effect = jira.JIRAError(status_code=500)
+        event = {"inputs": {"action": "mirror-issues", "issue-numbers": "5"}}
+
+        with unittest.mock.patch.object(sync_issue, 'get_github_repo') as m_get_repo:
+            m_repo = m_get_repo.return_value
+            m_repo.get_issues.return_value.get_page.side_effect = [[self._gh_issue(5)], []]
+            with self.assertRaises(RuntimeError):
+                sync_issue.sync_issues_manually(m_jira, event)
+
+
+class TestSyncRemainPRs(unittest.TestCase):
+
+    def setUp(self):
+        sync_state.reset()
+        self.addCleanup(sync_state.reset)
+        os.environ['GITHUB_TOKEN'] = MOCK_GITHUB_TOKEN
+        os.environ['GITHUB_REPOSITORY'] = 'espressif/fake'
+        os.environ['JIRA_PROJECT'] = 'TEST'
+
+    def _pr(self, number, login):
+        pr = unittest.mock.Mock(number=number, html_url="https://github.com/espressif/fake/pull/%d" % number,
+                                title="PR %d" % number, state="open", body="", labels=[])
+        pr.user.login = login
+        return pr
+
+    def _jira_issue(self, key, summary):
+        issue = create_autospec(jira.Issue)(None, None)
+        issue.key = key
+        issue.fields = unittest.mock.Mock(summary=summary)
+        return issue
+
+    def test_batched_lookup(self):
+        m_jira = create_autospec(jira.JIRA)(None)
+        m_jira.search_issues.side_effect = [[self._jira_issue("TEST-1", "PR #1: PR 1"),
+                                             self._jira_issue("TEST-2", "PR #2: PR 2")], []] + [[]] * 58
+        m_jira.remote_links.side_effect = lambda key: [unittest.mock.Mock(
+            globalId="https://github.com/espressif/fake/pull/%s" % key.split("-")[1])]
+        prs = [self._pr(n, "contributor") for n in range(1, 61)] + [self._pr(61, "collaborator")]
+
+        with unittest.mock.patch.object(sync_pr, 'get_github_repo') as m_get_repo, \
+                unittest.mock.patch.object(sync_pr, '_create_jira_issue') as m_create:
+            m_repo = m_get_repo.return_value
+            m_repo.get_collaborators.return_value = [unittest.mock.Mock(login="collaborator")]
+            m_repo.get_pulls.return_value = prs
+            sync_pr.sync_remain_prs(m_jira)
+
+        m_repo.get_collaborators.assert_called_once()
+        m_repo.has_in_collaborators.assert_not_called()
+        # 60 PRs in batches of 50, and one for each of the 58 PRs once its creation is claimed
+        self.assertEqual(2 + 58, m_jira.search_issues.call_count)
+        self.assertEqual(["TEST-1", "TEST-2"], sorted(call[0][0] for call in m_jira.remote_links.call_args_list))
+        created = sorted(call[0][1]["number"] for call in m_create.call_args_list)
+        self.assertEqual(list(range(3, 61)), created)
+        self.assertEqual("TEST-2", sync_state.get_store().get_jira_key(prs[1].html_url))
+        self.assertEqual({"number": 61, "failed": []}, sync_state.get_store().get_cursor('remain_prs'))
+
+    def test_search_results_named_after_same_pr(self):
+        urls = [self._pr(n, "contributor").html_url for n in (1, 2)]
+        mirror = self._jira_issue("TEST-1", "PR #1: PR 1")
+        mentions = self._jira_issue("TEST-9", "PR #1: PR 1 of another repo, mentions PR 2")
+        mirror_2 = self._jira_issue("TEST-2", "PR #2: PR 2")
+        m_jira = create_autospec(jira.JIRA)(None)
+        m_jira.search_issues.return_value = [mirror, mentions, mirror_2]
+        links = {"TEST-1": urls[0], "TEST-9": urls[1], "TEST-2": urls[1]}
+        m_jira.remote_links.side_effect = lambda key: [unittest.mock.Mock(globalId=links[key])]
+
+        result = sync_issue._search_jira_issues_by_url(m_jira, urls)
+        # TEST-9 links to PR 2 and was updated after TEST-2, but TEST-2 is named after it
+        self.assertEqual({urls[0]: "TEST-1", urls[1]: "TEST-2"}, result)
+
+    def test_unlinked_search_result_not_synced(self):
+        pr = self._pr(1, "contributor")
+        m_jira = create_autospec(jira.JIRA)(None)
+        # PR 1 of another repository, which mentions PR 2 of this one
+        m_jira.search_issues.side_effect = [[self._jira_issue("OTHER-5", "PR #1: PR of another repo")], []]
+        m_jira.remote_links.return_value = [unittest.mock.Mock(globalId="https://github.com/espressif/fake/pull/2")]
+
+        with unittest.mock.patch.object(sync_pr, 'get_github_repo') as m_get_repo, \
+                unittest.mock.patch.object(sync_pr, '_create_jira_issue') as m_create:
+            m_repo = m_get_repo.return_value
+            m_repo.get_collaborators.return_value = []
+            m_repo.get_pulls.return_value = [pr]
+            sync_pr.sync_remain_prs(m_jira)
+
+        m_create.assert_called_once()
+        self.assertIsNone(sync_state.get_store().get_jira_key(pr.html_url))
+
+    def test_cursor(self):
+        m_jira = create_autospec(jira.JIRA)(None)
+        m_jira.search_issues.return_value = []
+        prs = [self._pr(n, "contributor") for n in range(61, 0, -1)]
+        store = sync_state.get_store()
+        store.set_cursor('remain_prs', {"number": 58, "failed": [3]})
+
+        with unittest.mock.patch.object(sync_pr, 'get_github_repo') as m_get_repo, \
+                unittest.mock.patch.object(sync_pr, '_create_jira_issue') as m_create:
+            m_repo = m_get_repo.return_value
+            m_repo.get_collaborators.return_value = []
+            m_repo.get_pulls.return_value = prs
+            m_repo.get_pull.side_effect = lambda number: prs[61 - number]
+
+            def create(client, gh_issue):
+                if gh_issue["number"] == 60:
+                    raise jira.JIRAError(status_code=503)
+            m_create.side_effect = create
+            with self.assertRaises(RuntimeError):
+                sync_pr.sync_remain_prs(m_jira)
+
+        # only PRs newer than the cursor, plus the PR which failed last time
+        created = sorted(call[0][1]["number"] for call in m_create.call_args_list)
+        self.assertEqual([3, 59, 60, 61], created)
+        self.assertEqual({"number": 61, "failed": [60]}, store.get_cursor('remain_prs'))
+
+        with unittest.mock.patch.dict(os.environ, {'INPUT_FULL_SWEEP': 'true'}), \
+                unittest.mock.patch.object(sync_pr, 'get_github_repo') as m_get_repo, \
+                unittest.mock.patch.object(sync_pr, '_create_jira_issue') as m_create:
+            m_repo = m_get_repo.return_value
+            m_repo.get_collaborators.return_value = []
+            m_repo.get_pulls.return_value = prs
+            sync_pr.sync_remain_prs(m_jira)
+        self.assertEqual(61, m_create.call_count)
+
+
+class TestReconcile(unittest.TestCase):
+
+    def setUp(self):
+        sync_state.reset()
+        self.addCleanup(sync_state.reset)
+        os.environ['GITHUB_TOKEN'] = MOCK_GITHUB_TOKEN
+        os.environ['GITHUB_REPOSITORY'] = 'espressif/fake'
+        os.environ['JIRA_PROJECT'] = 'TEST'
+        self.issues = []
+        for name in ('GITHUB_PAGE_SIZE', 'BATCH_SIZE'):
+            patcher = unittest.mock.patch.object(sync_reconcile, name, 2)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def _issue(self, number, title, updated, state="open", labels=()):
+        raw_data = {"number": number, "title": title, "state": state, "updated_at": updated, "comments": 0,
+                    "html_url": "https://github.com/espressif/fake/issues/%d" % number,
+                    "labels": [{"name": label} for label in labels], "user": {"login": "contributor"}}
+        self.issues.append(unittest.mock.Mock(_rawData=raw_data))
+
+    def _get_issues(self, since=None, **kwargs):
+        def updated(gh_issue):
+            return gh_issue._rawData["updated_at"]
+        issues = sorted((i for i in self.issues if since is None or updated(i) >= sync_reconcile._format_time(since)),
+                        key=updated)
+        paginated = unittest.mock.Mock()
+        paginated.get_page.side_effect = lambda n: issues[n * 2:n * 2 + 2]
+        return paginated
+
+    def _jira_issue(self, key, summary, labels=(), state="Open"):
+        issue = create_autospec(jira.Issue)(None, None)
+        issue.key = key
+        issue.fields = unittest.mock.Mock(summary=summary, labels=list(labels))
+        issue.raw = {"fields": {"customfield_12100": {"value": state}}, "properties": {}}
+        return issue
+
+    def _reconcile(self, m_jira):
+        with unittest.mock.patch.object(sync_reconcile, 'get_github_repo') as m_get_repo, \
+                unittest.mock.patch.object(sync_reconcile, '_create_jira_issue') as m_create, \
+                unittest.mock.patch.object(sync_reconcile, '_update_link_resolved') as m_link:
+            m_get_repo.return_value.get_issues.side_effect = self._get_issues
+            sync_reconcile.reconcile(m_jira)
+        return m_create, m_link
+
+    def test_fixes_differences(self):
+        self._issue(1, "New title", "2024-01-01T00:00:00Z", labels=["bug"])
+        self._issue(2, "Two", "2024-01-02T00:00:00Z", state="closed", labels=["good first", "Status: Done"])
+        self._issue(3, "Three", "2024-01-03T00:00:00Z")
+        self._issue(4, "Four", "2024-01-04T00:00:00Z", labels=["bug"])
+        jira_issues = [self._jira_issue("TEST-1", "GH #1: Old title", ["bug"]),
+                       self._jira_issue("TEST-2", "GH #2: Two", ["from-jira"]),
+                       self._jira_issue("TEST-4", "GH #4: Four", ["bug"])]
+        m_jira = create_autospec(jira.JIRA)(None)
+        m_jira.search_issues.side_effect = [jira_issues[:2], jira_issues[2:], []]
+        m_jira.remote_links.side_effect = lambda key: [unittest.mock.Mock(
+            globalId="https://github.com/espressif/fake/issues/%s" % key.split("-")[1])]
+        sync_state.get_store().set_cursor('reconcile', {"since": "2024-01-01T00:00:00Z", "failed": []})
+
+        m_create, m_link = self._reconcile(m_jira)
+
+        # one per batch, and one for #3 once its creation is claimed
+        self.assertEqual(3, m_jira.search_issues.call_count)
+        jira_issues[0].update.assert_called_once_with(fields={"summary": "GH #1: New title"})
+        jira_issues[1].update.assert_called_once_with(
+            fields={"labels": ["from-jira", "good-first"], "customfield_12100": {"value": "Closed"}})
+        jira_issues[2].update.assert_not_called()
+        self.assertEqual([3], [call[0][1]["number"] for call in m_create.call_args_list])
+        self.assertEqual(3, m_link.call_count)
+        self.assertEqual("TEST-4", sync_state.get_store().get_jira_key(self.issues[3]._rawData["html_url"]))
+        self.assertEqual({"since": "2024-01-04T00:00:00Z", "failed": []}, sync_state.get_store().get_cursor('reconcile'))
+
+    def test_unlinked_issue_not_updated(self):
+        self._issue(1, "New title", "2024-01-01T00:00:00Z")
+        other_issue = self._jira_issue("OTHER-5", "GH #1: Issue in another repo")
+        m_jira = create_autospec(jira.JIRA)(None)
+        # named after #1, but links to an issue of another repository (and the search for #1 alone finds nothing)
+        m_jira.search_issues.side_effect = [[other_issue], [], []]
+        m_jira.remote_links.return_value = [unittest.mock.Mock(globalId="https://github.com/espressif/other/issues/1")]
+        sync_state.get_store().set_cursor('reconcile', {"since": "2024-01-01T00:00:00Z", "failed": []})
+
+        m_create, _ = self._reconcile(m_jira)
+        other_issue.update.assert_not_called()
+        m_create.assert_called_once()
+        self.assertIsNone(sync_state.get_store().get_jira_key(self.issues[0]._rawData["html_url"]))
+
+    def test_updated_issues_read_from_listed_page(self):
+        for n in range(1, 11):
+            self._issue(n, "Issue %d" % n, "2024-01-01T00:00:%02dZ" % n)
+        since, until = (sync_reconcile._parse_time(t) for t in ("2024-01-01T00:00:03Z", "2024-01-02T00:00:00Z"))
+        with github_stand_in([gh_issue._rawData for gh_issue in self.issues]) as server, \
+                unittest.mock.patch.object(sync_reconcile, 'GITHUB_PAGE_SIZE', sync_issue.GITHUB_PAGE_SIZE):
+            repo = sync_issue.get_github_repo()
+            listed = list(sync_reconcile._list_updated_issues(repo, since, until))
+            calls = sync_github.get_limiter().calls
+
+        self.assertEqual(list(range(3, 11)), [gh_issue["number"] for gh_issue in listed])
+        # one request for the page of issues, none for the issues in it, and all through the rate limiter
+        self.assertEqual({'GET /repos/espressif/fake': 1, 'GET /repos/espressif/fake/issues': 1}, dict(server.requests))
+        self.assertEqual(2, calls)
+
+    def test_resumes_from_checkpoint(self):
+        for number in range(1, 6):
+            self._issue(number, "Issue %d" % number, "2024-01-0%dT00:00:00Z" % number)
+        m_jira = create_autospec(jira.JIRA)(None)
+        m_jira.search_issues.side_effect = lambda jql, **kwargs: [
+            self._jira_issue("TEST-%s" % n, "GH #%s: Issue %s" % (n, n)) for n in re.findall(r'issues/(\d+)"', jql)]
+        m_jira.remote_links.side_effect = lambda key: [unittest.mock.Mock(
+            globalId="https://github.com/espressif/fake/issues/%s" % key.split("-")[1])]
+        store = sync_state.get_store()
+        store.set_cursor('reconcile', {"since": "2024-01-01T00:00:00Z", "failed": []})
+
+        # interrupted while reconciling the second batch
+        searches = m_jira.search_issues.side_effect
+        m_jira.search_issues.side_effect = [searches('"issues/1", "issues/2"'), jira.JIRAError(status_code=503)]
+        with self.assertRaises(jira.JIRAError):
+            self._reconcile(m_jira)
+        self.assertEqual({"since": "2024-01-02T00:00:00Z", "failed": []}, store.get_cursor('reconcile'))
+
+        # the next run starts from the checkpoint, and keeps the issue which failed for the run after
+        m_jira.search_issues.reset_mock()
+        m_jira.search_issues.side_effect = searches
+        with unittest.mock.patch.object(sync_reconcile._Reconciler, '_update', autospec=True) as m_update:
+            m_update.side_effect = lambda self, gh_issue, jira_issue: gh_issue["number"] == 4 and 1 / 0
+            with self.assertRaises(RuntimeError):
+                self._reconcile(m_jira)
+        self.assertEqual([2, 3, 4, 5], [call[0][1]["number"] for call in m_update.call_args_list])
+        self.assertEqual({"since": "2024-01-05T00:00:00Z", "failed": [4]}, store.get_cursor('reconcile'))
+
+
+class TestCommentMap(unittest.TestCase):
+
+    GH_ISSUE = {"html_url": "https://github.com/espressif/fake/issues/9",
+                "number": 9,
+                "title": "Commented issue",
+                "state": "open",
+                }
+    GH_COMMENT = {"html_url": "https://github.com/espressif/fake/issues/9#issuecomment-99",
+                  "id": 99,
+                  "user": {"login": "commentuser"},
+                  "body": "Edited comment",
+                  }
+
+    def setUp(self):
+        sync_state.reset()
+        self.addCleanup(sync_state.reset)
+        os.environ['JIRA_PROJECT'] = 'TEST'
+        self.m_jira = create_autospec(jira.JIRA)(None)
+        self.m_comment = create_autospec(jira.resources.Comment)(None, None)
+        self.m_jira.comment.return_value = self.m_comment
+
+    def _event(self, **extra):
+        event = {"issue": self.GH_ISSUE, "comment": self.GH_COMMENT}
+        event.update(extra)
+        return event
+
+    def test_created_comment_recorded(self):
+        m_issue = create_autospec(jira.Issue)(None, None)
+        m_issue.id = "10009"
+        m_issue.key = "TEST-9"
+        self.m_jira.add_comment.return_value.id = "20001"
+        with unittest.mock.patch.object(sync_issue, '_find_jira_issue', return_value=m_issue):
+            sync_issue.handle_comment_created(self.m_jira, self._event())
+        self.assertEqual(("TEST-9", "20001"), sync_state.get_store().get_comment(99))
+
+    def test_edit_mapped_comment(self):
+        sync_state.get_store().set_comment(99, "TEST-9", "20001")
+        with unittest.mock.patch.object(sync_issue, '_find_jira_issue') as m_find:
+            sync_issue.handle_comment_edited(self.m_jira, self._event(changes={"body": {"from": "Old comment"}}))
+            m_find.assert_not_called()
+        self.m_jira.comment.assert_called_once_with("TEST-9", "20001")
+        self.assertIn("Edited comment", self.m_comment.update.call_args[1]["body"])
+        self.m_jira.comments.assert_not_called()
+
+    def test_delete_mapped_comment(self):
+        store = sync_state.get_store()
+        store.set_comment(99, "TEST-9", "20001")
+        with unittest.mock.patch.object(sync_issue, '_find_jira_issue') as m_find:
+            sync_issue.handle_comment_deleted(self.m_jira, self._event())
+            m_find.assert_not_called()
+        self.assertIn("was deleted", self.m_comment.update.call_args[1]["body"])
+        self.m_jira.add_comment.assert_not_called()
+        self.assertIsNone(store.get_comment(99))
+
+    def test_earlier_comments_backfilled(self):
+        m_issue = create_autospec(jira.Issue)(None, None)
+        m_issue.id = "10009"
+        m_issue.key = "TEST-9"
+        self.m_jira.search_issues.return_value = []
+        self.m_jira.add_comment.side_effect = [unittest.mock.Mock(id="2000%d" % n) for n in range(1, 3)]
+        sync_state.get_store().set_comment(98, "TEST-9", "20000")
+        gh_comments = [unittest.mock.Mock(_rawData=dict(self.GH_COMMENT, id=n, body="Comment %d" % n,
+                                                        html_url="https://github.com/espressif/fake/issues/9#%d" % n))
+                       for n in (97, 98, 99)]
+
+        with unittest.mock.patch.object(sync_issue, '_create_jira_issue', return_value=m_issue), \
+                unittest.mock.patch.object(sync_issue, 'get_github_repo') as m_get_repo:
+            m_get_repo.return_value.get_issue.return_value.get_comments.return_value = gh_comments
+            sync_issue.handle_comment_created(self.m_jira, self._event(issue=dict(self.GH_ISSUE, comments=3)))
+
+        # the comment which was already mirrored is skipped, and the new comment is only added once
+        bodies = [call[0][1] for call in self.m_jira.add_comment.call_args_list]
+        self.assertEqual(2, len(bodies))
+        self.assertIn("Comment 97", bodies[0])
+        self.assertIn("Comment 99", bodies[1])
+        self.assertEqual(("TEST-9", "20002"), sync_state.get_store().get_comment(99))
+
+    def test_backfilled_comments_read_from_listed_page(self):
+        m_issue = create_autospec(jira.Issue)(None, None)
+        m_issue.id = "10009"
+        m_issue.key = "TEST-9"
+        self.m_jira.add_comment.return_value.id = "20001"
+        with github_stand_in([self.GH_ISSUE]) as server:
+            server.comments[9] = [dict(self.GH_COMMENT, id=n, body="Comment %d" % n) for n in range(1, 6)]
+            self.assertEqual(5, sync_issue._backfill_comments(self.m_jira, dict(self.GH_ISSUE, comments=5), m_issue))
+            calls = sync_github.get_limiter().calls
+
+        self.assertIn("Comment 5", self.m_jira.add_comment.call_args[0][1])
+        # one request for the issue and one for the page of comments, none for the comments in it
+        self.assertEqual({'GET /repos/espressif/fake': 1, 'GET /repos/espressif/fake/issues/(?P<number>\\d+)': 1,
+                          'GET /repos/espressif/fake/issues/(?P<number>\\d+)/comments': 1}, dict(server.requests))
+        self.assertEqual(3, calls)
+
+    def test_no_backfill_without_comments(self):
+        with unittest.mock.patch.object(sync_issue, 'get_github_repo') as m_get_repo:
+            self.assertEqual(0, sync_issue._backfill_comments(self.m_jira, dict(self.GH_ISSUE, comments=0), None))
+        m_get_repo.assert_not_called()
+
+    def test_missing_mapped_comment(self):
+        store = sync_state.get_store()
+        store.set_comment(99, "TEST-9", "20001")
+        self.m_jira.comment.side_effect = jira.JIRAError(status_code=404)
+        self.assertIsNone(sync_issue._find_jira_comment(self.m_jira, self.GH_COMMENT))
+        self.assertIsNone(store.get_comment(99))
+
+
+class TestFingerprint(unittest.TestCase):
+
+    GH_ISSUE = {"html_url": "https://github.com/espressif/fake/issues/11",
+                "number": 11,
+                "title": "Fingerprinted issue",
+                "body": "Some text",
+                "user": {"login": "otheruser"},
+                "labels": [],
+                "state": "open",
+                }
+
+    def setUp(self):
+        sync_state.reset()
+        self.addCleanup(sync_state.reset)
+        self.m_jira = create_autospec(jira.JIRA)(None)
+        self.m_issue = create_autospec(jira.Issue)(None, None)
+        self.m_issue.id = "10011"
+        self.m_issue.key = "TEST-11"
+        self.m_issue.raw = {"properties": {}}
+        remote_link = create_autospec(jira.resources.RemoteLink)
+        remote_link.globalId = self.GH_ISSUE["html_url"]
+        remote_link.relationship = "synced from"
+        remote_link.raw = {"object": {"title": "Old title", "status": {}}}
+        self.m_jira.remote_links.return_value = [remote_link]
+        self.remote_link = remote_link
+
+    def _edit(self, gh_issue):
+        with unittest.mock.patch.object(sync_issue, '_find_jira_issue', return_value=self.m_issue):
+            sync_issue.handle_issue_edited(self.m_jira, {"action": "edited", "issue": gh_issue, "sender": {"login": "otheruser"}})
+
+    def test_unchanged_edit_skips_writes(self):
+        self._edit(self.GH_ISSUE)
+        self.m_issue.update.assert_called_once()
+        self.remote_link.update.assert_called_once()
+        self.m_jira.add_comment.assert_called_once()
+        key, name, fingerprint = self.m_jira.add_issue_property.call_args[0]
+        self.assertEqual(("TEST-11", sync_issue.FINGERPRINT_PROPERTY), (key, name))
+        self.assertEqual({"fields", "link"}, set(fingerprint))
+
+        self._edit(self.GH_ISSUE)
+        self.m_issue.update.assert_called_once()
+        self.remote_link.update.assert_called_once()
+        self.m_jira.add_comment.assert_called_once()
+        self.m_jira.add_issue_property.assert_called_once()
+
+    def test_changed_body_skips_link(self):
+        self._edit(self.GH_ISSUE)
+        self._edit(dict(self.GH_ISSUE, body="Changed text"))
+        self.assertEqual(2, self.m_issue.update.call_count)
+        self.remote_link.update.assert_called_once()
+        self.assertEqual(2, self.m_jira.add_comment.call_count)
+
+    def test_fingerprint_read_from_property(self):
+        del self.m_issue.raw["properties"]
+        self.m_jira.issue_property.side_effect = jira.JIRAError(status_code=404)
+        self.assertEqual({}, sync_issue._get_fingerprint(self.m_jira, self.m_issue))
+        self.m_jira.issue_property.side_effect = None
+        self.m_jira.issue_property.return_value.raw = {"value": {"link": "abc"}}
+        self.assertEqual({"link": "abc"}, sync_issue._get_fingerprint(self.m_jira, self.m_issue))
+
+    def test_description_rendered_during_lookup(self):
+        rendering = threading.Event()
+
+        def render(markdown):
+            rendering.set()
+            return markdown
+
+        def find_jira_issue(jira, gh_issue, make_new=False):
+            self.assertTrue(rendering.wait(5))
+            return self.m_issue
+        with unittest.mock.patch.object(sync_issue, '_markdown2wiki', side_effect=render), \
+                unittest.mock.patch.object(sync_issue, '_find_jira_issue', side_effect=find_jira_issue):
+            sync_issue.handle_issue_edited(self.m_jira, {"action": "edited", "issue": self.GH_ISSUE, "sender": {"login": "otheruser"}})
+        self.assertIn("Some text", self.m_issue.update.call_args[1]["fields"]["description"])
+
+
+class TestJiraMetadata(unittest.TestCase):
+
+    def setUp(self):
+        sync_state.reset()
+        self.addCleanup(sync_state.reset)
+        self.m_jira = create_autospec(jira.JIRA)(None)
+        component = create_autospec(jira.resources.Component)
+        component.id = "1"
+        component.name = "Sync"
+        self.m_jira.project_components.return_value = [component]
+
+    def _components(self):
+        fields = {}
+        with unittest.mock.patch.dict(os.environ, {'JIRA_PROJECT': 'TEST', 'JIRA_COMPONENT': 'Sync'}):
+            sync_issue._update_components_field(self.m_jira, fields)
+        return fields
+
+    def test_components_cached(self):
+        self.assertEqual({"components": [{"name": "Sync"}]}, self._components())
+        self.assertEqual({"components": [{"name": "Sync"}]}, self._components())
+        self.m_jira.project_components.assert_called_once_with("TEST")
+        self.m_jira.project.assert_not_called()
+
+    def test_ttl_expiry(self):
+        self._components()
+        with unittest.mock.patch.dict(os.environ, {'JIRA_METADATA_TTL': '0'}):
+            self._components()
+        self.assertEqual(2, self.m_jira.project_components.call_count)
+
+    def test_rejected_component_invalidated(self):
+        self._components()
+        error = jira.JIRAError(status_code=400, text='{"errors":{"components":"Component name \'Sync\' is not valid"}}')
+        self.assertTrue(sync_issue._invalidate_jira_metadata(error, "TEST"))
+        self._components()
+        self.assertEqual(2, self.m_jira.project_components.call_count)
+        # nothing stored for the issue type, so nothing to retry with fresh metadata
+        self.assertFalse(sync_issue._invalidate_jira_metadata(jira.JIRAError(status_code=400, text="issuetype"), "TEST"))
+
+    def test_create_lookups_concurrent(self):
+        # each lookup waits (for a while) for the others to start, and records how many were running at once
+        running = []
+        overlap = []
+        condition = threading.Condition()
+
+        def lookup(result):
+            def wait(*args):
+                with condition:
+                    running.append(args)
+                    condition.notify_all()
+                    condition.wait_for(lambda: len(running) == 3, timeout=5)
+                    overlap.append(len(running))
+                return result
+            return wait
+        # on an executor of its own, so background steps left over by other tests can't hold up the lookups
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=sync_issue.STEP_CONCURRENCY)
+        self.addCleanup(executor.shutdown)
+        patcher = unittest.mock.patch.object(sync_issue, '_step_executor', executor)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.m_jira.issue_types.side_effect = lookup([types.SimpleNamespace(id="3", name="Task")])
+        self.m_jira.project.side_effect = lookup(types.SimpleNamespace(id="10", key="TEST", name="Test"))
+        self.m_jira.project_components.side_effect = lookup([])
+        gh_issue = {"html_url": "https://github.com/espressif/fake/issues/1", "number": 1, "title": "Title",
+                    "body": "Body", "user": {"login": "testuser"}, "labels": []}
+        with unittest.mock.patch.dict(os.environ, {'JIRA_PROJECT': 'TEST', 'JIRA_COMPONENT': 'Sync'}):
+            fields = sync_issue._get_create_fields(self.m_jira, gh_issue)
+        self.assertEqual({"id": "3"}, fields["issuetype"])
+        self.assertEqual({"id": "10"}, fields["project"])
+        self.assertNotIn("components", fields)
+        self.assertEqual([3, 3, 3], overlap)
+
+
+class TestEventBatch(unittest.TestCase):
+
+    GH_ISSUE = {"html_url": "https://github.com/espressif/fake/issues/12", "number": 12}
+
+    def _event(self, action, **fields):
+        event = {"action": action, "issue": self.GH_ISSUE}
+        event.update(fields)
+        return event
+
+    def test_merge_edits_and_labels(self):
+        events = [
+            ("issues", self._event("opened")),
+            ("issues", self._event("edited", issue=dict(self.GH_ISSUE, title="First edit"))),
+            ("issues", self._event("labeled", label={"name": "bug"})),
+            ("issues", self._event("labeled", label={"name": "help wanted"})),
+            ("issues", self._event("edited", issue=dict(self.GH_ISSUE, title="Second edit"))),
+            ("issues", self._event("unlabeled", label={"name": "bug"})),
+        ]
+        merged = sync_batch.merge_events(events)
+        self.assertEqual([events[0], events[3], events[4]], merged)
+
+    def test_merge_comments(self):
+        comment = {"id": 5, "body": "Typo"}
+        events = [
+            ("issue_comment", self._event("created", comment=comment)),
+            ("issue_comment", self._event("edited", comment=dict(comment, body="Fixed"), changes={"body": {"from": "Typo"}})),
+            ("issue_comment", self._event("created", comment={"id": 6, "body": "Oops"})),
+            ("issue_comment", self._event("deleted", comment={"id": 6, "body": "Oops"})),
+        ]
+        merged = sync_batch.merge_events(events)
+        self.assertEqual(1, len(merged))
+        self.assertEqual("created", merged[0][1]["action"])
+        self.assertEqual("Fixed", merged[0][1]["comment"]["body"])
+
+    def test_one_lookup_per_issue(self):
+        other_issue = {"html_url": "https://github.com/espressif/fake/issues/13", "number": 13}
+        events = [
+            {"event_name": "issue_comment", "event": self._event("created", comment={"id": 1})},
+            {"event_name": "issues", "event": {"action": "closed", "issue": other_issue}},
+            {"event_name": "issue_comment", "event": self._event("created", comment={"id": 2})},
+        ]
+        with tempfile.NamedTemporaryFile('w', suffix='.jsonl', delete=False) as f:
+            f.write("\n".join(json.dumps(e) for e in events))
+        self.addCleanup(os.unlink, f.name)
+
+        handled = []
+
+        def handle_event(event_name, event):
+            handled.append(event["action"])
+            sync_issue._find_jira_issue(None, event["issue"])
+
+        with unittest.mock.patch.object(sync_issue, '_lookup_jira_issue') as m_lookup:
+            sync_batch.sync_event_batch(f.name, handle_event)
+        # comments on issue 12 are applied together, and issue 12 is looked up once
+        self.assertEqual(["created", "created", "closed"], handled)
+        self.assertEqual(2, m_lookup.call_count)
+
+
+class TestSpool(unittest.TestCase):
+
+    def setUp(self):
+        state_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(state_dir.cleanup)
+        patcher = unittest.mock.patch.dict(os.environ, {'JIRA_SYNC_STATE_DIR': state_dir.name})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        sync_state.reset()
+        self.addCleanup(sync_state.reset)
+        patcher = unittest.mock.patch.object(sync_spool, '_failed_events', 0)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _event(self, number, action):
+        return {"action": action, "issue": {"html_url": "https://github.com/espressif/fake/issues/%d" % number}}
+
+    def _fail(self, event_name, event):
+        raise jira.JIRAError(status_code=503, text="Service Unavailable")
+
+    def test_failed_event_spooled(self):
+        handled = []
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            sync_spool.handle_or_spool(self._fail, "issues", self._event(1, "opened"))
+            # later events on the same issue wait behind the failed one, other issues are synced
+            sync_spool.handle_or_spool(lambda n, e: handled.append(e), "issues", self._event(1, "edited"))
+            sync_spool.handle_or_spool(lambda n, e: handled.append(e), "issues", self._event(2, "edited"))
+        self.assertEqual([self._event(2, "edited")], handled)
+        self.assertEqual(2, sync_state.get_store().count_spooled_events())
+        self.assertIn("::error::Failed to sync 'issues' event", output.getvalue())
+        self.assertIn("::warning::Earlier events", output.getvalue())
+        # the run fails once all events were handled
+        with self.assertRaisesRegex(RuntimeError, "Failed to sync 1 events"):
+            sync_spool.check_spooled()
+
+        sync_spool.replay_spool(lambda n, e: handled.append(e))
+        self.assertEqual([self._event(2, "edited"), self._event(1, "opened"), self._event(1, "edited")], handled)
+        self.assertEqual(0, sync_state.get_store().count_spooled_events())
+
+    def test_replay_keeps_failed_events(self):
+        store = sync_state.get_store()
+        store.spool_event(self._event(1, "opened")["issue"]["html_url"], "issues", self._event(1, "opened"), "test")
+        store.spool_event(self._event(1, "opened")["issue"]["html_url"], "issues", self._event(1, "edited"), "test")
+        with unittest.mock.patch('time.sleep') as m_sleep:
+            sync_spool.replay_spool(self._fail, batch_size=1)
+        # the second event is blocked behind the first, and replay backs off between failing batches
+        events = store.get_spooled_events(0, 10)
+        self.assertEqual([1, 0], [attempts for _, _, _, _, attempts in events])
+        m_sleep.assert_called_once_with(1)
+
+    def test_event_given_up_after_max_attempts(self):
+        store = sync_state.get_store()
+        url = self._event(1, "opened")["issue"]["html_url"]
+        store.spool_event(url, "issues", self._event(1, "opened"), "test")
+        store.spool_event(url, "issues", self._event(1, "edited"), "test")
+        handled = []
+
+        def handle(event_name, event):
+            if event["action"] == "opened":
+                self._fail(event_name, event)
+            handled.append(event)
+
+        output = io.StringIO()
+        with unittest.mock.patch('time.sleep'), contextlib.redirect_stdout(output):
+            for _ in range(sync_spool.MAX_REPLAY_ATTEMPTS - 1):
+                sync_spool.replay_spool(handle)
+            self.assertEqual([], handled)  # still blocked behind the failing event
+            self.assertIn("::error::Events for 1 issues are still failing", output.getvalue())
+            sync_spool.replay_spool(handle)
+        # the failing event is given up on, and the event behind it is synced
+        self.assertEqual([self._event(1, "edited")], handled)
+        self.assertEqual(0, store.count_spooled_events())
+        self.assertEqual([(url, "issues", sync_spool.MAX_REPLAY_ATTEMPTS)],
+                         [(url, event_name, attempts) for url, event_name, _, attempts in store.get_dead_events()])
+        self.assertIn("::error::Gave up on syncing 1 events", output.getvalue())
+
+        # dead events can be retried
+        sync_spool.replay_spool(lambda n, e: handled.append(e), requeue_dead=True)
+        self.assertEqual(self._event(1, "opened"), handled[-1])
+        self.assertEqual(0, store.count_dead_events())
+
+    def test_not_spooled_without_state_dir(self):
+        with unittest.mock.patch.dict(os.environ, {'JIRA_SYNC_STATE_DIR': ''}):
+            sync_state.reset()
+            with self.assertRaises(jira.JIRAError):
+                sync_spool.handle_or_spool(self._fail, "issues", self._event(1, "opened"))
+
+    def test_creation_resumed(self):
+        gh_issue = {"html_url": "https://github.com/espressif/fake/issues/3", "number": 3, "title": "Test", "state": "open"}
+        m_jira = create_autospec(jira.JIRA)(None)
+        m_jira.create_issue.return_value.key = "TEST-3"
+        m_jira.add_remote_link.side_effect = jira.JIRAError(status_code=503)
+        with unittest.mock.patch.object(sync_issue, '_get_create_fields', return_value={}), \
+                unittest.mock.patch.object(sync_issue, '_update_github_with_jira_key'):
+            with self.assertRaises(jira.JIRAError):
+                sync_issue._create_jira_issue(m_jira, gh_issue)
+            m_jira.add_remote_link.side_effect = None
+            m_jira.issue.return_value.key = "TEST-3"
+            sync_issue._create_jira_issue(m_jira, gh_issue)
+        m_jira.create_issue.assert_called_once()
+        m_jira.issue.assert_called_once_with("TEST-3")
+        self.assertIsNone(sync_state.get_store().get_unlinked_jira_key(gh_issue["html_url"]))
+
+
+class TestDedupe(unittest.TestCase):
+
+    EVENT = {"action": "created",
+             "issue": {"html_url": "https://github.com/espressif/fake/issues/14", "updated_at": "2024-01-01T00:00:00Z"},
+             "comment": {"id": 140, "updated_at": "2024-01-01T00:00:01Z"},
+             }
+
+    def setUp(self):
+        sync_state.reset()
+        self.addCleanup(sync_state.reset)
+
+    def test_duplicate_skipped(self):
+        handled = []
+        self.assertTrue(sync_dedupe.apply_once(lambda n, e: handled.append(e), "issue_comment", self.EVENT))
+        self.assertFalse(sync_dedupe.apply_once(lambda n, e: handled.append(e), "issue_comment", json.loads(json.dumps(self.EVENT))))
+        # an edit of the same comment is a different event
+        edited = dict(self.EVENT, action="edited", comment={"id": 140, "updated_at": "2024-01-01T00:01:00Z"})
+        self.assertTrue(sync_dedupe.apply_once(lambda n, e: handled.append(e), "issue_comment", edited))
+        self.assertEqual([self.EVENT, edited], handled)
+
+    def test_events_in_same_second_synced(self):
+        handled = []
+        issue = {"html_url": "https://github.com/espressif/fake/issues/14", "updated_at": "2024-01-01T00:00:00Z"}
+        for labels in (["bug"], ["bug", "docs"]):
+            event = {"action": "labeled", "label": {"name": labels[-1]},
+                     "issue": dict(issue, labels=[{"name": name} for name in labels])}
+            self.assertTrue(sync_dedupe.apply_once(lambda n, e: handled.append(e), "issues", event))
+        # labeled, unlabeled and labeled again with the same label in the same second
+        for action, labels in (("unlabeled", []), ("labeled", ["docs"])):
+            event = {"action": action, "label": {"name": "docs"},
+                     "issue": dict(issue, labels=[{"name": name} for name in labels])}
+            self.assertTrue(sync_dedupe.apply_once(lambda n, e: handled.append(e), "issues", event))
+        self.assertEqual(4, len(handled))
+
+    def test_failed_event_synced_again(self):
+        def fail(event_name, event):
+            raise jira.JIRAError(status_code=503)
+        with self.assertRaises(jira.JIRAError):
+            sync_dedupe.apply_once(fail, "issue_comment", self.EVENT)
+        self.assertTrue(sync_dedupe.apply_once(lambda n, e: None, "issue_comment", self.EVENT))
+
+    def test_event_key(self):
+        self.assertEqual("delivery:abc", sync_dedupe.get_event_key("issues", self.EVENT, "abc"))
+        self.assertIsNone(sync_dedupe.get_event_key("issues", {"action": "opened"}))
+        self.assertIsNone(sync_dedupe.get_event_key("issues", {"issue": {"html_url": "x"}}))
+
+
+class TestEventLog(unittest.TestCase):
+
+    EVENT = {"action": "labeled",
+             "issue": {"number": 7, "html_url": "https://github.com/espressif/fake/issues/7", "state": "open",
+                       "user": {"login": "reporter"}, "labels": [{"name": "bug"}], "body": "x" * 1000000},
+             "label": {"name": "bug"},
+             "sender": {"login": "labeller"},
+             "repository": {"description": "y" * 100000}}
+
+    def _log(self, event):
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            sync_to_jira.log_event("issues", event)
+        return output.getvalue()
+
+    def test_summary(self):
+        output = self._log(self.EVENT)
+        self.assertLess(len(output), 1000)
+        summary = json.loads(output[len("Event: "):])
+        self.assertEqual({"event": "issues", "action": "labeled", "number": 7, "url": self.EVENT["issue"]["html_url"],
+                          "state": "open", "user": "reporter", "labels": ["bug"], "label": "bug", "sender": "labeller"},
+                         summary)
+
+    def test_summary_capped(self):
+        event = dict(self.EVENT, issue=dict(self.EVENT["issue"], labels=[{"name": "label %d" % n} for n in range(500)]))
+        output = self._log(event)
+        self.assertEqual(sync_to_jira.MAX_EVENT_LOG_LENGTH, len(output.rstrip("\n")) - len("Event: "))
+        self.assertTrue(output.rstrip().endswith("..."))
+
+    def test_full_payload_dumped(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "event.json")
+            with unittest.mock.patch.dict(os.environ, {"JIRA_SYNC_EVENT_DUMP": path}):
+                self._log(self.EVENT)
+            with open(path) as f:
+                self.assertEqual(self.EVENT, json.load(f))
+
+
+class TestLazyJira(unittest.TestCase):
+
+    def test_skipped_event_does_not_connect(self):
+        event = {"action": "pinned", "issue": {"html_url": "https://github.com/espressif/fake/issues/15"}}
+        run_sync_issue('issues', event)
+        sync_to_jira._JIRA.assert_not_called()
+        sync_issue.Github.assert_not_called()
+
+    def test_connects_once(self):
+        connect = unittest.mock.Mock()
+        lazy_jira = sync_to_jira.LazyJIRA(connect)
+        connect.assert_not_called()
+        lazy_jira.connect_async()
+        lazy_jira.issue("TEST-1")
+        lazy_jira.remote_links("TEST-1")
+        connect.assert_called_once_with()
+        connect.return_value.issue.assert_called_once_with("TEST-1")
+
+    def test_connection_error_raised_on_use(self):
+        lazy_jira = sync_to_jira.LazyJIRA(unittest.mock.Mock(side_effect=jira.JIRAError(status_code=401)))
+        lazy_jira.connect_async()
+        with self.assertRaises(jira.JIRAError):
+            lazy_jira.issue("TEST-1")
+
+
+class TestGitHubRateLimiter(unittest.TestCase):
+
+    def setUp(self):
+        self.limiter = sync_github.RateLimiter()
+        self.github = unittest.mock.Mock()
+        self.limiter.attach(self.github)
+        patcher = unittest.mock.patch('sync_github.time')
+        self.m_time = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.m_time.time.return_value = 1000
+
+    def _set_budget(self, remaining, limit=5000, reset=1600):
+        self.github._Github__requester.rate_limiting = (remaining, limit)
+        self.github._Github__requester.rate_limiting_resettime = reset
+
+    def test_no_pacing_without_headers(self):
+        client = REAL_GITHUB_CLASS(MOCK_GITHUB_TOKEN)
+        self.limiter.attach(client)
+        self.limiter.calls = 1
+        with unittest.mock.patch.object(client, 'get_rate_limit') as m_get_rate_limit, \
+                unittest.mock.patch('github.Requester.Requester.requestJsonAndCheck') as m_request:
+            self.assertEqual(0, self.limiter._get_pacing_delay())
+        m_get_rate_limit.assert_not_called()
+        m_request.assert_not_called()
+
+    def test_no_pacing_with_budget_left(self):
+        self._set_budget(4000)
+        fn = unittest.mock.Mock(return_value="result")
+        self.assertEqual(self.limiter.call(fn, 1, state="all"), "result")
+        self.assertEqual(self.limiter.call(fn, 2), "result")
+        fn.assert_called_with(2)
+        self.m_time.sleep.assert_not_called()
+        self.assertEqual(self.limiter.calls, 2)
+
+    def test_paced_when_budget_low(self):
+        self.limiter.calls = 1  # budget is only known after a request
+        self._set_budget(100)  # 100 requests left for 600 seconds
+        self.limiter.call(unittest.mock.Mock())
+        self.m_time.sleep.assert_called_once_with(6)
+        self.assertEqual(self.limiter.waited, 6)
+
+    def test_waits_for_reset_when_budget_used_up(self):
+        self.limiter.calls = 1
+        self._set_budget(0, reset=1100)
+        self.limiter.call(unittest.mock.Mock())
+        self.m_time.sleep.assert_called_once_with(101)
+
+    def test_retry_after(self):
+        self._set_budget(4000)
+        error = github.GithubException(403, {"message": "secondary rate limit"}, {"Retry-After": "30"})
+        fn = unittest.mock.Mock(side_effect=[error, "result"])
+        self.assertEqual(self.limiter.call(fn), "result")
+        self.m_time.sleep.assert_called_once_with(30)
+        self.assertEqual(self.limiter.retries, 1)
+
+    def test_rate_limit_exceeded_waits_for_reset(self):
+        self._set_budget(4000)
+        error = github.RateLimitExceededException(403, {}, {"x-ratelimit-remaining": "0", "x-ratelimit-reset": "1200"})
+        fn = unittest.mock.Mock(side_effect=[error, "result"])
+        self.assertEqual(self.limiter.call(fn), "result")
+        self.m_time.sleep.assert_called_once_with(201)
+
+    def test_gives_up_after_retries(self):
+        self._set_budget(4000)
+        error = github.GithubException(429, {}, {"Retry-After": "1"})
+        fn = unittest.mock.Mock(side_effect=error)
+        with self.assertRaises(github.GithubException):
+            self.limiter.call(fn)
+        self.assertEqual(fn.call_count, sync_github.MAX_RATE_LIMIT_RETRIES + 1)
+
+    def test_secondary_rate_limit_waits_a_minute(self):
+        self._set_budget(4000)
+        error = github.RateLimitExceededException(403, {"message": "You have exceeded a secondary rate limit"},
+                                                  {"x-ratelimit-remaining": "4000", "x-ratelimit-reset": "1600"})
+        fn = unittest.mock.Mock(side_effect=[error, "result"])
+        self.assertEqual(self.limiter.call(fn), "result")
+        self.m_time.sleep.assert_called_once_with(60)
+
+    def test_server_errors_retried_with_backoff(self):
+        error = github.GithubException(502, {}, {})
+        fn = unittest.mock.Mock(side_effect=error)
+        with self.assertRaises(github.GithubException):
+            self.limiter.call(fn)
+        self.assertEqual(fn.call_count, sync_github.MAX_SERVER_ERROR_RETRIES + 1)
+        self.assertEqual([unittest.mock.call(2), unittest.mock.call(4), unittest.mock.call(8)],
+                         self.m_time.sleep.call_args_list)
+
+    def test_other_errors_not_retried(self):
+        fn = unittest.mock.Mock(side_effect=github.GithubException(404, {}, {}))
+        with self.assertRaises(github.GithubException):
+            self.limiter.call(fn)
+        fn.assert_called_once_with()
+        self.m_time.sleep.assert_not_called()
+
+
+class TestJiraSession(unittest.TestCase):
+
+    def test_aimd_limit(self):
+        limiter = sync_jira.AIMDLimiter(4, 1, 16)
+        for _ in range(4):
+            limiter.acquire()
+            limiter.release(False)
+        self.assertAlmostEqual(5, limiter.limit, delta=0.1)  # about one more after a round of successful requests
+        limit = limiter.limit
+        limiter.acquire()
+        limiter.release(True)
+        self.assertEqual(limit / 2, limiter.limit)
+        limiter.acquire()
+        limiter.release(True)
+        self.assertEqual(limit / 2, limiter.limit)  # halved at most once per BACKOFF_INTERVAL
+        limiter.acquire()
+        limiter.release(None)
+        self.assertEqual(limit / 2, limiter.limit)
+        self.assertEqual((7, 1, 0), (limiter.requests, limiter.backoffs, limiter.in_flight))
+
+    def test_aimd_limits_requests_in_flight(self):
+        limiter = sync_jira.AIMDLimiter(2, 1, 16)
+        limiter.acquire()
+        limiter.acquire()
+        acquired = threading.Event()
+        threading.Thread(target=lambda: (limiter.acquire(), acquired.set()), daemon=True).start()
+        self.assertFalse(acquired.wait(0.1))
+        limiter.release(False)
+        self.assertTrue(acquired.wait(5))
+
+    def test_retries_overloaded_requests(self):
+        statuses = [429, 503, 200]
+
+        class Handler(sync_server.http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                self.send_response(statuses.pop(0))
+                self.send_header('Retry-After', '0')
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+
+            do_POST = do_GET
+
+            def log_message(self, *args):
+                pass
+
+        server = sync_server.http.server.HTTPServer(('127.0.0.1', 0), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+
+        session = jira.resilientsession.ResilientSession()
+        with unittest.mock.patch.object(sync_jira, '_limiter', None):
+            sync_jira.configure_session(session)
+            response = session.get('http://127.0.0.1:%d/rest/api/2/issue/TEST-1' % server.server_address[1])
+            limiter = sync_jira.get_limiter()
+            self.assertEqual(200, response.status_code)
+            self.assertEqual([], statuses)
+            self.assertEqual((1, 1), (limiter.requests, limiter.backoffs))
+            self.assertEqual(sync_jira.INITIAL_CONCURRENCY / 2, limiter.limit)
+
+            # JIRA may have handled a POST answered with 503, so it's only retried after 429
+            statuses.extend([429, 503, 200])
+            with self.assertRaises(jira.JIRAError) as error:
+                session.post('http://127.0.0.1:%d/rest/api/2/issue' % server.server_address[1], data='{}')
+            self.assertEqual(503, error.exception.status_code)
+            self.assertEqual([200], statuses)
+
+
+class TestTrace(unittest.TestCase):
+
+    def setUp(self):
+        self.trace_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.trace_dir.cleanup)
+        self.addCleanup(sync_trace.reset)
+        sync_trace.reset()
+
+    def _enable(self, **env):
+        patcher = unittest.mock.patch.dict(os.environ, dict(env, JIRA_SYNC_TRACE_DIR=self.trace_dir.name))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        sync_trace.reset()
+
+    def test_disabled(self):
+        with unittest.mock.patch.dict(os.environ):
+            os.environ.pop('JIRA_SYNC_TRACE_DIR', None)
+            sync_trace.reset()
+            with sync_trace.span('jira', 'GET issue/{key}'):
+                pass
+            sync_trace.write_report()
+        self.assertEqual([], sync_trace.get_summary()['spans'])
+        self.assertEqual([], os.listdir(self.trace_dir.name))
+
+    def test_spans_labelled_with_handler(self):
+        self._enable(JIRA_SYNC_TRACE_CHROME='1')
+        with sync_trace.handler('issues.opened'):
+            with sync_trace.span('jira', 'POST issue'):
+                pass
+
+            def edit():
+                with sync_trace.span('github', 'edit'):
+                    pass
+            thread = threading.Thread(target=sync_trace.propagate(edit))
+            thread.start()
+            thread.join()
+        with sync_trace.span('sleep', 'creation claim'):
+            pass
+        sync_trace.write_report()
+
+        with open(os.path.join(self.trace_dir.name, 'sync-trace-summary.json')) as f:
+            summary = json.load(f)
+        self.assertEqual({('handler', 'issues.opened'), ('jira', 'POST issue'), ('github', 'edit'), ('sleep', 'creation claim')},
+                         {(entry['category'], entry['name']) for entry in summary['spans']})
+        self.assertEqual({'jira': 1, 'github': 1}, {category: totals['count'] for category, totals in summary['handlers']['issues.opened'].items()})
+        self.assertEqual(1, summary['handlers']['(none)']['sleep']['count'])
+        with open(os.path.join(self.trace_dir.name, 'sync-trace.json')) as f:
+            events = json.load(f)['traceEvents']
+        self.assertEqual(4, len(events))
+        self.assertEqual({'issues.opened'}, {e['args']['handler'] for e in events if e['cat'] in ('jira', 'github')})
+
+    def test_handler_spans_of_sync(self):
+        self._enable()
+        event = {"action": "opened", "issue": {"html_url": "https://github.com/espressif/fake/issues/16",
+                                               "number": 16, "title": "Traced issue", "body": "", "labels": [{"name": "bug"}],
+                                               "user": {"login": "testuser"}, "state": "open"}}
+        run_sync_issue('issues', event)
+        summary = sync_trace.get_summary()
+        self.assertEqual([('handler', 'issues.opened', 1)],
+                         [(e['category'], e['name'], e['count']) for e in summary['spans'] if e['category'] == 'handler'])
+        self.assertGreater(summary['handlers']['issues.opened']['github']['count'], 0)  # title edit
+
+    def test_jira_span_names(self):
+        names = [sync_jira._get_span_name(unittest.mock.Mock(method=method, url=url)) for method, url in [
+            ('GET', 'https://jira.example.com/rest/api/2/issue/IDF-123/remotelink'),
+            ('PUT', 'https://jira.example.com/jira/rest/api/2/issue/IDF-123/comment/10001'),
+            ('GET', 'https://jira.example.com/rest/api/2/search?jql=x'),
+            ('PUT', 'https://jira.example.com/rest/api/2/project/IDF/properties/' + sync_issue._get_claim_property('x')),
+        ]]
+        self.assertEqual(['GET issue/{key}/remotelink', 'PUT issue/{key}/comment/{id}', 'GET search',
+                          'PUT project/IDF/properties/github-sync-claim-{hash}'], names)
+
+
+class TestHandlerBenchmark(unittest.TestCase):
+
+    def test_request_counts_within_baseline(self):
+        # replays the recorded events against the JIRA and GitHub stand-ins (see benchmark_handlers.py)
+        with unittest.mock.patch.object(sync_to_jira, '_JIRA', REAL_JIRA_CLASS), \
+                unittest.mock.patch.object(sync_issue, 'Github', REAL_GITHUB_CLASS), \
+                unittest.mock.patch.multiple(sync_jira, **REAL_PROJECT_PROPERTY_FUNCTIONS):
+            results, requests = benchmark_handlers.run_benchmark(benchmark_handlers.read_events(benchmark_handlers.DEFAULT_EVENTS), 0, 0)
+        with open(benchmark_handlers.DEFAULT_BASELINE) as f:
+            baseline = json.load(f)
+        self.assertEqual([], benchmark_handlers.find_regressions(results, baseline))
+        self.assertEqual(set(baseline), set(results))
+        self.assertEqual([], [route for api in requests.values() for route in api if '(unknown)' in route])
+
+
+class TestWebhookServer(unittest.TestCase):
+
+    SECRET = b"webhooksecret"
+
+    def setUp(self):
+        self.handled = []
+        self.server = sync_server.WebhookServer(('127.0.0.1', 0), self.SECRET, 'espressif/fake',
+                                                lambda event_name, event, delivery: self.handled.append((event_name, event)))
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+
+    def _post(self, event_name, event, secret=SECRET):
+        body = json.dumps(event).encode()
+        signature = "sha256=" + sync_server.hmac.new(secret, body, sync_server.hashlib.sha256).hexdigest()
+        request = urllib.request.Request("http://127.0.0.1:%d/" % self.server.server_address[1], data=body, headers={
+            "X-GitHub-Event": event_name,
+            "X-GitHub-Delivery": "delivery-1",
+            "X-Hub-Signature-256": signature,
+        })
+        try:
+            with urllib.request.urlopen(request) as response:
+                return response.status
+        except urllib.error.HTTPError as e:
+            return e.code
+
+    def test_event_handled(self):
+        event = {"action": "opened", "issue": {"number": 1}, "repository": {"full_name": "espressif/fake"}}
+        self.assertEqual(202, self._post("issues", event))
+        self.server.events.join()
+        self.assertEqual([("issues", event)], self.handled)
+
+    def test_bad_signature_rejected(self):
+        event = {"action": "opened", "repository": {"full_name": "espressif/fake"}}
+        self.assertEqual(401, self._post("issues", event, secret=b"wrong"))
+        self.assertEqual(202, self._post("issues", dict(event, repository={"full_name": "espressif/other"})))
+        self.server.events.join()
+        self.assertEqual([], self.handled)
+
+    def test_verify_signature(self):
+        self.assertFalse(sync_server.verify_signature(self.SECRET, b"{}", None))
+        self.assertFalse(sync_server.verify_signature(self.SECRET, b"{}", "sha1=abc"))
+
+
 if __name__ == '__main__':
     unittest.main()